@@ -4,6 +4,7 @@ from app.agents.write_dockerfile_agent import WriteDockerfileAgent
 from app.agents.test_analysis_agent import TestAnalysisAgent
 from app.agents.write_eval_script_agent import WriteEvalScriptAgent
 from app.agents.context_retrieval_agent import ContextRetrievalAgent
+from app.agents.memory_pool import MemoryPoolStore, normalize_version
 import os
 import re
 import docker
@@ -19,10 +20,6 @@ from copy import deepcopy
 
 DIFF_MODIFIED_FILE_REGEX = r"--- a/(.*)"
 DIFF_DEVNULL_REGEX = r"--- /dev/null\n\+\+\+ b/(.*)"
-def normalize_version(ver_str):
-    match = re.search(r"(\d+(?:\.\d+){0,2})", ver_str)
-    return match.group(1) if match else ver_str
-
 def get_closest_version_info(records, repo, target_version):
     same_repo = [r for r in records if r.get('repo') == repo]
     if not same_repo:
@@ -56,6 +53,8 @@ class AgentsManager:
                 disable_run_test:bool,
                 disable_download_test_resources:bool,
                 using_ubuntu_only:bool,
+                enable_layer_cache:bool = False,
+                memory_pool_backend:str = "json",
                 ):
         self.task = task
         self.output_dir = os.path.abspath(output_dir)
@@ -67,6 +66,9 @@ class AgentsManager:
         self.test_files = self.get_test_files()
         self.repo_basic_info = self.get_repository_basic_info()
         self.workflow_finish_status  = False
+        # whether a reference setup from the memory pool was used, reported in status.json
+        self.memory_pool_hit = False
+        self.num_iterations = 0
         # Initialize agents
         self.agents_dict = {
             "write_docker_agent": WriteDockerfileAgent(task, output_dir, self.repo_basic_info,using_ubuntu_only),
@@ -83,13 +85,19 @@ class AgentsManager:
             self.set_agent_status("context_retrieval_agent",True)
         self.agents_dict['test_analysis_agent'].disable_context_retrieval= disable_context_retrieval
         self.agents_dict['test_analysis_agent'].disable_run_test = disable_run_test
+        self.agents_dict['test_analysis_agent'].enable_layer_cache = enable_layer_cache
         self.results_file = f'{results_path}/results.json'
-        lock_path = self.results_file + '.lock'
-        self.lock = FileLock(lock_path, timeout=30)
-        with self.lock:
-            if not os.path.exists(self.results_file):
-                with open(self.results_file, 'w') as f:
-                    json.dump([], f, indent=2)
+        self.memory_pool = None
+        if memory_pool_backend == "sqlite":
+            # records of an existing results.json are imported once into the database
+            self.memory_pool = MemoryPoolStore(f'{results_path}/results.db', import_from=self.results_file)
+        else:
+            lock_path = self.results_file + '.lock'
+            self.lock = FileLock(lock_path, timeout=30)
+            with self.lock:
+                if not os.path.exists(self.results_file):
+                    with open(self.results_file, 'w') as f:
+                        json.dump([], f, indent=2)
 
     def set_agent_status(self, agent_name: str, status: bool):
         """Set the status of an agent to control if it's active or inactive."""
@@ -161,6 +169,12 @@ class AgentsManager:
         with open(pjoin(task_output_dir, "cost.json"), "w") as f:
             json.dump(stats, f, indent=4)
 
+    def cleanup(self) -> None:
+        """Release per-task resources kept alive across iterations (e.g. cached docker layers)."""
+        self.agents_dict['test_analysis_agent'].cleanup_layer_cache()
+        if self.memory_pool is not None:
+            self.memory_pool.close()
+
     def _read_results(self) -> list:
         with self.lock:
             with open(self.results_file, "r") as f:
@@ -174,12 +188,15 @@ class AgentsManager:
             os.replace(tmp, self.results_file)
 
     def get_latest_reference_setup_for_repo(self):
+        if self.memory_pool is not None:
+            return self.memory_pool.get_closest_version_info(self.task.repo_name, self.task.version)
         records = self._read_results()
         return get_closest_version_info(records, self.task.repo_name, self.task.version)
 
     def run_workflow(self) -> None:
         for iteration_num in range(self.max_iteration_num):
             self.set_agents_iteration_num(iteration_num)
+            self.num_iterations = iteration_num + 1
             
             if self.disable_context_retrieval and iteration_num==0:
               readme_content = self.agents_dict['context_retrieval_agent'].browse_readme()
@@ -199,6 +216,7 @@ class AgentsManager:
             if self.disable_memory_pool == False:        
                 reference_setup = self.get_latest_reference_setup_for_repo()
                 if reference_setup:
+                    self.memory_pool_hit = True
                     self.agents_dict['write_docker_agent'].reference_setup = reference_setup
                     
                     self.agents_dict['write_eval_script_agent'].reference_setup = reference_setup
@@ -298,10 +316,13 @@ class AgentsManager:
 
 
         with open(os.path.join(self.output_dir, "status.json"), "w") as status_file_f:
-                json.dump({"is_finish": self.workflow_finish_status}, status_file_f)
+                json.dump({
+                    "is_finish": self.workflow_finish_status,
+                    "memory_pool_hit": self.memory_pool_hit,
+                    "num_iterations": self.num_iterations,
+                }, status_file_f)
 
         if self.workflow_finish_status:
-            recs = self._read_results()
             info = deepcopy(self.task.task_info)
 
             # merge in your new fields
@@ -312,6 +333,10 @@ class AgentsManager:
                 # keep any other existing keys from task_info
             })
 
-            recs.append(info)
-            self._write_results(recs)
+            if self.memory_pool is not None:
+                self.memory_pool.add(info)
+            else:
+                recs = self._read_results()
+                recs.append(info)
+                self._write_results(recs)
         
\ No newline at end of file
@@ -1,5 +1,7 @@
 from app.data_structures import MessageThread,FunctionCallIntent
 from app.agents.context_retrieval_agent import context_retrieval_utils
+from app.agents.context_retrieval_agent.summary_cache import SummaryCache
+from app import globals
 import inspect
 import json
 from app.agents.agent import Agent
@@ -26,7 +28,12 @@ class ContextRetrievalAgent(Agent):
         self.task = task
         self.output_dir = os.path.abspath(output_dir)
         self.run_count = 0
-        self.repo_browse_manager = context_retrieval_utils.RepoBrowseManager(self.task.project_path)
+        summary_cache = None
+        if globals.summary_cache_dir:
+            summary_cache = SummaryCache(globals.summary_cache_dir, max_bytes=globals.summary_cache_max_mb * 1024 * 1024)
+        self.repo_browse_manager = context_retrieval_utils.RepoBrowseManager(
+            self.task.project_path, summary_cache, index_cache_dir=globals.repo_index_cache_dir
+        )
         self.root_structure = self.browse_folder('/',1)[0]
         self.root_structure_info = f' Root directory structure of target repository: {self.root_structure}\n\n'
         self.repo_basic_info = repo_basic_info
@@ -1,5 +1,5 @@
 import os
-from typing import Dict, List, Any
+from typing import Dict, Any
 from loguru import logger
 import inspect
 import re
@@ -10,28 +10,20 @@ from app.utils import parse_function_invocation
 import json
 from app.post_process import ExtractStatus, is_valid_json
 import itertools
+from app.agents.context_retrieval_agent.repo_index import RepoIndex
+from app.agents.context_retrieval_agent.summary_cache import SummaryCache, git_blob_hash, prompt_version
 class RepoBrowseManager:
-    def __init__(self, project_path: str):
+    def __init__(self, project_path: str, summary_cache: SummaryCache | None = None, index_cache_dir: str | None = None):
         self.project_path = os.path.abspath(project_path)  # Ensure absolute path
-        self.index: Dict = {}
+        self.index_cache_dir = index_cache_dir
+        self.repo_index: RepoIndex | None = None
+        # optional cross-task cache of browse_file_for_environment_info summaries
+        self.summary_cache = summary_cache
         self._build_index()
 
     def _build_index(self):
-        """Build the index by parsing the repository structure."""
-        self._update_index(self.project_path)
-
-    def _update_index(self, current_path: str):
-        """Recursively update the index with files and directories."""
-        for root, dirs, files in os.walk(current_path):
-            relative_root = os.path.relpath(root, self.project_path)
-            current_level = self.index
-            if relative_root != ".":  # Handle nested directories
-                for part in relative_root.split(os.sep):
-                    if part not in current_level:
-                        current_level[part] = {}
-                    current_level = current_level[part]
-            for file in files:
-                current_level[file] = None  # Mark files as leaf nodes
+        """Build the index from the files tracked in the repository (or load it for this commit)."""
+        self.repo_index = RepoIndex.from_repo(self.project_path, self.index_cache_dir)
 
     def browse_folder(self, path: str, depth: int) -> tuple[str, str, bool]:
         """Browse a folder in the repository from the given path and depth.
@@ -63,15 +55,13 @@ class RepoBrowseManager:
         
         relative_path = os.path.relpath(abs_path, self.project_path)
         if relative_path == ".":
-            current_level = self.index
+            relative_path = ""
         else:
-            current_level = self.index
-            for part in relative_path.split(os.sep):
-                if part not in current_level:
-                    return "Path not found", "Path not found", False  # Path not found
-                current_level = current_level[part]
+            relative_path = relative_path.replace(os.sep, "/")
+            if not self.repo_index.has_dir(relative_path):
+                return "Path not found", "Path not found", False  # Path not found
         
-        structure_result = self._get_structure(current_level, depth)
+        structure_result = self.repo_index.tree(relative_path, int(depth))
         structure = self._format_structure(structure_result)
         result = f"You are browsing the path: {abs_path}. The browsing Depth is {depth}.\nStructure of this directory:\n\n{self._format_structure(structure_result)}"
 
@@ -87,8 +77,7 @@ class RepoBrowseManager:
         Returns:
             tuple: (formatted result string, summary message, success flag)
         """
-        matching_files = []
-        self._search_index(self.index, keyword, "", matching_files)
+        matching_files = self.repo_index.search_file_names(keyword)
         
         if not matching_files:
             return f"No files found containing the keyword '{keyword}'.", "No matching files found", True
@@ -104,28 +93,6 @@ class RepoBrowseManager:
         result += formatted_files
         return result, "File search completed successfully", True
 
-    def _search_index(self, current_level: Dict, keyword: str, current_path: str, matching_files: List[str]):
-        """Recursively search the index for files containing the keyword in their names."""
-        for key, value in current_level.items():
-            new_path = os.path.join(current_path, key)
-            if value is None:  # It's a file
-                if keyword.lower() in key.lower():
-                    matching_files.append(new_path)
-            else:  # It's a directory
-                self._search_index(value, keyword, new_path, matching_files)
-
-    def _get_structure(self, structure: Dict, depth: int) -> Dict:
-        """Get the structure of the repository from the given path and depth."""
-        if depth == 0:
-            return {}
-        result = {}
-        for key, value in structure.items():
-            if value is None:  # It's a file
-                result[key] = None
-            else:  # It's a directory
-                result[key] = self._get_structure(value, depth - 1)
-        return result
-
     def _format_structure(self, structure: Dict, indent: int = 0) -> str:
         """Format the structure into a string with proper indentation."""
         result = ""
@@ -231,7 +198,10 @@ class RepoBrowseManager:
             file_content = f"[File Content: {file_path}]\n{file_content}\n[/File Content]"
 
             # Step 2: Use LLM to extract environment information
-            extracted_info = browse_file_run_with_retries(file_content, custom_query)
+            if self.summary_cache is None:
+                extracted_info = browse_file_run_with_retries(file_content, custom_query)
+            else:
+                extracted_info = self._browse_file_run_cached(file_path, file_content, custom_query)
 
             # Step 3: Return extracted information
             return extracted_info,'Get File Info', True
@@ -253,6 +223,36 @@ class RepoBrowseManager:
             # raise RuntimeError(f"Failed to browse file: {str(e)}") from e
 
 
+    def _browse_file_run_cached(self, file_path: str, file_content: str, custom_query: str) -> str:
+        """browse_file_run_with_retries, served from the summary cache when the same blob was summarized before."""
+        with open(os.path.abspath(file_path), 'rb') as f:
+            blob_hash = git_blob_hash(f.read())
+        key = SummaryCache.make_key(
+            blob_hash, custom_query, common.SELECTED_MODEL.name, BROWSE_CONTENT_PROMPT_VERSION
+        )
+        cached = self.summary_cache.get(key)
+        if cached is not None:
+            extracted_info, input_tokens, output_tokens, cost = cached
+            common.record_cache_hit(input_tokens, output_tokens, cost)
+            logger.info(f"Summary cache hit for {file_path} (blob {blob_hash})")
+            return extracted_info
+
+        before = (
+            common.thread_cost.process_input_tokens,
+            common.thread_cost.process_output_tokens,
+            common.thread_cost.process_cost,
+        )
+        extracted_info = browse_file_run_with_retries(file_content, custom_query)
+        if extracted_info != BROWSE_FILE_FAILURE:
+            self.summary_cache.put(
+                key,
+                extracted_info,
+                common.thread_cost.process_input_tokens - before[0],
+                common.thread_cost.process_output_tokens - before[1],
+                common.thread_cost.process_cost - before[2],
+            )
+        return extracted_info
+
     def browse_webpage_for_environment_info(self, url: str) -> str:
         """Fetch a web page and extract environment setup information.
         
@@ -488,6 +488,11 @@ Example format:
 """
 
 
+BROWSE_CONTENT_PROMPT_VERSION = prompt_version(BROWSE_CONTENT_PROMPT)
+
+BROWSE_FILE_FAILURE = 'Do not get the content of the file.'
+
+
 def browse_file_run_with_retries(content: str, custom_query: str, retries: int=3) -> str | None:
     """Run file content analysis with retries and return the parsed <analysis> content."""
     parsed_result=None
@@ -511,7 +516,7 @@ def browse_file_run_with_retries(content: str, custom_query: str, retries: int=3
     if parsed_result:
         return parsed_result
     else:
-        return 'Do not get the content of the file.'
+        return BROWSE_FILE_FAILURE
 
 
 def browse_file_run(content: str, custom_query: str) -> tuple[str, MessageThread]:
@@ -0,0 +1,191 @@
+"""
+File index of a repository checkout used by RepoBrowseManager.
+
+The index is a sorted table of relative file paths, taken from `git ls-files`
+(so ignored files are skipped) with an `os.walk` fallback for non-git folders.
+Because the table is sorted, the files below a directory form one contiguous
+slice, so a folder is browsed by bisecting instead of walking a tree of the
+whole repository. Filename substring search goes through a trigram index of the
+lowercased file names. An index can be saved per commit and loaded by later
+tasks at the same commit.
+"""
+
+import os
+import pickle
+import subprocess
+from array import array
+from bisect import bisect_left
+from typing import Dict, List
+
+from loguru import logger
+
+# directories skipped when the checkout is not a git repository
+IGNORED_DIRS = {
+    ".git",
+    ".hg",
+    ".svn",
+    "node_modules",
+    "__pycache__",
+    ".tox",
+    ".nox",
+    ".venv",
+    "venv",
+    ".mypy_cache",
+    ".pytest_cache",
+    "build",
+    "dist",
+}
+
+INDEX_FORMAT_VERSION = 1
+
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+class RepoIndex:
+    def __init__(self, paths: List[str]):
+        self.paths: List[str] = sorted(set(paths))
+        self.basenames: List[str] = [p.rsplit("/", 1)[-1].lower() for p in self.paths]
+        self.trigram_index: Dict[str, array] = {}
+        for path_id, name in enumerate(self.basenames):
+            for gram in _trigrams(name):
+                postings = self.trigram_index.get(gram)
+                if postings is None:
+                    postings = self.trigram_index[gram] = array("I")
+                postings.append(path_id)
+
+    @classmethod
+    def from_repo(cls, project_path: str, cache_dir: str | None = None) -> "RepoIndex":
+        """Load the index of `project_path` from `cache_dir` if saved for its commit, else build it."""
+        commit = _head_commit(project_path)
+        cache_file = None
+        if cache_dir and commit:
+            cache_file = os.path.join(cache_dir, f"{commit}.pickle")
+            loaded = cls.load(cache_file)
+            if loaded is not None:
+                return loaded
+
+        paths = _git_ls_files(project_path)
+        if paths is None:
+            paths = _walk_files(project_path)
+        index = cls(paths)
+        if cache_file:
+            index.save(cache_file)
+        return index
+
+    @classmethod
+    def load(cls, cache_file: str) -> "RepoIndex | None":
+        if not os.path.exists(cache_file):
+            return None
+        try:
+            with open(cache_file, "rb") as f:
+                version, index = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable repo index {cache_file}: {e}")
+            return None
+        if version != INDEX_FORMAT_VERSION:
+            return None
+        return index
+
+    def save(self, cache_file: str) -> None:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        # write then rename, so concurrent tasks never read a partial file
+        tmp = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump((INDEX_FORMAT_VERSION, self), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache_file)
+
+    def _range(self, rel_dir: str) -> tuple[int, int]:
+        """Slice of self.paths below directory `rel_dir` ("" for the root)."""
+        if not rel_dir:
+            return 0, len(self.paths)
+        prefix = rel_dir.rstrip("/") + "/"
+        start = bisect_left(self.paths, prefix)
+        # "0" is the character following "/", so this is the first path past the prefix
+        end = bisect_left(self.paths, prefix[:-1] + "0", lo=start)
+        return start, end
+
+    def has_dir(self, rel_dir: str) -> bool:
+        start, end = self._range(rel_dir)
+        return end > start
+
+    def tree(self, rel_dir: str = "", depth: int = -1) -> Dict:
+        """
+        Nested dict of the entries below `rel_dir`, with files mapped to None,
+        limited to `depth` levels (-1 for no limit).
+        """
+        if depth < 0:
+            depth = -1
+        start, end = self._range(rel_dir)
+        prefix_len = len(rel_dir.rstrip("/")) + 1 if rel_dir else 0
+        result: Dict = {}
+        if depth == 0:
+            return result
+        for path in self.paths[start:end]:
+            parts = path[prefix_len:].split("/")
+            current_level = result
+            for level, part in enumerate(parts):
+                if level == len(parts) - 1:
+                    current_level[part] = None
+                    break
+                if depth != -1 and level + 1 >= depth:
+                    current_level.setdefault(part, {})
+                    break
+                current_level = current_level.setdefault(part, {})
+        return result
+
+    def search_file_names(self, keyword: str) -> List[str]:
+        """Paths of the files whose names contain `keyword`, case-insensitively."""
+        keyword = keyword.lower()
+        if len(keyword) < 3:
+            candidates = range(len(self.paths))
+        else:
+            postings = []
+            for gram in _trigrams(keyword):
+                gram_postings = self.trigram_index.get(gram)
+                if gram_postings is None:
+                    return []
+                postings.append(gram_postings)
+            postings.sort(key=len)
+            candidate_ids = set(postings[0])
+            for other in postings[1:]:
+                candidate_ids.intersection_update(other)
+            candidates = sorted(candidate_ids)
+        return [self.paths[i] for i in candidates if keyword in self.basenames[i]]
+
+
+def _head_commit(project_path: str) -> str | None:
+    try:
+        cp = subprocess.run(
+            ["git", "-C", project_path, "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    return cp.stdout.strip() or None
+
+
+def _git_ls_files(project_path: str) -> List[str] | None:
+    try:
+        cp = subprocess.run(
+            ["git", "-C", project_path, "ls-files", "-z", "--cached", "--others", "--exclude-standard"],
+            capture_output=True,
+            check=True,
+        )
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    return [p for p in cp.stdout.decode("utf-8", errors="replace").split("\0") if p]
+
+
+def _walk_files(project_path: str) -> List[str]:
+    paths = []
+    for root, dirs, files in os.walk(project_path):
+        dirs[:] = [d for d in dirs if d not in IGNORED_DIRS]
+        relative_root = os.path.relpath(root, project_path)
+        for file in files:
+            rel = file if relative_root == "." else os.path.join(relative_root, file)
+            paths.append(rel.replace(os.sep, "/"))
+    return paths
@@ -0,0 +1,98 @@
+"""
+Persistent cache of LLM summaries produced by browse_file_for_environment_info.
+
+Tasks of the same repo browse the same setup.py / tox.ini / README blobs over and
+over. Summaries are keyed by (git blob hash of the file, custom query, model name,
+prompt version), stored in a SQLite database shared by all processes, and evicted
+least-recently-used once the stored summaries exceed a size bound.
+"""
+
+import hashlib
+import os
+import sqlite3
+import time
+
+
+def git_blob_hash(data: bytes) -> str:
+    """Same hash as `git hash-object`, so identical blobs share one entry across commits."""
+    header = f"blob {len(data)}\0".encode()
+    return hashlib.sha1(header + data).hexdigest()
+
+
+def prompt_version(prompt: str) -> str:
+    """Short hash of a prompt; editing the prompt invalidates cached summaries."""
+    return hashlib.sha256(prompt.encode()).hexdigest()[:12]
+
+
+class SummaryCache:
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024, timeout: float = 30):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, "file_summaries.db")
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(self.db_path, timeout=timeout, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS summaries (
+                key TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                input_tokens INTEGER NOT NULL,
+                output_tokens INTEGER NOT NULL,
+                cost REAL NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_summaries_last_access ON summaries(last_access)"
+        )
+
+    @staticmethod
+    def make_key(blob_hash: str, custom_query: str, model_name: str, prompt_ver: str) -> str:
+        raw = "\0".join([blob_hash, custom_query or "", model_name, prompt_ver])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key: str) -> tuple[str, int, int, float] | None:
+        """Returns (summary, input_tokens, output_tokens, cost) of the original model call."""
+        row = self.conn.execute(
+            "SELECT summary, input_tokens, output_tokens, cost FROM summaries WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        self.conn.execute(
+            "UPDATE summaries SET last_access = ? WHERE key = ?", (time.time(), key)
+        )
+        return row
+
+    def put(self, key: str, summary: str, input_tokens: int, output_tokens: int, cost: float) -> None:
+        size = len(summary.encode())
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, summary, input_tokens, output_tokens, cost, size, time.time()),
+            )
+            self._evict()
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _evict(self) -> None:
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        freed = 0
+        victims = []
+        for key, size in self.conn.execute("SELECT key, size FROM summaries ORDER BY last_access"):
+            if total - freed <= self.max_bytes:
+                break
+            victims.append((key,))
+            freed += size
+        self.conn.executemany("DELETE FROM summaries WHERE key = ?", victims)
+
+    def close(self) -> None:
+        self.conn.close()
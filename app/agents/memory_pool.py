@@ -0,0 +1,208 @@
+"""
+Indexed memory pool of finished setups (dockerfile + eval script per task).
+
+The default memory pool is a single results.json that is read and rewritten as a
+whole under a file lock. This module keeps the same records in a SQLite database
+(WAL mode, so many processes can read while one writes) indexed by
+(repo, normalized version), which makes both appending a record and looking up
+the closest reference setup independent of the pool size.
+
+Usage as a script:
+    python -m app.agents.memory_pool import results.json results.db
+    python -m app.agents.memory_pool export results.db results.json
+"""
+
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+
+from packaging import version
+
+# width of each zero-padded release component in the sortable version key
+VERSION_KEY_WIDTH = 10
+
+
+def normalize_version(ver_str):
+    match = re.search(r"(\d+(?:\.\d+){0,2})", ver_str)
+    return match.group(1) if match else ver_str
+
+
+def get_version_key(ver_str) -> str | None:
+    """
+    Map a version string to a key whose lexicographic order equals the
+    `version.parse(normalize_version(...))` order used by get_closest_version_info.
+    Returns None for versions that cannot be parsed.
+    """
+    if ver_str is None:
+        return None
+    try:
+        parsed = version.parse(normalize_version(str(ver_str)))
+    except version.InvalidVersion:
+        return None
+    # normalize_version keeps at most three numeric components; pad missing ones
+    # with 0 so that "1.2" and "1.2.0" compare equal, as they do in packaging.
+    release = (list(parsed.release) + [0, 0, 0])[:3]
+    return ".".join(f"{part:0{VERSION_KEY_WIDTH}d}" for part in release)
+
+
+class MemoryPoolStore:
+    """
+    SQLite-backed memory pool, safe to share between processes.
+    """
+
+    def __init__(self, db_path: str, import_from: str | None = None, timeout: float = 30):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS records (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                repo TEXT NOT NULL,
+                version TEXT,
+                version_key TEXT,
+                instance_id TEXT,
+                record TEXT NOT NULL
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_records_repo_version_key ON records(repo, version_key)"
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_records_repo_version ON records(repo, version)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS imports (source TEXT PRIMARY KEY, num_records INTEGER)"
+        )
+        if import_from:
+            self.import_results_json(import_from)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    @staticmethod
+    def _row_values(record: dict) -> tuple:
+        ver = record.get("version")
+        return (
+            record.get("repo"),
+            None if ver is None else str(ver),
+            get_version_key(ver),
+            record.get("instance_id"),
+            json.dumps(record, ensure_ascii=False),
+        )
+
+    def add(self, record: dict) -> None:
+        """Append one finished setup to the pool."""
+        self.add_many([record])
+
+    def add_many(self, records: list[dict]) -> None:
+        rows = [self._row_values(r) for r in records if r.get("repo")]
+        if not rows:
+            return
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._insert_rows(rows)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    def _insert_rows(self, rows: list[tuple]) -> None:
+        self.conn.executemany(
+            "INSERT INTO records (repo, version, version_key, instance_id, record) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+
+    def import_results_json(self, results_file: str) -> int:
+        """
+        One-shot import of an existing results.json. A file that was already
+        imported into this database is skipped. Returns the number of imported records.
+        """
+        if not os.path.exists(results_file):
+            return 0
+        source = os.path.abspath(results_file)
+        if self.conn.execute("SELECT 1 FROM imports WHERE source = ?", (source,)).fetchone():
+            return 0
+        with open(results_file, "r") as f:
+            records = json.load(f)
+        rows = [self._row_values(r) for r in records if r.get("repo")]
+        # BEGIN IMMEDIATE takes the write lock up front, so two processes racing on
+        # the same results.json cannot both import it.
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self.conn.execute("SELECT 1 FROM imports WHERE source = ?", (source,)).fetchone():
+                self.conn.execute("ROLLBACK")
+                return 0
+            self._insert_rows(rows)
+            self.conn.execute("INSERT INTO imports (source, num_records) VALUES (?, ?)", (source, len(rows)))
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def export_results_json(self, results_file: str) -> int:
+        """Write all records to a results.json, e.g. for the evaluation harness."""
+        records = [json.loads(row[0]) for row in self.conn.execute("SELECT record FROM records ORDER BY id")]
+        tmp = results_file + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(records, f, indent=2)
+        os.replace(tmp, results_file)
+        return len(records)
+
+    def get_closest_version_info(self, repo: str, target_version: str):
+        """
+        Same semantics as agents_manager.get_closest_version_info: a random record
+        with exactly the target version, otherwise a random record of the repo whose
+        version is not newer than the target. Both are index range lookups.
+        """
+        exact_matches = self.conn.execute(
+            "SELECT record FROM records WHERE repo = ? AND version = ?",
+            (repo, str(target_version)),
+        ).fetchall()
+        if exact_matches:
+            return json.loads(random.choice(exact_matches)[0])
+
+        target_key = get_version_key(target_version)
+        if target_key is None:
+            return None
+        num_candidates = self.conn.execute(
+            "SELECT COUNT(*) FROM records WHERE repo = ? AND version_key IS NOT NULL AND version_key <= ?",
+            (repo, target_key),
+        ).fetchone()[0]
+        if num_candidates == 0:
+            return None
+        row = self.conn.execute(
+            "SELECT record FROM records WHERE repo = ? AND version_key IS NOT NULL AND version_key <= ? "
+            "ORDER BY version_key LIMIT 1 OFFSET ?",
+            (repo, target_key, random.randrange(num_candidates)),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+def main(argv: list[str]) -> None:
+    if len(argv) != 3 or argv[0] not in ("import", "export"):
+        print(__doc__)
+        sys.exit(1)
+    command, src, dst = argv
+    if command == "import":
+        store = MemoryPoolStore(dst)
+        num = store.import_results_json(src)
+        print(f"Imported {num} records from {src} into {dst}.")
+    else:
+        store = MemoryPoolStore(src)
+        num = store.export_results_json(dst)
+        print(f"Exported {num} records from {src} into {dst}.")
+    store.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
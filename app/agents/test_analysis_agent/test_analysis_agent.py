@@ -26,6 +26,9 @@ from os.path import join as pjoin
 import traceback
 MAX_LINE_NUM = 600
 ansi_escape = re.compile(r"\x1B\[[0-?]*[ -/]*[@-~]")
+# the classic builder prints " ---> <short id>" after every committed step
+build_step_image_regex = re.compile(r"^ ---> ([0-9a-f]{12})$")
+LAYER_CACHE_LABEL = "swe-factory.layer-cache.task"
 class TestAnalysisAgent(Agent):
     """
     Agent responsible for:
@@ -55,6 +58,12 @@ class TestAnalysisAgent(Agent):
         self.timeout = 3600
         self.disable_context_retrieval = False
         self.disable_run_test = False
+        # keep intermediate layers across refinement rounds, so that only the
+        # changed suffix of the dockerfile is rebuilt. Cleaned by cleanup_layer_cache.
+        self.enable_layer_cache = False
+        self.layer_cache_images: list[str] = []
+        self.layer_cache_step_ids: set[str] = set()
+        self.last_built_image_name = None
         # self.init_msg_thread()
 
 
@@ -286,17 +295,10 @@ class TestAnalysisAgent(Agent):
 
     
 
-        if self.setup_dockerfile_num > 1:
+        if self.setup_dockerfile_num > 1 and not self.enable_layer_cache:
             # prev_image_name = f"{task_id}:latest_{setup_dockerfile_num - 1}"
             prev_image_name = f"{self.task_id}-dockerfile{self.setup_dockerfile_num-1}:latest"
-            try:
-                client.images.remove(prev_image_name, force=True)
-                build_image_logger.info(f"Deleted previous image: {prev_image_name}")
-
-            except docker.errors.ImageNotFound:
-                build_image_logger.info(f"Do not find previous image, images list is clean.")
-            except Exception as e: 
-                build_image_logger.error(f"Failed to delete previous image {prev_image_name}: {str(e)}")
+            self.remove_previous_image(prev_image_name, build_image_logger, client)
         
         
 
@@ -314,7 +316,8 @@ class TestAnalysisAgent(Agent):
             forcerm=True,
             decode=True,
             platform="linux/x86_64",
-            nocache=True,
+            nocache=not self.enable_layer_cache,
+            labels={LAYER_CACHE_LABEL: self.task_id} if self.enable_layer_cache else None,
         )
 
         buffer = ""
@@ -338,6 +341,10 @@ class TestAnalysisAgent(Agent):
                     elif capturing:
                         command_output.append(line)
 
+                    step_image = build_step_image_regex.match(line)
+                    if step_image and self.enable_layer_cache:
+                        self.layer_cache_step_ids.add(step_image.group(1))
+
                  
                     build_image_logger.info(line)
 
@@ -360,7 +367,57 @@ class TestAnalysisAgent(Agent):
         if buffer.strip():
             build_image_logger.info(buffer.strip())
 
+        if self.enable_layer_cache:
+            self.layer_cache_images.append(image_name)
+            # drop the previous round's tag only after the new image exists, so the
+            # layers shared with it survive and only the diverging suffix is pruned.
+            if self.last_built_image_name and self.last_built_image_name != image_name:
+                self.remove_previous_image(self.last_built_image_name, build_image_logger, client)
+            self.last_built_image_name = image_name
+
         build_image_logger.info("Image built successfully!")
+
+    def remove_previous_image(self, prev_image_name, build_image_logger, client):
+        try:
+            client.images.remove(prev_image_name, force=True)
+            build_image_logger.info(f"Deleted previous image: {prev_image_name}")
+
+        except docker.errors.ImageNotFound:
+            build_image_logger.info(f"Do not find previous image, images list is clean.")
+        except Exception as e: 
+            build_image_logger.error(f"Failed to delete previous image {prev_image_name}: {str(e)}")
+
+    def cleanup_layer_cache(self) -> None:
+        """
+        Remove every image and intermediate layer this task kept for layer caching.
+        Called once when the task ends.
+        """
+        if not self.enable_layer_cache:
+            return
+        for image_name in self.layer_cache_images:
+            try:
+                self.client.images.remove(image_name, force=True)
+            except docker.errors.ImageNotFound:
+                pass
+            except Exception as e:
+                logger.warning(f"Failed to remove cached image {image_name}: {e}")
+        try:
+            for image in self.client.images.list(filters={"label": f"{LAYER_CACHE_LABEL}={self.task_id}"}):
+                self.client.images.remove(image.id, force=True)
+        except Exception as e:
+            logger.warning(f"Failed to remove labelled images of {self.task_id}: {e}")
+        # layers of failed builds are left behind as untagged intermediate images
+        for step_id in self.layer_cache_step_ids:
+            try:
+                self.client.images.remove(step_id, noprune=False)
+            except docker.errors.ImageNotFound:
+                pass
+            except docker.errors.APIError:
+                # still shared with another image (e.g. a common base), keep it
+                pass
+        self.layer_cache_images = []
+        self.layer_cache_step_ids = set()
+        self.last_built_image_name = None
     def setup_docker_and_run_test(
         self
     ) -> tuple[str, str, bool]:
@@ -551,7 +608,8 @@ class TestAnalysisAgent(Agent):
             # Remove instance container + image, close logger
             cleanup_container(self.client, container,run_test_logger)
             
-            remove_image(self.client, test_image_name, run_test_logger)
+            if not self.enable_layer_cache:
+                remove_image(self.client, test_image_name, run_test_logger)
             close_logger(run_test_logger)
         self.dump_tool_sequence(self.get_latest_test_analysis_output_dir())
         return tool_output, summary, success
\ No newline at end of file
@@ -50,4 +50,27 @@ disable_run_test: bool = False
 
 disable_download_test_resources: bool = False
 
-using_ubuntu_only: bool = False
\ No newline at end of file
+using_ubuntu_only: bool = False
+
+# keep per-task docker layers across refinement rounds instead of rebuilding with nocache
+enable_layer_cache: bool = False
+
+# where finished setups are stored for reuse: "json" (results.json) or "sqlite" (results.db)
+memory_pool_backend: str = "json"
+
+# how per-task checkouts are created from the repo cache: "copy", "worktree" or "shared"
+checkout_mode: str = "copy"
+
+# mirror store that repo caches are cloned from with --shared, None for full clones
+repo_mirror_dir: str | None = None
+
+# how swe-bench tasks are distributed over processes: "default" or "repo-affinity"
+scheduler: str = "default"
+
+# directory of the cross-task cache of file summaries in context retrieval, None to disable
+summary_cache_dir: str | None = None
+
+summary_cache_max_mb: int = 256
+
+# directory where file indexes of checkouts are saved per commit, None to disable
+repo_index_cache_dir: str | None = None
@@ -20,9 +20,11 @@ from loguru import logger
 from concurrent.futures import TimeoutError
 from app import globals, globals_mut, log
 from app import utils as apputils
+from app import scheduler
 from app.model import common
 from app.model.register import register_all_models
 from app.agents.agents_manager import AgentsManager
+from app.agents.memory_pool import MemoryPoolStore
 from app.post_process import (
    
     organize_and_form_input,
@@ -85,6 +87,7 @@ def main(args, subparser_dest_attr_name: str = "command"):
     common.set_model(args.model)
     # FIXME: make temperature part of the Model class
     common.MODEL_TEMP = args.model_temperature
+    common.RATE_LIMIT_DIR = args.rate_limit_dir
     # FIXME: we will remove these hyperparamters, which are from AutoCodeRover, thanks to this work.
     globals.conv_round_limit = args.conv_round_limit
     globals.enable_layered = args.enable_layered
@@ -109,6 +112,15 @@ def main(args, subparser_dest_attr_name: str = "command"):
     globals.disable_download_test_resources= args.disable_download_test_resources
 
     globals.using_ubuntu_only = args.using_ubuntu_only
+
+    globals.enable_layer_cache = args.enable_layer_cache
+    globals.memory_pool_backend = args.memory_pool_backend
+    globals.checkout_mode = args.checkout_mode
+    globals.repo_mirror_dir = abspath(args.repo_mirror_dir) if args.repo_mirror_dir else None
+    globals.scheduler = args.scheduler
+    globals.summary_cache_dir = abspath(args.summary_cache_dir) if args.summary_cache_dir else None
+    globals.summary_cache_max_mb = args.summary_cache_max_mb
+    globals.repo_index_cache_dir = abspath(args.repo_index_cache_dir) if args.repo_index_cache_dir else None
     
     subcommand = getattr(args, subparser_dest_attr_name)
     if subcommand == "swe-bench":
@@ -123,8 +135,16 @@ def main(args, subparser_dest_attr_name: str = "command"):
                 args.task, args.task_list_file,args.task_batch, args.batch_index,args.tasks_map,  args.setup_dir,client
             )
        
-            groups = group_swe_tasks_by_env(tasks)
+            if globals.scheduler == "repo-affinity":
+                groups = scheduler.group_tasks_by_repo(tasks)
+            else:
+                groups = group_swe_tasks_by_env(tasks)
             run_task_groups(groups, num_processes, organize_output=True)
+            if globals.memory_pool_backend == "sqlite" and globals.results_path:
+                # keep results.json available for the evaluation harness
+                store = MemoryPoolStore(pjoin(globals.results_path, "results.db"))
+                store.export_results_json(pjoin(globals.results_path, "results.json"))
+                store.close()
         # finally:
         #     client.close()
     elif subcommand == "github-issue":
@@ -265,6 +285,12 @@ def add_task_related_args(parser: ArgumentParser) -> None:
         default=0.0,
         help="The model temperature to use, for OpenAI models.",
     )
+    parser.add_argument(
+        "--rate-limit-dir",
+        type=str,
+        default=None,
+        help="Directory of the model rate limiter state shared by all processes (default: a temp dir).",
+    )
     parser.add_argument(
         "--conv-round-limit",
         type=int,
@@ -365,6 +391,54 @@ def add_task_related_args(parser: ArgumentParser) -> None:
         default=False,
         help="Enable layered code search.",
     )
+    parser.add_argument(
+        "--enable-layer-cache",
+        action="store_true",
+        default=False,
+        help="Reuse docker layers across dockerfile refinement rounds of a task; they are removed when the task ends.",
+    )
+    parser.add_argument(
+        "--memory-pool-backend",
+        choices=["json", "sqlite"],
+        default="json",
+        help="Storage of the memory pool under --results-path: results.json, or an indexed results.db (exported to results.json at the end).",
+    )
+    parser.add_argument(
+        "--checkout-mode",
+        choices=["copy", "worktree", "shared"],
+        default="copy",
+        help="How each task's repo is created from the repo cache: full copy, detached git worktree, or `git clone --shared`.",
+    )
+    parser.add_argument(
+        "--repo-mirror-dir",
+        type=str,
+        default=None,
+        help="Mirror store shared with data_collection/versioning (--git_cache): repo caches are `git clone --shared` of a per-repo mirror there instead of full clones.",
+    )
+    parser.add_argument(
+        "--scheduler",
+        choices=["default", "repo-affinity"],
+        default="default",
+        help="repo-affinity: pin each repo's tasks to one worker in version order, with work stealing, and dump scheduler_metrics.json.",
+    )
+    parser.add_argument(
+        "--summary-cache-dir",
+        type=str,
+        default=None,
+        help="Directory of a cache of LLM file summaries shared by all tasks and processes. Disabled if not set.",
+    )
+    parser.add_argument(
+        "--summary-cache-max-mb",
+        type=int,
+        default=256,
+        help="Size bound of the file summary cache; least recently used summaries are evicted first.",
+    )
+    parser.add_argument(
+        "--repo-index-cache-dir",
+        type=str,
+        default=None,
+        help="Directory where repository file indexes are saved per commit, so tasks at the same commit reuse them.",
+    )
     parser.add_argument(
         "--task-batch",
         type=int,
@@ -464,7 +538,8 @@ def make_swe_tasks(
 
     # for each task in the list to run, create a Task instance
     all_tasks = []
-    
+    # repo -> its mirror in globals.repo_mirror_dir, fetched once per run
+    repo_mirrors = {}
  
     # print(len(all_task_ids))
     # input()
@@ -474,9 +549,14 @@ def make_swe_tasks(
         task_start_time_s = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
         repo_cache_name = f'{task_info['repo']}_cache'
         repo_cache_dir =  pjoin(setup_dir,repo_cache_name)
+        github_link = f"https://github.com/{task_info['repo']}.git"
+        if globals.repo_mirror_dir and task_info['repo'] not in repo_mirrors:
+            repo_mirrors[task_info['repo']] = apputils.ensure_repo_mirror(task_info['repo'], globals.repo_mirror_dir)
         if not os.path.isdir(repo_cache_dir):
-            github_link = f"https://github.com/{task_info['repo']}.git"
-            apputils.clone_repo_and_checkout(github_link, "", repo_cache_dir)
+            if globals.repo_mirror_dir:
+                apputils.clone_repo_cache_from_mirror(repo_mirrors[task_info['repo']], github_link, repo_cache_dir)
+            else:
+                apputils.clone_repo_and_checkout(github_link, "", repo_cache_dir)
         else:
             # 可以在这里打印日志或直接跳过
             print(f"Cache already exists: {repo_cache_dir}, skip clone.")
@@ -486,6 +566,7 @@ def make_swe_tasks(
 
         setup_info['repo_path'] = task_repo_dir
         setup_info['repo_cache_path'] = repo_cache_dir
+        setup_info['checkout_mode'] = globals.checkout_mode
         task = RawSweTask(task_id, setup_info, task_info,client)
         all_tasks.append(task)
     # input()
@@ -534,8 +615,15 @@ def run_task_groups(
     for key, tasks in task_groups.items():
         log.print_with_time(f"\t{key}: {len(tasks)} tasks")
     
+    if globals.scheduler == "repo-affinity":
+        log.print_with_time("Running with repo-affinity scheduler.")
+        metrics = scheduler.run_task_groups_with_affinity(
+            task_groups, num_processes, run_task_in_subprocess
+        )
+        metrics_file = scheduler.dump_scheduler_metrics(metrics, globals.output_dir)
+        log.print_with_time(f"Scheduler metrics written to {metrics_file}")
     # single process mode
-    if num_processes == 1:
+    elif num_processes == 1:
         log.print_with_time("Running in single process mode.")
         run_tasks_serial(all_tasks)
         log.print_with_time("Finished all tasks sequentially.")
@@ -725,7 +813,7 @@ def do_inference(
     apputils.create_dir_if_not_exists(task_output_dir)
     # github_link = f'https://github.com/{python_task.repo_name}.git'
     commit_hash = python_task.commit
-    apputils.clone_repo_and_checkout(python_task.repo_cache_path,commit_hash,python_task.project_path)
+    apputils.checkout_task_repo(python_task.repo_cache_path,commit_hash,python_task.project_path,python_task.checkout_mode)
     logger.add(
         pjoin(task_output_dir, "info.log"),
         level="DEBUG",
@@ -737,7 +825,7 @@ def do_inference(
 
     start_time = datetime.now()
 
-    
+    agents_manager = None
     try:
         agents_manager = AgentsManager(python_task, 
                                         task_output_dir,
@@ -750,6 +838,8 @@ def do_inference(
                                         disable_run_test= globals.disable_run_test,
                                         disable_download_test_resources = globals.disable_download_test_resources,
                                         using_ubuntu_only = globals.using_ubuntu_only,
+                                        enable_layer_cache = globals.enable_layer_cache,
+                                        memory_pool_backend = globals.memory_pool_backend,
                                         )
         agents_manager.run_workflow()
         run_ok = True
@@ -758,6 +848,8 @@ def do_inference(
         dump_cost(start_time, end_time, task_output_dir, python_task.project_path)
     finally:
         # python_task.reset_project()
+        if agents_manager is not None:
+            agents_manager.cleanup()
         python_task.remove_project()
         if client:
             client.close()
@@ -11,6 +11,7 @@ from openai import BadRequestError
 from tenacity import retry, stop_after_attempt, wait_random_exponential
 
 from app.log import log_and_cprint, log_and_print
+from app.model.rate_limit import RateLimit
 
 # Variables for each process. Since models are singleton objects, their references are copied
 # to each process, but they all point to the same objects. For safe updating costs per process,
@@ -20,6 +21,19 @@ thread_cost = threading.local()
 thread_cost.process_cost = 0.0
 thread_cost.process_input_tokens = 0
 thread_cost.process_output_tokens = 0
+# model calls answered from a cache instead of the model
+thread_cost.process_cache_hits = 0
+thread_cost.process_avoided_cost = 0.0
+thread_cost.process_avoided_input_tokens = 0
+thread_cost.process_avoided_output_tokens = 0
+
+
+def record_cache_hit(input_tokens: int, output_tokens: int, cost: float) -> None:
+    """Account a model call that was served from a cache, with the usage of the original call."""
+    thread_cost.process_cache_hits += 1
+    thread_cost.process_avoided_cost += cost
+    thread_cost.process_avoided_input_tokens += input_tokens
+    thread_cost.process_avoided_output_tokens += output_tokens
 
 
 class Model(ABC):
@@ -36,6 +50,8 @@ class Model(ABC):
         self.cost_per_output: float = cost_per_output
         # whether the model supports parallel tool call
         self.parallel_tool_call: bool = parallel_tool_call
+        # provider rate limit, set in register.py; None for no client-side limiting
+        self.rate_limit: RateLimit | None = None
 
     @abstractmethod
     def check_api_key(self) -> str:
@@ -73,6 +89,10 @@ class Model(ABC):
             "total_tokens": thread_cost.process_input_tokens
             + thread_cost.process_output_tokens,
             "total_cost": thread_cost.process_cost,
+            "cache_hits": thread_cost.process_cache_hits,
+            "avoided_input_tokens": thread_cost.process_avoided_input_tokens,
+            "avoided_output_tokens": thread_cost.process_avoided_output_tokens,
+            "avoided_cost": thread_cost.process_avoided_cost,
         }
 
 
@@ -228,3 +248,6 @@ def set_model(model_name: str):
 # the model temperature to use
 # For OpenAI models: this value should be from 0 to 2
 MODEL_TEMP: float = 0.0
+
+# directory of the rate limiter state shared by all processes; None for a default temp dir
+RATE_LIMIT_DIR: str | None = None
@@ -27,7 +27,7 @@ from app.data_structures import FunctionCallIntent
 from app.log import log_and_print
 from app.model import common
 from app.model.common import Model
-import time
+from app.model.rate_limit import estimate_tokens, get_rate_limiter
 
 class OpenaiModel(Model):
     """
@@ -61,8 +61,7 @@ class OpenaiModel(Model):
         # client for making request
         self.client: OpenAI | None = None
         self._initialized = True
-        self.start_time = time.time()
-        self.total_tokens = 0
+
     def setup(self) -> None:
         """
         Check API key, and initialize OpenAI client.
@@ -160,18 +159,18 @@ class OpenaiModel(Model):
             temperature = common.MODEL_TEMP
 
         assert self.client is not None
-        if 'qwen' in self.name.lower():
-            if self.total_tokens *60> 40000*(self.start_time-time.time()):
-                waiting_time = self.total_tokens *60/40000-(self.start_time-time.time())
-                logger.info(f'wating for {waiting_time} seconds!')
-                time.sleep(waiting_time)
-                
+        # shared by all processes of the run, so they stay under the provider limit together
+        limiter = get_rate_limiter(self.name, self.rate_limit, common.RATE_LIMIT_DIR)
+        estimated_tokens = estimate_tokens(messages, self.max_output_token)
+        if limiter is not None:
+            limiter.acquire(estimated_tokens)
+
         try:
             if tools is not None and len(tools) == 1:
                 # there is only one tool => force the model to use it
                 tool_name = tools[0]["function"]["name"]
                 tool_choice = {"type": "function", "function": {"name": tool_name}}
-                response: ChatCompletion = self.client.chat.completions.create(
+                http_response = self.client.chat.completions.with_raw_response.create(
                     # model=self.name,
                     model=(
                         self.name
@@ -198,8 +197,9 @@ class OpenaiModel(Model):
                     top_p=top_p,
                     stream=False,
                 )
+                response: ChatCompletion = http_response.parse()
             else:
-                response: ChatCompletion = self.client.chat.completions.create(
+                http_response = self.client.chat.completions.with_raw_response.create(
                     model=self.name,
                     messages=messages,  # type: ignore
                     tools=tools if tools is not None else NOT_GIVEN,  # type: ignore
@@ -220,6 +220,7 @@ class OpenaiModel(Model):
                     top_p=top_p,
                     stream=False,
                 )
+                response: ChatCompletion = http_response.parse()
 
             usage_stats = response.usage
             assert usage_stats is not None
@@ -231,7 +232,9 @@ class OpenaiModel(Model):
             common.thread_cost.process_cost += cost
             common.thread_cost.process_input_tokens += input_tokens
             common.thread_cost.process_output_tokens += output_tokens
-            self.total_tokens += input_tokens
+            if limiter is not None:
+                limiter.observe_headers(http_response.headers)
+                limiter.settle(estimated_tokens, input_tokens + output_tokens)
             raw_response = response.choices[0].message
             # log_and_print(f"Raw model response: {raw_response}")
             content = self.extract_resp_content(raw_response)
@@ -255,6 +258,8 @@ class OpenaiModel(Model):
             logger.error("RateLimitError occurred: {}", e)
             logger.error("Error Code: {}", e.code)  # 错误代码
             logger.error("Error Message: {}", e.message)  # 错误信息
+            if limiter is not None:
+                limiter.observe_headers(e.response.headers, rate_limited=True)
             # if hasattr(e, 'headers'):
             #     logger.error("Rate Limit Reset Time: %s", e.headers.get('Retry-After', 'Not Provided'))  # 如果有重试时间，也输出
             # if hasattr(e, 'response'):
@@ -0,0 +1,195 @@
+"""
+Token-bucket rate limiting of model calls, shared by all processes of a run.
+
+Each model with a configured RateLimit gets two buckets, requests per minute and
+tokens per minute, stored in a small JSON file under a state directory and updated
+under an exclusive file lock. Worker processes take from the same buckets before
+each call, so they pace themselves below the provider limit instead of all hitting
+it and backing off. The buckets are corrected from the x-ratelimit-* and
+retry-after headers of each response.
+"""
+
+import fcntl
+import json
+import os
+import re
+import tempfile
+import time
+from collections.abc import Mapping
+from dataclasses import dataclass
+
+from loguru import logger
+
+# longest single sleep while waiting for a bucket, so header updates from other
+# processes are picked up
+MAX_WAIT_STEP = 5.0
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    # None means unlimited
+    requests_per_minute: int | None = None
+    tokens_per_minute: int | None = None
+
+
+def _parse_duration(value: str) -> float | None:
+    """Parse header durations such as "20ms", "1s", "6m0s" or a plain number of seconds."""
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+    return sum(float(num) * scale[unit] for num, unit in parts)
+
+
+class SharedRateLimiter:
+    def __init__(self, name: str, limit: RateLimit, state_dir: str | None = None):
+        self.name = name
+        self.limit = limit
+        state_dir = state_dir or os.path.join(tempfile.gettempdir(), "swe-factory-rate-limits")
+        os.makedirs(state_dir, exist_ok=True)
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", name)
+        self.state_file = os.path.join(state_dir, f"{safe_name}.json")
+
+    def _update(self, func):
+        """Run func(state, now) on the refilled shared state under the file lock."""
+        with open(self.state_file, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                now = time.time()
+                try:
+                    state = json.loads(raw) if raw else {}
+                except json.JSONDecodeError:
+                    state = {}
+                self._refill(state, now)
+                result = func(state, now)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _refill(self, state: dict, now: float) -> None:
+        elapsed = max(0.0, now - state.get("updated_at", now))
+        for key, per_minute in (
+            ("requests", self.limit.requests_per_minute),
+            ("tokens", self.limit.tokens_per_minute),
+        ):
+            if per_minute is None:
+                continue
+            level = state.get(key, float(per_minute))
+            state[key] = min(float(per_minute), level + elapsed * per_minute / 60.0)
+        state["updated_at"] = now
+
+    def acquire(self, estimated_tokens: int) -> float:
+        """
+        Block until one request and `estimated_tokens` tokens are available.
+        Returns the number of seconds waited.
+        """
+        tpm = self.limit.tokens_per_minute
+        # a request larger than the whole bucket must still go through eventually
+        needed_tokens = min(estimated_tokens, tpm) if tpm is not None else 0
+        waited = 0.0
+        while True:
+
+            def take(state, now):
+                wait = max(0.0, state.get("blocked_until", 0.0) - now)
+                if self.limit.requests_per_minute is not None and state["requests"] < 1:
+                    wait = max(wait, (1 - state["requests"]) * 60.0 / self.limit.requests_per_minute)
+                if tpm is not None and state["tokens"] < needed_tokens:
+                    wait = max(wait, (needed_tokens - state["tokens"]) * 60.0 / tpm)
+                if wait > 0:
+                    return wait
+                if self.limit.requests_per_minute is not None:
+                    state["requests"] -= 1
+                if tpm is not None:
+                    state["tokens"] -= needed_tokens
+                return 0.0
+
+            wait = self._update(take)
+            if wait <= 0:
+                if waited > 0:
+                    logger.info(f"Rate limiter for {self.name}: waited {waited:.1f}s")
+                return waited
+            step = min(wait, MAX_WAIT_STEP)
+            time.sleep(step)
+            waited += step
+
+    def settle(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """Correct the token bucket once the real usage of a call is known."""
+        if self.limit.tokens_per_minute is None:
+            return
+        estimated_tokens = min(estimated_tokens, self.limit.tokens_per_minute)
+
+        def correct(state, now):
+            state["tokens"] += estimated_tokens - actual_tokens
+
+        self._update(correct)
+
+    def observe_headers(self, headers: Mapping[str, str] | None, rate_limited: bool = False) -> None:
+        """
+        Lower the buckets to the remaining quota reported by the provider, and stop
+        all processes until the reset time after a 429.
+        """
+        if not headers:
+            return
+        headers = {k.lower(): v for k, v in headers.items()}
+
+        def apply(state, now):
+            for key, remaining_header, reset_header in (
+                ("requests", "x-ratelimit-remaining-requests", "x-ratelimit-reset-requests"),
+                ("tokens", "x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens"),
+            ):
+                if key not in state or remaining_header not in headers:
+                    continue
+                try:
+                    remaining = float(headers[remaining_header])
+                except ValueError:
+                    continue
+                state[key] = min(state[key], remaining)
+                if remaining <= 0 and reset_header in headers:
+                    reset = _parse_duration(headers[reset_header])
+                    if reset is not None:
+                        state["blocked_until"] = max(state.get("blocked_until", 0.0), now + reset)
+            if rate_limited:
+                retry_after = None
+                if "retry-after-ms" in headers:
+                    retry_after = (_parse_duration(headers["retry-after-ms"]) or 0) / 1000
+                elif "retry-after" in headers:
+                    retry_after = _parse_duration(headers["retry-after"])
+                if retry_after is not None:
+                    state["blocked_until"] = max(state.get("blocked_until", 0.0), now + retry_after)
+
+        self._update(apply)
+
+
+_limiters: dict[tuple[str, str | None], SharedRateLimiter] = {}
+
+
+def get_rate_limiter(name: str, limit: RateLimit | None, state_dir: str | None = None) -> SharedRateLimiter | None:
+    if limit is None or (limit.requests_per_minute is None and limit.tokens_per_minute is None):
+        return None
+    key = (name, state_dir)
+    if key not in _limiters:
+        _limiters[key] = SharedRateLimiter(name, limit, state_dir)
+    return _limiters[key]
+
+
+def estimate_tokens(messages: list[dict], max_output_tokens: int) -> int:
+    """Rough size of a request: about four characters per prompt token, plus the output budget."""
+    chars = 0
+    for msg in messages:
+        content = msg.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif content is not None:
+            chars += len(json.dumps(content))
+    return chars // 4 + max_output_tokens
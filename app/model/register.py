@@ -9,6 +9,13 @@ from app.model import (
     groq,
     ollama,
 )
+from app.model.rate_limit import RateLimit
+
+# Provider rate limits per model name. Calls to these models are paced by a
+# token bucket shared by all worker processes (see app/model/rate_limit.py).
+MODEL_RATE_LIMITS: dict[str, RateLimit] = {
+    "Qwen/Qwen2.5-72B-Instruct-128K": RateLimit(tokens_per_minute=40000),
+}
 
 
 def register_all_models() -> None:
@@ -78,5 +85,8 @@ def register_all_models() -> None:
     common.register_model(gemini.GeminiPro())
     common.register_model(gemini.Gemini15Pro())
 
+    for model_name, rate_limit in MODEL_RATE_LIMITS.items():
+        common.MODEL_HUB[model_name].rate_limit = rate_limit
+
     # register default model as selected
     common.SELECTED_MODEL = gpt.Gpt35_Turbo0125()
@@ -76,7 +76,8 @@ class RawSweTask(RawTask):
             # reference_setup=task_info['reference_setup'],
             version=task_info['version'],
             client = client,
-            task_info = task_info
+            task_info = task_info,
+            checkout_mode=setup_info.get("checkout_mode", "copy"),
         )
 
     def dump_meta_data(self, output_dir: str):
@@ -0,0 +1,225 @@
+"""
+Repo-affinity scheduling of SWE-Builder tasks.
+
+Tasks of one repo are grouped, ordered by version and pinned to one worker, so
+that setups found for older versions are in the memory pool before newer
+versions of the same repo start, and so that the worker keeps the repo cache
+and docker layers warm. Idle workers steal work from the busiest worker: a
+whole repo group if it has several, otherwise the newest half of its only one.
+"""
+
+import json
+import os
+import time
+from collections.abc import Callable, Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import Manager
+from os.path import join as pjoin
+
+from app import globals, globals_mut, log
+from app.agents.memory_pool import get_version_key
+from app.raw_tasks import RawTask
+
+# sorts tasks whose version cannot be parsed after all parsable versions
+_UNPARSABLE_VERSION_KEY = "~"
+
+
+def task_repo(task: RawTask) -> str:
+    task_info = getattr(task, "task_info", {}) or {}
+    return task_info.get("repo", task.task_id)
+
+
+def task_version_key(task: RawTask) -> str:
+    task_info = getattr(task, "task_info", {}) or {}
+    return get_version_key(task_info.get("version")) or _UNPARSABLE_VERSION_KEY
+
+
+def group_tasks_by_repo(tasks: Sequence[RawTask]) -> dict[str, list[RawTask]]:
+    """Group tasks by repo, each group ordered from the oldest to the newest version."""
+    groups: dict[str, list[RawTask]] = {}
+    for task in tasks:
+        groups.setdefault(task_repo(task), []).append(task)
+    for repo_tasks in groups.values():
+        repo_tasks.sort(key=lambda t: (task_version_key(t), t.task_id))
+    return groups
+
+
+def assign_groups_to_workers(
+    task_groups: Mapping[str, Sequence[RawTask]], num_workers: int
+) -> list[list[tuple[str, RawTask, bool]]]:
+    """
+    Longest-processing-time-first assignment of whole groups to workers.
+    Returns one queue of (group id, task, stolen) per worker, with stolen False.
+    """
+    queues: list[list[tuple[str, RawTask, bool]]] = [[] for _ in range(num_workers)]
+    for gid, tasks in sorted(task_groups.items(), key=lambda x: len(x[1]), reverse=True):
+        target = min(queues, key=len)
+        target.extend((gid, task, False) for task in tasks)
+    return queues
+
+
+def _steal(queues, worker_id: int) -> bool:
+    """
+    Move work from the longest queue to the queue of `worker_id`, marking the
+    moved tasks as stolen. The caller holds the lock.
+    """
+    victim_id = max(range(len(queues)), key=lambda i: len(queues[i]))
+    victim = queues[victim_id]
+    if victim_id == worker_id or len(victim) == 0:
+        return False
+    items = list(victim)
+    last_gid = items[-1][0]
+    tail_len = 0
+    for gid, _, _ in reversed(items):
+        if gid != last_gid:
+            break
+        tail_len += 1
+    if tail_len == len(items):
+        # only one group left: take its newest half, the victim keeps the older
+        # versions which it is about to feed into the memory pool
+        tail_len = len(items) // 2 if len(items) > 1 else 1
+    keep, stolen = items[: len(items) - tail_len], items[len(items) - tail_len :]
+    queues[victim_id] = keep
+    queues[worker_id] = list(queues[worker_id]) + [(gid, task, True) for gid, task, _ in stolen]
+    return True
+
+
+def _affinity_worker(
+    worker_id: int,
+    queues,
+    lock,
+    metrics,
+    run_task: Callable[[RawTask], None],
+) -> None:
+    while True:
+        with lock:
+            own = list(queues[worker_id])
+            if not own:
+                if not _steal(queues, worker_id):
+                    break
+                own = list(queues[worker_id])
+            gid, task, stolen = own[0]
+            queues[worker_id] = own[1:]
+
+        start = time.time()
+        run_task(task)
+        metrics.append(
+            {
+                "task_id": task.task_id,
+                "group": gid,
+                "version": (getattr(task, "task_info", {}) or {}).get("version"),
+                "worker": worker_id,
+                "stolen": stolen,
+                "start_epoch": start,
+                "elapsed_seconds": time.time() - start,
+            }
+        )
+        log.print_with_time(globals_mut.incre_task_return_msg())
+
+
+def run_task_groups_with_affinity(
+    task_groups: Mapping[str, Sequence[RawTask]],
+    num_processes: int,
+    run_task: Callable[[RawTask], None],
+) -> list[dict]:
+    """
+    Run task groups with repo affinity and work stealing.
+    Returns one metrics record per task, in completion order.
+    """
+    num_processes = max(1, min(num_processes, sum(len(t) for t in task_groups.values())))
+    initial_queues = assign_groups_to_workers(task_groups, num_processes)
+    for worker_id, queue in enumerate(initial_queues):
+        groups = list(dict.fromkeys(gid for gid, _, _ in queue))
+        log.print_with_time(f"Worker {worker_id}: {len(queue)} tasks from groups {groups}")
+
+    with Manager() as manager:
+        queues = manager.list(initial_queues)
+        lock = manager.Lock()
+        metrics = manager.list()
+        with ProcessPoolExecutor(max_workers=num_processes) as executor:
+            futures = {
+                executor.submit(_affinity_worker, worker_id, queues, lock, metrics, run_task): worker_id
+                for worker_id in range(num_processes)
+            }
+            for future in as_completed(futures):
+                worker_id = futures[future]
+                try:
+                    future.result()
+                    log.print_with_time(f"Worker {worker_id} has no more tasks.")
+                except Exception as e:
+                    log.print_with_time(f"Worker {worker_id} failed: {e!r}")
+        return list(metrics)
+
+
+def _read_task_status(task_id: str) -> dict:
+    status_file = pjoin(globals.output_dir, task_id, "status.json")
+    if not os.path.exists(status_file):
+        return {}
+    try:
+        with open(status_file) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def dump_scheduler_metrics(metrics: list[dict], output_dir: str) -> str:
+    """
+    Write scheduler_metrics.json with the memory-pool hit rate and the time saved.
+
+    The time saved is estimated as the difference between the mean runtime of
+    tasks that ran without a reference setup and the mean runtime of tasks that
+    got one, multiplied by the number of hits.
+    """
+    for record in metrics:
+        status = _read_task_status(record["task_id"])
+        record["memory_pool_hit"] = status.get("memory_pool_hit")
+        record["is_finish"] = status.get("is_finish")
+        record["num_iterations"] = status.get("num_iterations")
+
+    def summarize(records: list[dict]) -> dict:
+        known = [r for r in records if r["memory_pool_hit"] is not None]
+        hits = [r for r in known if r["memory_pool_hit"]]
+        misses = [r for r in known if not r["memory_pool_hit"]]
+        mean_hit = sum(r["elapsed_seconds"] for r in hits) / len(hits) if hits else None
+        mean_miss = sum(r["elapsed_seconds"] for r in misses) / len(misses) if misses else None
+        time_saved = None
+        if mean_hit is not None and mean_miss is not None:
+            time_saved = (mean_miss - mean_hit) * len(hits)
+        return {
+            "num_tasks": len(records),
+            "num_finished": sum(1 for r in records if r["is_finish"]),
+            "memory_pool_hits": len(hits),
+            "memory_pool_hit_rate": len(hits) / len(known) if known else None,
+            "mean_seconds_with_hit": mean_hit,
+            "mean_seconds_without_hit": mean_miss,
+            "estimated_seconds_saved": time_saved,
+        }
+
+    by_group: dict[str, list[dict]] = {}
+    by_worker: dict[int, list[dict]] = {}
+    for record in metrics:
+        by_group.setdefault(str(record["group"]), []).append(record)
+        by_worker.setdefault(record["worker"], []).append(record)
+
+    summary = summarize(metrics)
+    summary["num_stolen_tasks"] = sum(1 for r in metrics if r["stolen"])
+    if metrics:
+        start = min(r["start_epoch"] for r in metrics)
+        end = max(r["start_epoch"] + r["elapsed_seconds"] for r in metrics)
+        summary["wall_clock_seconds"] = end - start
+    result = {
+        "summary": summary,
+        "groups": {gid: summarize(records) for gid, records in by_group.items()},
+        "workers": {
+            str(worker): {
+                "num_tasks": len(records),
+                "busy_seconds": sum(r["elapsed_seconds"] for r in records),
+            }
+            for worker, records in sorted(by_worker.items())
+        },
+        "tasks": metrics,
+    }
+    metrics_file = pjoin(output_dir, "scheduler_metrics.json")
+    with open(metrics_file, "w") as f:
+        json.dump(result, f, indent=4)
+    return metrics_file
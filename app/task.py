@@ -58,6 +58,8 @@ class SweTask(Task):
     version: str
     client: DockerClient
     task_info: dict
+    # how repo_path is created from repo_cache_path, see apputils.checkout_task_repo
+    checkout_mode: str = "copy"
     @property
     def project_path(self) -> str:
         return self.repo_path
@@ -90,7 +92,10 @@ class SweTask(Task):
 
     def remove_project(self) -> None:
         """Remove the entire project repository."""
-        if os.path.exists(self.repo_path):
+        if self.checkout_mode == "worktree":
+            apputils.remove_worktree(self.repo_cache_path, self.repo_path)
+            log_and_print(f"Removed project worktree at {self.repo_path}")
+        elif os.path.exists(self.repo_path):
             shutil.rmtree(self.repo_path)
             log_and_print(f"Removed project repository at {self.repo_path}")
 
@@ -1,13 +1,16 @@
 import ast
 import contextlib
+import fcntl
 import glob
 import os
 import subprocess
+import time
 from os.path import dirname as pdirname
 from os.path import join as pjoin
 from pathlib import Path
 from subprocess import CalledProcessError
 import shutil
+from filelock import FileLock
 from app.log import log_and_print
 
 
@@ -122,6 +125,130 @@ def clone_repo_and_checkout(
             run_command(checkout_cmd)
     # return cloned_dir
 
+def _repo_cache_lock(repo_cache_dir: str) -> FileLock:
+    # serializes updates of the shared cache's worktree metadata across processes
+    return FileLock(f"{repo_cache_dir.rstrip(os.sep)}.lock", timeout=600)
+
+
+def add_worktree(repo_cache_dir: str, commit_hash: str, worktree_dir: str):
+    """
+    Check out `commit_hash` of the repo cache into `worktree_dir` as a detached
+    git worktree. Objects stay in the cache, so only the working tree is written.
+    """
+    if os.path.isdir(worktree_dir) and os.listdir(worktree_dir):
+        shutil.rmtree(worktree_dir)
+    with _repo_cache_lock(repo_cache_dir):
+        # drop metadata of worktrees whose directories are gone, e.g. killed tasks
+        run_command(["git", "-C", repo_cache_dir, "worktree", "prune"])
+        run_command(
+            ["git", "-C", repo_cache_dir, "worktree", "add", "--detach", "--force",
+             os.path.abspath(worktree_dir), commit_hash or "HEAD"],
+            stdout=subprocess.DEVNULL,
+        )
+
+
+def remove_worktree(repo_cache_dir: str, worktree_dir: str):
+    """
+    Remove a worktree created by `add_worktree`, including its metadata in the cache.
+    """
+    with _repo_cache_lock(repo_cache_dir):
+        try:
+            run_command(
+                ["git", "-C", repo_cache_dir, "worktree", "remove", "--force", "--force",
+                 os.path.abspath(worktree_dir)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+        except CalledProcessError:
+            if os.path.exists(worktree_dir):
+                shutil.rmtree(worktree_dir)
+            run_command(["git", "-C", repo_cache_dir, "worktree", "prune"])
+
+
+def clone_shared_and_checkout(repo_cache_dir: str, commit_hash: str, cloned_dir: str):
+    """
+    Clone the repo cache with `--shared`, so that the clone borrows the cache's
+    objects instead of copying them, and checkout to commit `commit_hash`.
+    """
+    if os.path.isdir(cloned_dir):
+        shutil.rmtree(cloned_dir)
+    run_command(
+        ["git", "clone", "--shared", "--no-checkout", "--quiet",
+         os.path.abspath(repo_cache_dir), cloned_dir]
+    )
+    if commit_hash != "":
+        with cd(cloned_dir):
+            run_command(["git", "checkout", "--quiet", commit_hash])
+
+
+# a repo mirror fetched less than this many seconds ago is not fetched again
+REPO_MIRROR_MAX_AGE = 600
+
+
+@contextlib.contextmanager
+def _repo_mirror_lock(mirror_dir: str, shared: bool = False):
+    # the `<mirror>.lock` protocol of data_collection/versioning/git_versions.py:
+    # exclusive to clone or fetch the mirror, shared to clone from it
+    with open(f"{mirror_dir.rstrip(os.sep)}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def ensure_repo_mirror(repo: str, mirror_root: str) -> str:
+    """
+    Return the `git clone --mirror` of `repo` in the mirror store `mirror_root`,
+    cloning it, or fetching new commits if it was not fetched recently.
+    """
+    create_dir_if_not_exists(mirror_root)
+    mirror_dir = pjoin(mirror_root, repo.replace("/", "__") + ".git")
+    with _repo_mirror_lock(mirror_dir):
+        fetch_head = pjoin(mirror_dir, "FETCH_HEAD")
+        if not os.path.isdir(mirror_dir):
+            tmp_dir = f"{mirror_dir}.{os.getpid()}.tmp"
+            if os.path.isdir(tmp_dir):
+                shutil.rmtree(tmp_dir)
+            run_command(["git", "clone", "--mirror", "--quiet", f"https://github.com/{repo}.git", tmp_dir])
+            # repo caches borrow the mirror's objects, gc must not delete them
+            run_command(["git", "-C", tmp_dir, "config", "gc.auto", "0"])
+            run_command(["git", "-C", tmp_dir, "config", "maintenance.auto", "false"])
+            Path(pjoin(tmp_dir, "FETCH_HEAD")).touch()
+            os.rename(tmp_dir, mirror_dir)
+        elif not os.path.exists(fetch_head) or time.time() - os.path.getmtime(fetch_head) > REPO_MIRROR_MAX_AGE:
+            run_command(["git", "-C", mirror_dir, "fetch", "--quiet", "--prune", "origin"])
+    return mirror_dir
+
+
+def clone_repo_cache_from_mirror(mirror_dir: str, clone_link: str, repo_cache_dir: str):
+    """
+    Create a repo cache as a `git clone --shared` of a repo mirror: it has its own
+    working tree and refs, and borrows the mirror's objects. Commits fetched into
+    the mirror later are visible to the cache and to copies of it.
+    """
+    with _repo_mirror_lock(mirror_dir, shared=True):
+        run_command(["git", "clone", "--shared", "--quiet", os.path.abspath(mirror_dir), repo_cache_dir])
+    run_command(["git", "-C", repo_cache_dir, "remote", "set-url", "origin", clone_link])
+
+
+def checkout_task_repo(repo_cache_dir: str, commit_hash: str, cloned_dir: str, mode: str = "copy"):
+    """
+    Materialize the repo cache at `commit_hash` into `cloned_dir`.
+
+    Modes:
+        - copy: full copy of the cache, .git included.
+        - worktree: detached `git worktree` of the cache.
+        - shared: `git clone --shared` of the cache.
+    """
+    if mode == "worktree":
+        add_worktree(repo_cache_dir, commit_hash, cloned_dir)
+    elif mode == "shared":
+        clone_shared_and_checkout(repo_cache_dir, commit_hash, cloned_dir)
+    else:
+        clone_repo_and_checkout(repo_cache_dir, commit_hash, cloned_dir)
+
+
 def get_version_by_git(cloned_dir:str)-> str:
     command = ["git"," describe","--tags"]
     info = None
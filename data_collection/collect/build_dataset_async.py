@@ -3,13 +3,15 @@
 import argparse
 import asyncio
 import aiohttp
-import copy
+import hashlib
 import json
 import logging
 import os
 from typing import Optional
 from datetime import datetime
 from utils_async import Repo, extract_patches, extract_problem_statement_and_hints, extract_problem_statement_and_hints_with_official_github_api
+from graphql_fetcher import GraphQLBatchFetcher, GraphQLError
+from http_cache import get_http_cache
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -17,7 +19,8 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-async def create_instance(repo: Repo, pull: dict, output_path: str, mode: str = 'swebench') -> dict:
+async def create_instance(repo: Repo, pull: dict, output_path: str, mode: str = 'swebench',
+                          problem_and_hints: Optional[tuple] = None) -> dict:
     """
     Create a single task instance from a pull request, where task instance is:
 
@@ -28,6 +31,9 @@ async def create_instance(repo: Repo, pull: dict, output_path: str, mode: str =
         patch (str): reference solution as .patch (apply to base commit),
         test_patch (str): test suite as .patch (apply to base commit),
     }
+
+    problem_and_hints, if given, is the (problem_statement, hints) pair prefetched
+    with GraphQL, which replaces the per-issue REST calls.
     """
     patch, test_patch, request_success = await extract_patches(pull, repo)
 
@@ -38,7 +44,9 @@ async def create_instance(repo: Repo, pull: dict, output_path: str, mode: str =
             with open(successful_path, "a") as f:
                 f.write(instance_id + "\n")
 
-    if mode == 'swebench':
+    if problem_and_hints is not None:
+        problem_statement, hints = problem_and_hints
+    elif mode == 'swebench':
         problem_statement, hints = await extract_problem_statement_and_hints(pull, repo)
     else:
         problem_statement, hints = await extract_problem_statement_and_hints_with_official_github_api(pull, repo)
@@ -106,6 +114,115 @@ def has_test_patch(instance: dict) -> bool:
     return True
 
 
+def get_instance_id(pull: dict) -> str:
+    return (
+        pull["base"]["repo"]["full_name"] + "-" + str(pull["number"])
+    ).replace("/", "__")
+
+
+class PrFileCursor:
+    """
+    Resume point in the PR file, checkpointed next to the output.
+
+    PRs finish out of order, so the saved offset is the start of the oldest PR
+    still in flight: every line before it has been processed. PRs past it that
+    already finished are saved by instance id, and the offset of the .all file
+    at checkpoint time lets a resumed run read back only the instances written
+    after the checkpoint instead of the whole file. A hash of the bytes just
+    before the offset detects a PR file that was rewritten rather than appended to.
+    """
+
+    # bytes before the offset covered by the fingerprint
+    FINGERPRINT_WINDOW = 64 * 1024
+
+    def __init__(self, path: str, pr_file: str):
+        self.path = path
+        self.pr_file = os.path.abspath(pr_file)
+        # start offset -> end offset of PRs handed to workers, in file order
+        self.pending = {}
+        # start offset -> instance id of PRs finished ahead of the oldest pending one
+        self.done_ahead = {}
+        self.produced_to = 0
+
+    def load(self) -> Optional[dict]:
+        """Return the saved checkpoint if it belongs to the current PR file."""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable cursor {self.path}: {e}")
+            return None
+        # the PR file may have been appended to since, but not rewritten
+        offset = state.get("offset", 0)
+        if (
+            state.get("pr_file") != self.pr_file
+            or offset > os.path.getsize(self.pr_file)
+            or state.get("fingerprint") != self.fingerprint(offset)
+        ):
+            logger.warning(f"Ignoring cursor {self.path}: it does not match {self.pr_file}")
+            return None
+        self.produced_to = state["offset"]
+        return state
+
+    def start(self, start: int, end: int) -> None:
+        self.pending[start] = end
+        self.produced_to = end
+
+    def finish(self, start: int, instance_id: Optional[str]) -> None:
+        self.pending.pop(start, None)
+        if instance_id is not None:
+            self.done_ahead[start] = instance_id
+
+    def offset(self) -> int:
+        return next(iter(self.pending)) if self.pending else self.produced_to
+
+    def fingerprint(self, offset: int) -> str:
+        """Hash of the last FINGERPRINT_WINDOW bytes of the PR file before `offset`."""
+        start = max(0, offset - self.FINGERPRINT_WINDOW)
+        with open(self.pr_file, "rb") as f:
+            f.seek(start)
+            return hashlib.sha256(f.read(offset - start)).hexdigest()
+
+    def save(self, all_output_offset: int, stats: dict) -> None:
+        offset = self.offset()
+        self.done_ahead = {s: i for s, i in self.done_ahead.items() if s >= offset}
+        state = {
+            "pr_file": self.pr_file,
+            "offset": offset,
+            "fingerprint": self.fingerprint(offset),
+            "done_ahead": list(self.done_ahead.values()),
+            "all_output_offset": all_output_offset,
+            "stats": {k: v for k, v in stats.items() if not k.startswith("_")},
+        }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+
+def read_recorded_instances(all_output: str, offset: int, cutoff_date: datetime, seen_prs: set, stats: dict) -> None:
+    """Add the instances of the .all file from `offset` on to seen_prs and stats."""
+    with open(all_output) as f:
+        f.seek(offset)
+        for line in f:
+            pr = json.loads(line)
+            if "instance_id" not in pr:
+                pr["instance_id"] = (
+                    pr["repo"] + "-" + str(pr["pull_number"])
+                ).replace("/", "__")
+            instance_id = pr["instance_id"]
+            seen_prs.add(instance_id)
+            if datetime.strptime(pr["created_at"], "%Y-%m-%dT%H:%M:%SZ") >= cutoff_date:
+                logger.info(f"Instance {instance_id} created_at {pr['created_at']} exceeds cutoff_date {cutoff_date}")
+                continue
+            if is_valid_instance(pr):
+                stats['completed'] += 1
+                if has_test_patch(pr):
+                    stats['with_tests'] += 1
+
+
 async def process_single_pr(
     pull: dict,
     repo: Repo,
@@ -118,7 +235,7 @@ async def process_single_pr(
     output_file,
     file_lock: asyncio.Lock,
     stats: dict,
-    semaphore: asyncio.Semaphore
+    problem_and_hints: Optional[tuple] = None
 ) -> None:
     """
     Process a single PR asynchronously
@@ -133,59 +250,56 @@ async def process_single_pr(
         logger.info(f"[ENTRY] process_single_pr PR #{pr_num}: resolved_issues={resolved}, id={id(pull)}")
         stats['_debug_count'] = stats.get('_debug_count', 0) + 1
 
-    async with semaphore:  # Limit concurrent tasks
-        stats['total_processed'] += 1
+    stats['total_processed'] += 1
 
-        instance_id = (
-            pull["base"]["repo"]["full_name"] + "-" + str(pull["number"])
-        ).replace("/", "__")
+    instance_id = get_instance_id(pull)
 
-        if instance_id in seen_prs or instance_id in successful_instances:
-            logger.debug(f"Skipping {instance_id}: already processed")
-            return
+    if instance_id in seen_prs or instance_id in successful_instances:
+        logger.debug(f"Skipping {instance_id}: already processed")
+        return
 
-        # DEBUG: Check pull data right before is_valid_pull
-        if stats['total_processed'] <= 10 or (pull.get('resolved_issues') and len(pull['resolved_issues']) > 0 and stats['total_processed'] <= 270):
-            logger.info(f"[PRE-CHECK] PR #{pull.get('number')}: resolved_issues={pull.get('resolved_issues')}, merged_at={pull.get('merged_at') is not None}")
-
-        if not is_valid_pull(pull):
-            # Log all invalid PRs for debugging
-            logger.debug(
-                f"PR #{pull.get('number')} invalid: "
-                f"merged_at={'YES' if pull.get('merged_at') else 'NO'}, "
-                f"resolved_issues_len={len(pull.get('resolved_issues', []))}"
-            )
-            return
+    # DEBUG: Check pull data right before is_valid_pull
+    if stats['total_processed'] <= 10 or (pull.get('resolved_issues') and len(pull['resolved_issues']) > 0 and stats['total_processed'] <= 270):
+        logger.info(f"[PRE-CHECK] PR #{pull.get('number')}: resolved_issues={pull.get('resolved_issues')}, merged_at={pull.get('merged_at') is not None}")
 
-        stats['valid_pulls'] += 1
-        logger.info(f"✅ Valid PR #{pull['number']} with issues {pull['resolved_issues']}")
+    if not is_valid_pull(pull):
+        # Log all invalid PRs for debugging
+        logger.debug(
+            f"PR #{pull.get('number')} invalid: "
+            f"merged_at={'YES' if pull.get('merged_at') else 'NO'}, "
+            f"resolved_issues_len={len(pull.get('resolved_issues', []))}"
+        )
+        return
 
-        try:
-            # Create task instance
-            instance = await create_instance(repo, pull, output_path, mode)
+    stats['valid_pulls'] += 1
+    logger.info(f"✅ Valid PR #{pull['number']} with issues {pull['resolved_issues']}")
 
-            if datetime.strptime(instance["created_at"], "%Y-%m-%dT%H:%M:%SZ") >= cutoff_date:
-                logger.info(f"Instance {instance_id} created_at {instance['created_at']} exceeds cutoff_date {cutoff_date}")
-                return
+    try:
+        # Create task instance
+        instance = await create_instance(repo, pull, output_path, mode, problem_and_hints)
 
-            if is_valid_instance(instance):
-                # Write to .all output file (thread-safe)
-                async with file_lock:
-                    print(json.dumps(instance), end="\n", flush=True, file=all_output_file)
-                    stats['completed'] += 1
-
-                    if has_test_patch(instance):
-                        # If has test suite, write to output file
-                        print(json.dumps(instance), end="\n", flush=True, file=output_file)
-                        stats['with_tests'] += 1
-
-                    # Log progress every 10 instances for better visibility
-                    if stats['completed'] % 10 == 0:
-                        logger.info(
-                            f"[{repo.repo_name}] {stats['completed']} valid, {stats['with_tests']} with tests."
-                        )
-        except Exception as e:
-            logger.error(f"Error processing PR {instance_id}: {e}", exc_info=True)
+        if datetime.strptime(instance["created_at"], "%Y-%m-%dT%H:%M:%SZ") >= cutoff_date:
+            logger.info(f"Instance {instance_id} created_at {instance['created_at']} exceeds cutoff_date {cutoff_date}")
+            return
+
+        if is_valid_instance(instance):
+            # Write to .all output file (thread-safe)
+            async with file_lock:
+                print(json.dumps(instance), end="\n", flush=True, file=all_output_file)
+                stats['completed'] += 1
+
+                if has_test_patch(instance):
+                    # If has test suite, write to output file
+                    print(json.dumps(instance), end="\n", flush=True, file=output_file)
+                    stats['with_tests'] += 1
+
+                # Log progress every 10 instances for better visibility
+                if stats['completed'] % 10 == 0:
+                    logger.info(
+                        f"[{repo.repo_name}] {stats['completed']} valid, {stats['with_tests']} with tests."
+                    )
+    except Exception as e:
+        logger.error(f"Error processing PR {instance_id}: {e}", exc_info=True)
 
 
 async def main(
@@ -195,11 +309,18 @@ async def main(
     mode: Optional[str] = 'swebench',
     language: Optional[str] = 'python',
     cutoff_date: Optional[str] = None,
-    max_concurrency: int = 20
+    max_concurrency: int = 20,
+    graphql: bool = False,
+    checkpoint_every: int = 100
 ):
     """
     Main async thread for creating task instances from pull requests
 
+    PRs are read lazily from the PR file into a bounded queue that
+    `max_concurrency` workers drain, so memory does not grow with the size of
+    the file. A cursor file (<output>.cursor) records how far the PR file has
+    been processed, and a resumed run seeks there.
+
     Args:
         pr_file (str): path to pull request JSONL file
         output (str): output file name
@@ -207,7 +328,9 @@ async def main(
         mode (str): collecting mode
         language (str): programming language
         cutoff_date (str): cutoff date string
-        max_concurrency (int): maximum number of concurrent tasks
+        max_concurrency (int): number of worker tasks
+        graphql (bool): prefetch problem statements and hints in batched GraphQL requests
+        checkpoint_every (int): number of processed PRs between cursor checkpoints
     """
     logger.info(f'Language: {language}')
     logger.info(f'Mode: {mode}')
@@ -220,11 +343,9 @@ async def main(
 
     repos = dict()
     stats = {'completed': 0, 'with_tests': 0, 'valid_pulls': 0, 'total_processed': 0}
-    total_instances = 0
     all_output = output + ".all"
     seen_prs = set()
     file_lock = asyncio.Lock()
-    semaphore = asyncio.Semaphore(max_concurrency)
 
     successful_path = os.path.join(os.path.dirname(output), "successful_requests.txt")
 
@@ -238,40 +359,25 @@ async def main(
             successful_instances.add(line.strip())
 
     # Continue where we left off if output file already exists
+    cursor = PrFileCursor(output + ".cursor", pr_file)
     if os.path.exists(all_output):
-        with open(all_output) as f:
-            for line in f:
-                pr = json.loads(line)
-                if "instance_id" not in pr:
-                    pr["instance_id"] = (
-                        pr["repo"] + "-" + str(pr["pull_number"])
-                    ).replace("/", "__")
-                instance_id = pr["instance_id"]
-                seen_prs.add(instance_id)
-                if datetime.strptime(pr["created_at"], "%Y-%m-%dT%H:%M:%SZ") >= cutoff_date:
-                    logger.info(f"Instance {instance_id} created_at {pr['created_at']} exceeds cutoff_date {cutoff_date}")
-                    continue
-                if is_valid_instance(pr):
-                    stats['completed'] += 1
-                    if has_test_patch(pr):
-                        stats['with_tests'] += 1
+        saved = cursor.load()
+        if saved is not None:
+            for key in ('completed', 'with_tests'):
+                stats[key] = saved["stats"].get(key, 0)
+            seen_prs.update(saved["done_ahead"])
+            read_recorded_instances(all_output, saved["all_output_offset"], cutoff_date, seen_prs, stats)
+            logger.info(f"Resuming {pr_file} at byte {saved['offset']}")
+        else:
+            read_recorded_instances(all_output, 0, cutoff_date, seen_prs, stats)
 
     logger.info(f"{len(seen_prs)} instance_ids previously recorded")
 
-    # Read all PRs from file
-    pulls = []
-    with_issues_count = 0
-    with open(pr_file) as f:
-        for line in f:
-            pull = json.loads(line)
-            pulls.append(pull)
-            total_instances += 1
-            if pull.get('resolved_issues') and len(pull['resolved_issues']) > 0:
-                with_issues_count += 1
-                if with_issues_count <= 3:
-                    logger.info(f"Loaded PR #{pull['number']} with {len(pull['resolved_issues'])} resolved issues: {pull['resolved_issues']}")
-
-    logger.info(f"Total PRs to process: {total_instances}, with resolved_issues: {with_issues_count}")
+    counts = {'read': 0, 'with_issues': 0, 'finished': 0, 'errors': 0}
+    queue = asyncio.Queue(maxsize=2 * max_concurrency)
+    fetcher = GraphQLBatchFetcher(token) if graphql else None
+    # PRs read before being queued, so that GraphQL can prefetch them together
+    read_batch = 200 if graphql else 1
 
     # Open output files
     write_mode_all = "w" if not os.path.exists(all_output) else "a"
@@ -279,49 +385,88 @@ async def main(
 
     with open(all_output, write_mode_all) as all_output_file:
         with open(output, write_mode) as output_file:
-            # Create async session
-            async with aiohttp.ClientSession() as session:
-                # Group PRs by repo
-                pulls_by_repo = {}
-                for pull in pulls:
-                    repo_name = pull["base"]["repo"]["full_name"]
-                    if repo_name not in pulls_by_repo:
-                        pulls_by_repo[repo_name] = []
-                    pulls_by_repo[repo_name].append(pull)
-
-                # Debug: Check grouped data
-                for repo_name, repo_pulls in pulls_by_repo.items():
-                    with_issues = sum(1 for p in repo_pulls if p.get('resolved_issues') and len(p['resolved_issues']) > 0)
-                    logger.info(f"Repo {repo_name}: {len(repo_pulls)} PRs, {with_issues} with resolved_issues")
-
-                # Create tasks for all PRs
-                tasks = []
-                for repo_name, repo_pulls in pulls_by_repo.items():
-                    # Create repo object with async session
-                    if repo_name not in repos:
-                        owner, name = repo_name.split("/")
-                        repos[repo_name] = Repo(
-                            owner=owner,
-                            name=name,
-                            token=token,
-                            language=language,
-                            session=session,
-                            file_lock=file_lock
-                        )
-
-                    repo = repos[repo_name]
 
-                    # Create tasks for this repo
-                    for i, pull in enumerate(repo_pulls):
-                        # CRITICAL: Use deepcopy to avoid shared mutable state
-                        # Shallow copy (.copy()) is NOT sufficient because nested lists
-                        # like 'resolved_issues' would still be shared references
-                        pull_copy = copy.deepcopy(pull)
-
-                        # Create coroutine with deep-copied pull data
-                        coro = process_single_pr(
-                            pull=pull_copy,
-                            repo=repo,
+            async def checkpoint():
+                async with file_lock:
+                    cursor.save(all_output_file.tell(), stats)
+
+            async def prefetch(batch: list) -> dict:
+                wanted = {}
+                for _, _, pull in batch:
+                    if is_valid_pull(pull) and get_instance_id(pull) not in seen_prs:
+                        wanted.setdefault(pull["base"]["repo"]["full_name"], []).append(pull)
+                prefetched = {}
+                for repo_name, pulls in wanted.items():
+                    owner, name = repo_name.split("/")
+                    try:
+                        result = await asyncio.to_thread(
+                            fetcher.fetch_problem_statements, owner, name, pulls, "\n---\n"
+                        )
+                    except GraphQLError as e:
+                        logger.warning(f"[{repo_name}] GraphQL prefetch failed, using REST: {e}")
+                        continue
+                    for number, problem_and_hints in result.items():
+                        prefetched[(repo_name, number)] = problem_and_hints
+                return prefetched
+
+            async def enqueue(batch: list) -> None:
+                prefetched = await prefetch(batch) if fetcher is not None else {}
+                for start, end, pull in batch:
+                    cursor.start(start, end)
+                    key = (pull["base"]["repo"]["full_name"], pull["number"])
+                    await queue.put((start, pull, prefetched.get(key)))
+
+            async def produce():
+                try:
+                    with open(pr_file, "rb") as f:
+                        f.seek(cursor.produced_to)
+                        batch = []
+                        while True:
+                            start = f.tell()
+                            line = f.readline()
+                            if not line:
+                                break
+                            if not line.strip():
+                                continue
+                            pull = json.loads(line)
+                            counts['read'] += 1
+                            if pull.get('resolved_issues') and len(pull['resolved_issues']) > 0:
+                                counts['with_issues'] += 1
+                                if counts['with_issues'] <= 3:
+                                    logger.info(f"Loaded PR #{pull['number']} with {len(pull['resolved_issues'])} resolved issues: {pull['resolved_issues']}")
+                            batch.append((start, f.tell(), pull))
+                            if len(batch) >= read_batch:
+                                await enqueue(batch)
+                                batch = []
+                        if batch:
+                            await enqueue(batch)
+                finally:
+                    for _ in range(max_concurrency):
+                        await queue.put(None)
+
+            async def work(session: aiohttp.ClientSession):
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        return
+                    start, pull, problem_and_hints = item
+                    instance_id = None
+                    try:
+                        instance_id = get_instance_id(pull)
+                        repo_name = pull["base"]["repo"]["full_name"]
+                        if repo_name not in repos:
+                            owner, name = repo_name.split("/")
+                            repos[repo_name] = Repo(
+                                owner=owner,
+                                name=name,
+                                token=token,
+                                language=language,
+                                session=session,
+                                file_lock=file_lock
+                            )
+                        await process_single_pr(
+                            pull=pull,
+                            repo=repos[repo_name],
                             output_path=output,
                             mode=mode,
                             cutoff_date=cutoff_date,
@@ -331,32 +476,37 @@ async def main(
                             output_file=output_file,
                             file_lock=file_lock,
                             stats=stats,
-                            semaphore=semaphore
+                            problem_and_hints=problem_and_hints
                         )
-                        tasks.append(coro)
-
-                # Execute all tasks concurrently
-                logger.info(f"Starting concurrent processing of {len(tasks)} PRs...")
-                results = await asyncio.gather(*tasks, return_exceptions=True)
+                    except Exception as e:
+                        counts['errors'] += 1
+                        if counts['errors'] <= 5:  # Log first 5 errors
+                            logger.error(f"PR at byte {start} failed with exception: {e}")
+                    cursor.finish(start, instance_id)
+                    counts['finished'] += 1
+                    if counts['finished'] % checkpoint_every == 0:
+                        await checkpoint()
 
-                # Log any exceptions
-                error_count = 0
-                for i, result in enumerate(results):
-                    if isinstance(result, Exception):
-                        error_count += 1
-                        if error_count <= 5:  # Log first 5 errors
-                            logger.error(f"Task {i} failed with exception: {result}")
+            # Create async session
+            async with aiohttp.ClientSession() as session:
+                logger.info(f"Starting {max_concurrency} workers...")
+                producer = asyncio.create_task(produce())
+                await asyncio.gather(*(work(session) for _ in range(max_concurrency)))
+                await producer
+            await checkpoint()
 
-                if error_count > 0:
-                    logger.warning(f"Total tasks with exceptions: {error_count}/{len(results)}")
+    if counts['errors'] > 0:
+        logger.warning(f"Total tasks with exceptions: {counts['errors']}/{counts['read']}")
 
     logger.info(
-        f"Total instances: {total_instances}, "
+        f"PRs read: {counts['read']} ({counts['with_issues']} with resolved_issues), "
         f"processed: {stats['total_processed']}, "
         f"valid pulls: {stats['valid_pulls']}, "
         f"completed: {stats['completed']}, "
         f"with tests: {stats['with_tests']}"
     )
+    if get_http_cache() is not None:
+        logger.info(f"HTTP cache: {get_http_cache().stats}")
 
 
 if __name__ == "__main__":
@@ -367,7 +517,9 @@ if __name__ == "__main__":
     parser.add_argument("--mode", type=str, default='omnigirl', help="collecting mode")
     parser.add_argument("--cutoff_date", type=str, default="2026-01-31T23:59:59Z", help="Cutoff date for filtering PRs in YYYY-MM-DDTHH:MM:SSZ format")
     parser.add_argument("--language", type=str, help="language")
-    parser.add_argument("--max_concurrency", type=int, default=20, help="Maximum number of concurrent tasks")
+    parser.add_argument("--max_concurrency", type=int, default=20, help="Number of concurrent worker tasks")
+    parser.add_argument("--graphql", action="store_true", help="Prefetch problem statements and hints with batched GraphQL requests")
+    parser.add_argument("--checkpoint_every", type=int, default=100, help="Number of processed PRs between resume cursor checkpoints")
 
     args = parser.parse_args()
     print(">>> reached main()")
@@ -0,0 +1,88 @@
+"""
+Split a PR diff into the gold patch and the test patch.
+
+The whole diff is scanned once with a single multiline regex that finds the
+`diff --git a/` headers and the `index ` lines. Each file block is then classified
+from its header alone, with precompiled tables instead of a pygments lexer lookup,
+and copied out as one slice, so no line of the diff is copied on its own.
+
+Rules, per file block:
+    - a path component (split on space, `_`, `/` and `.`) named test/tests/testing
+      makes it a test file
+    - python: other files must end with .py
+    - js: other files must be JavaScript or TypeScript (.js/.jsm/.mjs/.cjs/.ts, the
+      pygments lexers of those names); .json also counts in webpack and jest repos
+    - java: Test*/Tests*/*Test/*Tests .java files are test files; other files must be
+      .java, or .c/pom.xml in netty repos
+    - other languages: every file is kept
+    - blocks before the first header and `index ` lines are dropped
+"""
+
+import re
+from typing import Optional, Tuple
+
+# file headers and `index <hash>..<hash>` lines, the only lines that need a decision
+BOUNDARY = re.compile(r"^(?:(diff --git a/)|index )[^\n]*(?:\n|\Z)", re.MULTILINE)
+TEST_WORD = re.compile(r"(?<![^ _/.])(?:test|tests|testing)(?![^ _/.])")
+
+# file name patterns of the pygments JavaScript and TypeScript lexers
+JS_EXTENSIONS = (".js", ".jsm", ".mjs", ".cjs", ".ts")
+JAVA_TEST_NAME = re.compile(r"^Tests?|Tests?$")
+
+
+def classify_file(header: str, language: Optional[str], repo_name: str = "") -> Optional[str]:
+    """
+    Classify one file block from its `diff --git a/... b/...` header.
+
+    Returns:
+        "test", "diff", or None to drop the block
+    """
+    header = header.strip()
+    flag = "test" if TEST_WORD.search(header.lower()) else "diff"
+    if language == "python":
+        if flag != "test" and not header.endswith(".py"):
+            flag = None
+    elif language == "js":
+        is_js = header.endswith(JS_EXTENSIONS)
+        if ("webpack" in repo_name or "jest" in repo_name) and header.endswith(".json"):
+            is_js = True
+        if flag != "test" and not is_js:
+            flag = None
+    elif language == "java":
+        file_name = header.split("/")[-1]
+        is_java = file_name.endswith(".java")
+        if is_java and JAVA_TEST_NAME.search(file_name.replace(".java", "")):
+            flag = "test"
+        if "netty" in repo_name and (header.endswith(".c") or header.endswith("pom.xml")):
+            is_java = True
+        if flag != "test" and not is_java:
+            flag = None
+    return flag
+
+
+def split_patch(diff: str, language: Optional[str], repo_name: str = "") -> Tuple[str, str]:
+    """
+    Split a diff into (gold patch, test patch), each ending with a newline, or ""
+    when it has no files.
+    """
+    parts = {"diff": [], "test": []}
+    flag = None
+    pos = 0
+    for match in BOUNDARY.finditer(diff):
+        if flag is not None and match.start() > pos:
+            parts[flag].append(diff[pos:match.start()])
+        if match.group(1):
+            flag = classify_file(match.group(0), language, repo_name)
+            pos = match.start()
+        else:
+            pos = match.end()
+    if flag is not None and pos < len(diff):
+        parts[flag].append(diff[pos:])
+
+    def join(chunks) -> str:
+        text = "".join(chunks)
+        if text and not text.endswith("\n"):
+            text += "\n"
+        return text
+
+    return join(parts["diff"]), join(parts["test"])
@@ -1,21 +1,15 @@
 import os
-import shutil
 import subprocess
 import re
 import json
 import argparse
-from contextlib import contextmanager
+import sys
 from typing import List, Dict
 from concurrent.futures import ProcessPoolExecutor, as_completed
 
-@contextmanager
-def cd(newdir):
-    prevdir = os.getcwd()
-    os.chdir(os.path.expanduser(newdir))
-    try:
-        yield
-    finally:
-        os.chdir(prevdir)
+# appended, so that versioning/utils.py does not shadow modules of this directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "versioning"))
+from git_versions import describe_commits, ensure_repo_cache, missing_objects
 
 def run_command(cmd: list[str], **kwargs) -> subprocess.CompletedProcess:
     try:
@@ -24,23 +18,6 @@ def run_command(cmd: list[str], **kwargs) -> subprocess.CompletedProcess:
         print(f"Error running command: {cmd}, {e}")
         raise
 
-def get_version_by_git(cloned_dir: str) -> str:
-    if not os.path.isdir(cloned_dir):
-        raise NotADirectoryError(f"Invalid directory: {cloned_dir}")
-    with cd(cloned_dir):
-        try:
-            result = run_command(["git", "describe", "--tags"], capture_output=True, text=True)
-            version = result.stdout.strip()
-        except subprocess.CalledProcessError:
-            print(f"⚠️ No tags reachable from this commit, version set to 'unknown'")
-            return "unknown"
-        print(f"✔️ Current version: {version}")
-        match = re.search(r"(\d+\.\d+)(?:\.\d+)?", version)
-        if match:
-            return match.group(1)
-        print(f"⚠️ Unrecognized version format: {version}, version set to 'unknown'")
-        return "unknown"
-
 def get_instances(instance_path: str) -> List[Dict]:
     if instance_path.endswith((".jsonl", ".jsonl.all")):
         with open(instance_path, encoding="utf-8") as f:
@@ -49,64 +26,72 @@ def get_instances(instance_path: str) -> List[Dict]:
         return json.load(f)
 
 def prepare_repo_cache(tasks: List[Dict], cache_dir: str) -> Dict[str, str]:
-    os.makedirs(cache_dir, exist_ok=True)
     repo_cache = {}
     for task in tasks:
         repo = task["repo"]
         if repo in repo_cache:
             continue
-        repo_url = f"https://github.com/{repo}.git"
-        local_path = os.path.join(cache_dir, repo.replace("/", "__"))
         try:
-            run_command(["git", "clone", repo_url, local_path], capture_output=True)
-            repo_cache[repo] = local_path
+            # the mirror store and its `<mirror>.lock` protocol are shared with versioning/
+            repo_cache[repo] = ensure_repo_cache(repo, cache_dir)
             print(f"✅ Cached repo: {repo}")
         except Exception as e:
             print(f"❌ Failed to clone {repo}: {e}")
     return repo_cache
 
-def process_repo_task(task: Dict, testbed: str, repo_cache: Dict[str, str]) -> Dict | None:
-    instance_id = task["instance_id"]
-    repo = task["repo"]
-    base_commit = task["base_commit"]
-    repo_dir = os.path.join(testbed, instance_id)
-    os.makedirs(repo_dir, exist_ok=True)
-
+def version_from_describe(version: str | None) -> str:
+    if version is None:
+        print(f"⚠️ No tags reachable from this commit, version set to 'unknown'")
+        return "unknown"
+    match = re.search(r"(\d+\.\d+)(?:\.\d+)?", version)
+    if match:
+        return match.group(1)
+    print(f"⚠️ Unrecognized version format: {version}, version set to 'unknown'")
+    return "unknown"
+
+def process_repo_tasks(tasks: List[Dict], git_dir: str) -> tuple[List[Dict], List[Dict]]:
+    """Version all tasks of one repo against its cached clone."""
+    results, failures = [], []
     try:
-        cached_repo = repo_cache.get(repo)
-        if not cached_repo or not os.path.exists(cached_repo):
-            raise RuntimeError(f"Missing cached repo for {repo}")
-        shutil.copytree(cached_repo, repo_dir, dirs_exist_ok=True)
-        with cd(repo_dir):
-            run_command(["git", "checkout", base_commit], capture_output=True)
-        version = get_version_by_git(repo_dir)
-        result = task.copy()
-        result["version"] = version
-        return result
+        # fetches the mirror under its lock, at most once per MIRROR_MAX_AGE, if commits are missing
+        described = describe_commits(git_dir, [t["base_commit"] for t in tasks])
+        unknown = missing_objects(git_dir, [c for c, d in described.items() if d is None])
     except Exception as e:
-        print(f"❌ Failed: {instance_id} | {e}")
-        return None
-    finally:
-        shutil.rmtree(repo_dir, ignore_errors=True)
+        print(f"❌ Failed: {tasks[0]['repo']} | {e}")
+        return [], list(tasks)
+    for task in tasks:
+        if task["base_commit"] in unknown:
+            print(f"❌ Failed: {task['instance_id']} | unknown commit {task['base_commit']}")
+            failures.append(task)
+            continue
+        result = task.copy()
+        result["version"] = version_from_describe(described[task["base_commit"]])
+        results.append(result)
+    return results, failures
 
 def process_repos(tasks: List[Dict], testbed: str, repo_cache: Dict[str, str], max_workers: int = 4) -> tuple[List[Dict], List[Dict]]:
-    os.makedirs(testbed, exist_ok=True)
+    tasks_by_repo = {}
+    for t in tasks:
+        tasks_by_repo.setdefault(t["repo"], []).append(t)
     results, failures = [], []
     with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        future_to_task = {
-            executor.submit(process_repo_task, t, testbed, repo_cache): t for t in tasks
-        }
-        for future in as_completed(future_to_task):
-            task = future_to_task[future]
+        future_to_repo = {}
+        for repo, repo_tasks in tasks_by_repo.items():
+            cached_repo = repo_cache.get(repo)
+            if not cached_repo or not os.path.exists(cached_repo):
+                print(f"❌ Missing cached repo for {repo}")
+                failures.extend(repo_tasks)
+                continue
+            future_to_repo[executor.submit(process_repo_tasks, repo_tasks, cached_repo)] = repo
+        for future in as_completed(future_to_repo):
+            repo = future_to_repo[future]
             try:
-                result = future.result()
-                if result:
-                    results.append(result)
-                else:
-                    failures.append(task)
+                repo_results, repo_failures = future.result()
+                results.extend(repo_results)
+                failures.extend(repo_failures)
             except Exception as e:
-                print(f"Unexpected error in {task['instance_id']}: {e}")
-                failures.append(task)
+                print(f"Unexpected error in {repo}: {e}")
+                failures.extend(tasks_by_repo[repo])
     return results, failures
 
 def save_results(results: List[Dict], output_path: str):
@@ -128,6 +113,8 @@ def main():
     parser.add_argument("--instance_path", type=str, required=True, help="Path to input task file (.json or .jsonl)")
     parser.add_argument("--testbed", type=str, required=True, help="Temp working directory for cloning repos")
     parser.add_argument("--max-workers", type=int, default=10, help="Number of processes (default: 4)")
+    parser.add_argument("--mirror_dir", type=str, default=None,
+                        help="Shared mirror store of repo clones (default: <testbed>/_cache)")
     args = parser.parse_args()
 
     try:
@@ -142,7 +129,7 @@ def main():
             print(f"Invalid task format: {t}")
             return
 
-    repo_cache_dir = os.path.join(args.testbed, "_cache")
+    repo_cache_dir = args.mirror_dir or os.path.join(args.testbed, "_cache")
     repo_cache = prepare_repo_cache(tasks, repo_cache_dir)
 
     results, failures = process_repos(tasks, args.testbed, repo_cache, args.max_workers)
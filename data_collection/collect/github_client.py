@@ -0,0 +1,188 @@
+"""
+Shared GitHub request scheduling for the collection scripts.
+
+GitHubClient pools every configured token and tracks the remaining core quota of
+each one from the X-RateLimit-* response headers. Every request is routed to the
+token with the most headroom. The number of requests in flight is adapted with
+AIMD (additive increase, multiplicative decrease): each success raises the limit
+by 1/limit, and a secondary rate limit (429, or a 403 while quota is left) halves
+it and pauses all requests for the Retry-After time. Threads (utils.Repo) and
+coroutines (utils_async.Repo) go through the same client, so a whole run
+backs off together instead of every worker sleeping on its own.
+
+Configured from the environment:
+    GITHUB_TOKENS            comma-separated tokens, used together with --token / GITHUB_TOKEN
+    GITHUB_MAX_CONCURRENCY   upper bound of the in-flight limit (default: 64)
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# quota assumed for a token before its first response
+AUTHENTICATED_LIMIT = 5000
+ANONYMOUS_LIMIT = 60
+# default pause after a secondary rate limit without Retry-After
+SECONDARY_LIMIT_PAUSE = 60
+# poll interval while waiting for a slot
+WAIT_STEP = 0.05
+
+
+@dataclass
+class TokenState:
+    token: Optional[str]
+    limit: int
+    remaining: int
+    reset_at: float = 0.0
+    in_flight: int = 0
+
+    def headroom(self, now: float) -> int:
+        if self.reset_at and now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = 0.0
+        return self.remaining - self.in_flight
+
+
+def is_secondary_rate_limit(status: int, headers, body: str = "") -> bool:
+    if status == 429:
+        return True
+    if status != 403:
+        return False
+    if headers.get("X-RateLimit-Remaining") == "0":
+        return False
+    body = body.lower()
+    return "retry-after" in {k.lower() for k in headers} or "secondary rate limit" in body or "abuse" in body
+
+
+class GitHubClient:
+    def __init__(self, tokens: list, track_anonymous_quota: bool = True,
+                 initial_concurrency: int = 8, max_concurrency: int = 64):
+        """
+        Args:
+            tokens: GitHub tokens; an empty list means anonymous requests
+            track_anonymous_quota: whether anonymous requests share one quota; False when
+                requests go out through rotating proxies, where the quota is per IP
+            initial_concurrency: starting in-flight limit
+            max_concurrency: upper bound of the in-flight limit
+        """
+        self.tokens = [
+            TokenState(token, AUTHENTICATED_LIMIT, AUTHENTICATED_LIMIT) for token in tokens
+        ] or [TokenState(None, ANONYMOUS_LIMIT, ANONYMOUS_LIMIT)]
+        self.track_anonymous_quota = track_anonymous_quota
+        self.limit = float(min(initial_concurrency, max_concurrency))
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.pause_until = 0.0
+        self.last_decrease = 0.0
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "secondary_limits": 0, "exhausted": 0}
+
+    def _tracked(self, state: TokenState) -> bool:
+        return state.token is not None or self.track_anonymous_quota
+
+    def _try_acquire(self):
+        """Returns (True, token) after taking a slot, or (False, seconds to wait)."""
+        now = time.time()
+        with self.lock:
+            if now < self.pause_until:
+                return False, self.pause_until - now
+            if self.in_flight >= int(self.limit):
+                return False, WAIT_STEP
+            best = max(self.tokens, key=lambda s: s.headroom(now) if self._tracked(s) else 1)
+            if self._tracked(best) and best.headroom(now) <= 0:
+                resets = [s.reset_at for s in self.tokens if s.reset_at]
+                wait = (min(resets) - now) if resets else WAIT_STEP
+                return False, max(wait, WAIT_STEP)
+            best.in_flight += 1
+            self.in_flight += 1
+            self.stats["requests"] += 1
+            return True, best.token
+
+    def acquire(self) -> Optional[str]:
+        """Block until a request may be sent and return the token to send it with."""
+        announced = False
+        while True:
+            ok, value = self._try_acquire()
+            if ok:
+                return value
+            if value > 10 and not announced:
+                logger.warning(f"All GitHub tokens are rate limited, waiting {value:.0f}s")
+                announced = True
+            time.sleep(min(value, 30))
+
+    async def acquire_async(self) -> Optional[str]:
+        announced = False
+        while True:
+            ok, value = self._try_acquire()
+            if ok:
+                return value
+            if value > 10 and not announced:
+                logger.warning(f"All GitHub tokens are rate limited, waiting {value:.0f}s")
+                announced = True
+            await asyncio.sleep(min(value, 30))
+
+    def release(self, token: Optional[str], status: Optional[int] = None, headers=None, body: str = "") -> None:
+        """
+        Return the slot taken by acquire and learn from the response. `status` is
+        None when the request failed without a response.
+        """
+        headers = headers or {}
+        now = time.time()
+        with self.lock:
+            self.in_flight -= 1
+            state = next(s for s in self.tokens if s.token == token)
+            state.in_flight -= 1
+            if status is None:
+                return
+            if "X-RateLimit-Remaining" in headers and headers.get("X-RateLimit-Resource", "core") == "core":
+                try:
+                    state.limit = int(headers.get("X-RateLimit-Limit", state.limit))
+                    state.remaining = int(headers["X-RateLimit-Remaining"])
+                    state.reset_at = float(headers.get("X-RateLimit-Reset", 0))
+                except ValueError:
+                    pass
+                if state.remaining == 0 and self._tracked(state):
+                    self.stats["exhausted"] += 1
+                    logger.info(f"GitHub token #{self.tokens.index(state)} exhausted until {time.ctime(state.reset_at)}")
+            if is_secondary_rate_limit(status, headers, body):
+                self.stats["secondary_limits"] += 1
+                try:
+                    retry_after = float(headers.get("Retry-After", SECONDARY_LIMIT_PAUSE))
+                except ValueError:
+                    retry_after = SECONDARY_LIMIT_PAUSE
+                self.pause_until = max(self.pause_until, now + retry_after)
+                # responses already in flight report the same event, halve once per pause
+                if now - self.last_decrease > retry_after:
+                    self.limit = max(1.0, self.limit / 2)
+                    self.last_decrease = now
+                    logger.warning(f"Secondary rate limit, concurrency -> {int(self.limit)}, pausing {retry_after:.0f}s")
+            elif status < 400:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_github_client(token: Optional[str] = None, proxied: bool = False) -> GitHubClient:
+    """The process-wide client for `token` plus the tokens in GITHUB_TOKENS."""
+    tokens = [t.strip() for t in os.getenv("GITHUB_TOKENS", "").split(",") if t.strip()]
+    if token and token not in tokens:
+        tokens.insert(0, token)
+    key = (tuple(tokens), proxied)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = GitHubClient(
+                tokens,
+                track_anonymous_quota=not proxied,
+                max_concurrency=int(os.getenv("GITHUB_MAX_CONCURRENCY", "64")),
+            )
+            if len(tokens) > 1:
+                logger.info(f"GitHub client: {len(tokens)} tokens")
+        return _clients[key]
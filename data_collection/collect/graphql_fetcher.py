@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+
+"""
+Batched GitHub GraphQL fetcher for PR and issue data.
+
+The REST collectors issue one `get_commits` call per PR in
+`Repo.extract_resolved_issues_with_official_github_api`, plus one issue call and
+one comments call per referenced issue in
+`extract_problem_statement_and_hints_with_official_github_api`. This module asks
+for the same data for up to `batch_size` PRs (or issues) per GraphQL request,
+using one aliased field per PR, and follows the commit/comment connections only
+for the few PRs that have more than one page.
+
+It produces the same values as the REST paths:
+    fetch_resolved_issues   -> {pr number: resolved_issues}, as stored by print_pulls.py
+    fetch_problem_statements -> {pr number: (problem_statement, hints_text)}, as used by create_instance
+
+The endpoint is configurable (GITHUB_GRAPHQL_URL), and responses can be recorded
+to a directory and replayed by a local stand-in server:
+
+    python graphql_fetcher.py serve <fixture_dir> --port 8765
+    GITHUB_GRAPHQL_URL=http://127.0.0.1:8765/graphql python print_pulls.py ... --graphql
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+GITHUB_GRAPHQL_URL = "https://api.github.com/graphql"
+
+PR_KEYWORDS = {
+    "close",
+    "closes",
+    "closed",
+    "fix",
+    "fixes",
+    "fixed",
+    "resolve",
+    "resolves",
+    "resolved",
+}
+ISSUES_PAT = re.compile(r"(\w+)\s+\#(\d+)")
+COMMENTS_PAT = re.compile(r"(?s)<!--.*?-->")
+
+# keep a margin of the hourly point budget for other clients of the same token
+RATE_LIMIT_RESERVE = 50
+
+PR_FIELDS = """
+    number
+    title
+    body
+    commits(first: 100) {
+      pageInfo { hasNextPage endCursor }
+      nodes { commit { message authoredDate } }
+    }
+    closingIssuesReferences(first: 25) { nodes { number } }
+"""
+
+ISSUE_FIELDS = """
+    number
+    title
+    body
+    comments(first: 100) {
+      pageInfo { hasNextPage endCursor }
+      nodes { body updatedAt }
+    }
+"""
+
+
+def resolved_issues_from_text(title: Optional[str], body: Optional[str], commit_messages: list) -> list:
+    """Same <keyword> #<number> scraping as Repo.extract_resolved_issues_with_official_github_api."""
+    text = title if title else ""
+    text += "\n" + (body if body else "")
+    text += "\n" + ("\n".join(commit_messages) if commit_messages else "")
+    text = COMMENTS_PAT.sub("", text)
+    resolved_issues_set = set()
+    for word, issue_num in ISSUES_PAT.findall(text):
+        if word.lower() in PR_KEYWORDS:
+            resolved_issues_set.add(issue_num)
+    return list(resolved_issues_set)
+
+
+def _to_epoch(timestamp: str) -> float:
+    return time.mktime(time.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ"))
+
+
+class GraphQLError(RuntimeError):
+    pass
+
+
+class GraphQLBatchFetcher:
+    def __init__(
+        self,
+        token: Optional[str],
+        endpoint: Optional[str] = None,
+        batch_size: int = 50,
+        record_dir: Optional[str] = None,
+        max_retries: int = 5,
+    ):
+        """
+        Args:
+            token: GitHub token (GraphQL requires authentication)
+            endpoint: GraphQL URL, defaults to $GITHUB_GRAPHQL_URL or api.github.com
+            batch_size: number of PRs or issues per request; halved when a request is too expensive
+            record_dir: if set, every response is saved there for replay by `serve`
+        """
+        self.endpoint = endpoint or os.environ.get("GITHUB_GRAPHQL_URL", GITHUB_GRAPHQL_URL)
+        self.batch_size = batch_size
+        self.record_dir = record_dir
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        if token:
+            self.session.headers["Authorization"] = f"bearer {token}"
+        self.stats = {"requests": 0, "cost": 0}
+        self.remaining = None
+        self.reset_at = None
+
+    def query(self, query: str, variables: dict) -> dict:
+        """Run one GraphQL query, waiting for the point budget and retrying transient errors."""
+        self._wait_for_budget()
+        payload = {"query": query, "variables": variables}
+        for attempt in range(self.max_retries):
+            try:
+                resp = self.session.post(self.endpoint, json=payload, timeout=60)
+            except requests.RequestException as e:
+                logger.warning(f"GraphQL request failed: {e}, retrying (attempt {attempt + 1}/{self.max_retries})")
+                time.sleep(min(3 * (attempt + 1), 15))
+                continue
+            self.stats["requests"] += 1
+            if resp.status_code in (502, 503, 504):
+                # GitHub answers expensive queries that time out with 502
+                raise GraphQLError(f"HTTP {resp.status_code}")
+            if resp.status_code in (403, 429):
+                retry_after = int(resp.headers.get("Retry-After", 60))
+                logger.info(f"GraphQL rate limited, sleeping {retry_after}s")
+                time.sleep(retry_after)
+                continue
+            if resp.status_code != 200:
+                raise GraphQLError(f"HTTP {resp.status_code}: {resp.text[:500]}")
+            result = resp.json()
+            if self.record_dir:
+                self._record(payload, result)
+            data = result.get("data") or {}
+            rate_limit = data.get("rateLimit")
+            if rate_limit:
+                self.stats["cost"] += rate_limit.get("cost", 0)
+                self.remaining = rate_limit.get("remaining")
+                self.reset_at = rate_limit.get("resetAt")
+            errors = result.get("errors") or []
+            # NOT_FOUND for a deleted issue only nulls that alias; anything else is fatal
+            fatal = [e for e in errors if e.get("type") != "NOT_FOUND"]
+            if fatal:
+                raise GraphQLError(json.dumps(fatal)[:1000])
+            return data
+        raise GraphQLError(f"GraphQL request failed after {self.max_retries} attempts")
+
+    def _wait_for_budget(self):
+        if self.remaining is None or self.reset_at is None or self.remaining > RATE_LIMIT_RESERVE:
+            return
+        reset = datetime.strptime(self.reset_at, "%Y-%m-%dT%H:%M:%SZ")
+        sleep_time = max((reset - datetime.utcnow()).total_seconds() + 1, 0)
+        logger.info(f"GraphQL point budget low ({self.remaining} left), sleeping {sleep_time:.0f}s")
+        time.sleep(sleep_time)
+        self.remaining = None
+
+    def _record(self, payload: dict, result: dict):
+        os.makedirs(self.record_dir, exist_ok=True)
+        key = request_key(payload)
+        with open(os.path.join(self.record_dir, f"{key}.json"), "w") as f:
+            json.dump({"request": payload, "response": result}, f)
+
+    def _batched(self, owner: str, name: str, numbers: list, fields: str, field_name: str) -> dict:
+        """Fetch `fields` of each number with one aliased field per number, batch_size at a time."""
+        results = {}
+        start = 0
+        while start < len(numbers):
+            batch = numbers[start:start + self.batch_size]
+            aliases = "\n".join(
+                f"n{number}: {field_name}(number: {number}) {{ {fields} }}" for number in batch
+            )
+            query = (
+                "query($owner: String!, $name: String!) {\n"
+                "  rateLimit { cost remaining resetAt }\n"
+                f"  repository(owner: $owner, name: $name) {{\n{aliases}\n  }}\n"
+                "}"
+            )
+            try:
+                data = self.query(query, {"owner": owner, "name": name})
+            except GraphQLError as e:
+                if self.batch_size > 1:
+                    self.batch_size = max(1, self.batch_size // 2)
+                    logger.info(f"GraphQL batch failed ({e}), retrying with batch size {self.batch_size}")
+                    continue
+                raise
+            repository = data.get("repository") or {}
+            for number in batch:
+                node = repository.get(f"n{number}")
+                if node is not None:
+                    results[number] = node
+            start += len(batch)
+        return results
+
+    def _rest_of_connection(self, owner: str, name: str, field_name: str, number: int,
+                            connection: str, node_fields: str, cursor: str, stop=None) -> list:
+        """Follow a commits/comments connection of one PR or issue past its first page."""
+        nodes = []
+        while cursor:
+            selection = f"{connection}(first: 100, after: $cursor) {{ pageInfo {{ hasNextPage endCursor }} nodes {{ {node_fields} }} }}"
+            if field_name == "issueOrPullRequest":
+                # a union: the connection has to be selected on each member type
+                selection = f"... on Issue {{ {selection} }} ... on PullRequest {{ {selection} }}"
+            query = (
+                "query($owner: String!, $name: String!, $number: Int!, $cursor: String!) {\n"
+                "  rateLimit { cost remaining resetAt }\n"
+                f"  repository(owner: $owner, name: $name) {{ {field_name}(number: $number) {{ {selection} }} }}\n"
+                "}"
+            )
+            data = self.query(query, {"owner": owner, "name": name, "number": number, "cursor": cursor})
+            conn = (((data.get("repository") or {}).get(field_name) or {}).get(connection)) or {}
+            page = conn.get("nodes") or []
+            nodes.extend(page)
+            if stop is not None and stop(page):
+                break
+            info = conn.get("pageInfo") or {}
+            cursor = info.get("endCursor") if info.get("hasNextPage") else None
+        return nodes
+
+    def fetch_pulls(self, owner: str, name: str, numbers: list) -> dict:
+        """
+        {pr number: {"title", "body", "commit_messages", "first_commit_date", "closing_issue_references"}}
+        """
+        nodes = self._batched(owner, name, list(numbers), PR_FIELDS, "pullRequest")
+        pulls = {}
+        for number, node in nodes.items():
+            commits = node.get("commits") or {}
+            commit_nodes = list(commits.get("nodes") or [])
+            info = commits.get("pageInfo") or {}
+            if info.get("hasNextPage"):
+                commit_nodes += self._rest_of_connection(
+                    owner, name, "pullRequest", number, "commits",
+                    "commit { message authoredDate }", info.get("endCursor"),
+                )
+            pulls[number] = {
+                "title": node.get("title"),
+                "body": node.get("body"),
+                "commit_messages": [c["commit"]["message"] for c in commit_nodes],
+                "first_commit_date": commit_nodes[0]["commit"]["authoredDate"] if commit_nodes else None,
+                "closing_issue_references": [
+                    str(i["number"]) for i in ((node.get("closingIssuesReferences") or {}).get("nodes") or [])
+                ],
+            }
+        return pulls
+
+    def fetch_issues(self, owner: str, name: str, numbers: list, comments_before: dict = None) -> dict:
+        """
+        {issue number: {"title", "body", "comments": [{"body", "updatedAt"}]}}
+
+        Args:
+            comments_before: {issue number: epoch}; comment pages past that time are not fetched
+        """
+        comments_before = comments_before or {}
+        nodes = self._batched(owner, name, list(numbers), f"... on Issue {{ {ISSUE_FIELDS} }} ... on PullRequest {{ {ISSUE_FIELDS} }}", "issueOrPullRequest")
+        issues = {}
+        for number, node in nodes.items():
+            if not node:
+                continue
+            comments = node.get("comments") or {}
+            comment_nodes = list(comments.get("nodes") or [])
+            info = comments.get("pageInfo") or {}
+            cutoff = comments_before.get(number)
+            past_cutoff = lambda page: cutoff is not None and any(_to_epoch(c["updatedAt"]) >= cutoff for c in page)
+            if info.get("hasNextPage") and not past_cutoff(comment_nodes):
+                comment_nodes += self._rest_of_connection(
+                    owner, name, "issueOrPullRequest", number, "comments",
+                    "body updatedAt", info.get("endCursor"), stop=past_cutoff,
+                )
+            issues[number] = {"title": node.get("title"), "body": node.get("body"), "comments": comment_nodes}
+        return issues
+
+    def fetch_resolved_issues(self, owner: str, name: str, pulls: list) -> dict:
+        """{pr number: resolved_issues} for PR dicts from the REST listing."""
+        fetched = self.fetch_pulls(owner, name, [p["number"] for p in pulls])
+        resolved = {}
+        for pull in pulls:
+            info = fetched.get(pull["number"])
+            if info is None:
+                continue
+            resolved[pull["number"]] = resolved_issues_from_text(
+                pull.get("title"), pull.get("body"), info["commit_messages"]
+            )
+        return resolved
+
+    def fetch_problem_statements(self, owner: str, name: str, pulls: list,
+                                 hint_separator: Optional[str] = None) -> dict:
+        """
+        {pr number: (problem_statement, hints_text)} for PR dicts with `resolved_issues`,
+        as built by extract_problem_statement_and_hints_with_official_github_api.
+
+        Args:
+            hint_separator: None joins hints per issue with newlines, like utils.py;
+                a string joins all hint comments with it, like utils_async.py ("\n---\n")
+        """
+        pulls = [p for p in pulls if p.get("resolved_issues")]
+        pr_info = self.fetch_pulls(owner, name, [p["number"] for p in pulls])
+        issue_numbers = sorted({int(i) for p in pulls for i in p["resolved_issues"]})
+        # the comments of an issue are only needed up to the latest first commit of its PRs
+        comments_before = {}
+        for pull in pulls:
+            first_commit = (pr_info.get(pull["number"]) or {}).get("first_commit_date")
+            if first_commit is None:
+                continue
+            for i in pull["resolved_issues"]:
+                t = _to_epoch(first_commit)
+                comments_before[int(i)] = max(comments_before.get(int(i), t), t)
+        issues = self.fetch_issues(owner, name, issue_numbers, comments_before)
+
+        results = {}
+        for pull in pulls:
+            first_commit = (pr_info.get(pull["number"]) or {}).get("first_commit_date")
+            text = ""
+            issue_hints = []
+            for issue_number in pull["resolved_issues"]:
+                issue = issues.get(int(issue_number))
+                if issue is None:
+                    continue
+                title = issue["title"] if issue["title"] else ""
+                body = issue["body"] if issue["body"] else ""
+                text += f"{title}\n{body}\n"
+                hints = []
+                if first_commit is not None:
+                    commit_time = _to_epoch(first_commit)
+                    # only include information available before the first commit was created
+                    for comment in issue["comments"]:
+                        if _to_epoch(comment["updatedAt"]) < commit_time:
+                            hints.append(comment["body"])
+                        else:
+                            break
+                issue_hints.append(hints)
+            if hint_separator is None:
+                hints_text = "\n".join("\n".join(hints) for hints in issue_hints)
+            else:
+                hints_text = hint_separator.join(h for hints in issue_hints for h in hints)
+            results[pull["number"]] = (text, hints_text)
+        return results
+
+
+def request_key(payload: dict) -> str:
+    """Key of a recorded response: hash of the query and its variables."""
+    raw = json.dumps(payload, sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()[:24]
+
+
+def serve(fixture_dir: str, port: int = 8765):
+    """Serve recorded responses as a local stand-in for the GraphQL endpoint."""
+    fixtures = {}
+    for fname in os.listdir(fixture_dir):
+        if fname.endswith(".json"):
+            with open(os.path.join(fixture_dir, fname)) as f:
+                record = json.load(f)
+            fixtures[request_key(record["request"])] = record["response"]
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length))
+            response = fixtures.get(request_key(payload))
+            if response is None:
+                self.send_response(404)
+                self.end_headers()
+                self.wfile.write(b'{"message": "no recorded response for this query"}')
+                return
+            body = json.dumps(response).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    logger.info(f"Serving {len(fixtures)} recorded GraphQL responses on http://127.0.0.1:{port}/graphql")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Replay recorded responses on a local port")
+    serve_parser.add_argument("fixture_dir", type=str)
+    serve_parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    serve(args.fixture_dir, args.port)
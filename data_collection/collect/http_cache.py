@@ -0,0 +1,224 @@
+"""
+On-disk cache of GitHub HTTP responses, shared by utils.Repo and utils_async.Repo.
+
+Responses are stored in SQLite, keyed by URL and Accept header. An entry is served
+without a request until the TTL of its endpoint runs out. After that it is
+revalidated with If-None-Match / If-Modified-Since: a 304 costs no rate limit and
+refreshes the entry. In offline mode every cached entry is served regardless of age
+and a miss raises OfflineCacheMiss instead of touching the network, so a collection
+run can be replayed from a recorded cache.
+
+Configured from the environment:
+    GITHUB_HTTP_CACHE           path of the cache database (unset: no cache)
+    GITHUB_HTTP_CACHE_OFFLINE   "true" to replay from the cache only
+    GITHUB_HTTP_CACHE_MAX_MB    size bound, least recently used entries are evicted (default: 2048)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# (url pattern, seconds an entry is served without revalidation), first match wins
+DEFAULT_TTLS = [
+    # diffs of a PR only change while it is open; collection works on merged PRs
+    (re.compile(r"\.diff$|/pulls/\d+/files"), 30 * 24 * 3600),
+    (re.compile(r"/pulls/\d+/commits"), 7 * 24 * 3600),
+    (re.compile(r"/issues/\d+/comments"), 24 * 3600),
+    (re.compile(r"/issues/\d+$"), 24 * 3600),
+    # listing pages move whenever a PR is opened or updated
+    (re.compile(r"/pulls\?"), 600),
+]
+DEFAULT_TTL = 3600
+# response headers kept with the body; link is needed for pagination
+STORED_HEADERS = ("content-type", "link", "etag", "last-modified", "date")
+EVICT_EVERY = 200
+
+
+class OfflineCacheMiss(RuntimeError):
+    pass
+
+
+@dataclass
+class CachedResponse:
+    key: str
+    url: str
+    headers: dict
+    body: bytes
+    stored_at: float
+    ttl: float
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() - self.stored_at < self.ttl
+
+    @property
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+    def validators(self) -> dict:
+        """Conditional request headers that revalidate this entry."""
+        headers = {}
+        if self.headers.get("etag"):
+            headers["If-None-Match"] = self.headers["etag"]
+        if self.headers.get("last-modified"):
+            headers["If-Modified-Since"] = self.headers["last-modified"]
+        return headers
+
+
+class HttpCache:
+    def __init__(self, path: str, max_bytes: int = 2048 * 1024 * 1024, offline: bool = False,
+                 ttls: Optional[list] = None, default_ttl: float = DEFAULT_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.ttls = DEFAULT_TTLS if ttls is None else ttls
+        self.default_ttl = default_ttl
+        self.lock = threading.Lock()
+        self.puts = 0
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "stored": 0, "evicted": 0}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                headers TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)")
+
+    def close(self):
+        self.conn.close()
+
+    def ttl_for(self, url: str) -> float:
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return self.default_ttl
+
+    @staticmethod
+    def key(url: str, headers: Optional[dict] = None) -> str:
+        # the token does not change what a public endpoint returns, the media type does
+        accept = ""
+        for name, value in (headers or {}).items():
+            if name.lower() == "accept":
+                accept = value
+        return hashlib.sha256(f"{url}\n{accept}".encode()).hexdigest()
+
+    def get(self, url: str, headers: Optional[dict] = None) -> Optional[CachedResponse]:
+        """
+        Look up a response. Returns None on a miss, and raises OfflineCacheMiss
+        instead in offline mode.
+        """
+        key = self.key(url, headers)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT headers, body, stored_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        if row is None:
+            self.stats["misses"] += 1
+            if self.offline:
+                raise OfflineCacheMiss(f"{url} is not in the HTTP cache {self.path}")
+            return None
+        entry = CachedResponse(key, url, json.loads(row[0]), row[1], row[2], self.ttl_for(url))
+        if self.offline or entry.fresh:
+            self.stats["hits"] += 1
+        return entry
+
+    def usable(self, entry: Optional[CachedResponse]) -> bool:
+        """Whether `entry` can be returned without a request."""
+        return entry is not None and (self.offline or entry.fresh)
+
+    def put(self, url: str, headers: Optional[dict], response_headers, body: bytes) -> None:
+        """Store a 200 response."""
+        kept = {}
+        for name, value in response_headers.items():
+            if name.lower() in STORED_HEADERS:
+                kept[name.lower()] = value
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, url, headers, body, size, stored_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.key(url, headers), url, json.dumps(kept), body, len(body), now, now),
+            )
+            self.stats["stored"] += 1
+            self.puts += 1
+            if self.puts % EVICT_EVERY == 0:
+                self._evict()
+
+    def revalidated(self, entry: CachedResponse, response_headers) -> None:
+        """Record a 304 for `entry`: it is fresh again for another TTL."""
+        for name, value in response_headers.items():
+            if name.lower() in ("etag", "last-modified", "date"):
+                entry.headers[name.lower()] = value
+        entry.stored_at = time.time()
+        with self.lock:
+            self.conn.execute(
+                "UPDATE responses SET headers = ?, stored_at = ?, last_used = ? WHERE key = ?",
+                (json.dumps(entry.headers), entry.stored_at, entry.stored_at, entry.key),
+            )
+            self.stats["revalidated"] += 1
+
+    def _evict(self) -> None:
+        """Drop least recently used entries until the cache is at 90% of its bound."""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = total - int(self.max_bytes * 0.9)
+        freed, keys = 0, []
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            keys.append(key)
+            freed += size
+            if freed >= target:
+                break
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany("DELETE FROM responses WHERE key = ?", [(k,) for k in keys])
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.stats["evicted"] += len(keys)
+        logger.info(f"HTTP cache: evicted {len(keys)} entries ({freed} bytes)")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_http_cache() -> Optional[HttpCache]:
+    """The process-wide cache configured by GITHUB_HTTP_CACHE, or None."""
+    global _cache
+    path = os.getenv("GITHUB_HTTP_CACHE")
+    if not path:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.path != path:
+            _cache = HttpCache(
+                path,
+                max_bytes=int(os.getenv("GITHUB_HTTP_CACHE_MAX_MB", "2048")) * 1024 * 1024,
+                offline=os.getenv("GITHUB_HTTP_CACHE_OFFLINE", "false").lower() == "true",
+            )
+            logger.info(f"HTTP cache: {path} (offline={_cache.offline})")
+        return _cache
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+
+"""
+Run the collection pipeline over many repos, with the stages of different repos
+running at the same time.
+
+Every (repo, stage) pair is a unit of work. A repo moves on to its next stage as
+soon as its previous stage is done, so one repo can be versioning while another is
+still fetching PRs. Each stage has its own concurrency limit: the network-bound
+stages (print_pulls.py, build_dataset_async.py) and the disk-bound ones
+(get_version.py, SWE-Builder) are sized separately, and the total time approaches
+that of the slowest stage instead of the sum of all of them.
+
+A finished unit leaves a marker in `<repo_dir>/.pipeline/<stage>.done`, so a re-run
+only runs the units that failed, timed out or never started. The output of each
+unit goes to `<repo_dir>/.pipeline/<stage>.log`, and the final status of each repo
+is appended to `data/<language>_pipeline_summary.jsonl`, like pipeline.sh does.
+
+Usage:
+    python pipeline.py --language Python --top_n 100
+    python pipeline.py --language Python --repos python-attrs/attrs,psf/requests --pr-concurrency 8
+    python pipeline.py --language Python --top_n 100 --stage2 --model gpt-4.1-mini
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+COLLECT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.abspath(os.path.join(COLLECT_DIR, "..", ".."))
+DATA_ROOT = "data"
+
+# repos that are kept even if their name matches a skip pattern
+WHITELIST = {"scikit-learn/scikit-learn"}
+# repo names with these keywords are most likely not code repos
+SKIP_NAME_PATTERNS = [
+    re.compile(p) for p in (
+        r"\bawesome\b", r"free.*book", r"public.api", r"\binterview\b", r"\btutorial\b",
+        r"\bcheatsheet\b", r"\b\d+.days?\b", r"\bguide\b", r"\bresource\b",
+        r"\bexample[s]?\b", r"\bsample[s]?\b", r"\bexercise\b",
+    )
+]
+
+
+@dataclass
+class RepoPaths:
+    repo: str
+    language: str
+
+    @property
+    def owner(self) -> str:
+        return self.repo.split("/")[0]
+
+    @property
+    def name(self) -> str:
+        return self.repo.split("/")[1]
+
+    @property
+    def repo_dir(self) -> str:
+        return os.path.join(DATA_ROOT, self.language.lower(), self.owner, self.name)
+
+    @property
+    def prs(self) -> str:
+        return os.path.join(self.repo_dir, "prs.jsonl")
+
+    @property
+    def instances(self) -> str:
+        return os.path.join(self.repo_dir, "instances.jsonl")
+
+    @property
+    def versions(self) -> str:
+        return os.path.join(self.repo_dir, "instances_versions.jsonl")
+
+    @property
+    def stage2_dir(self) -> str:
+        return os.path.join("output", self.language.lower(), f"{self.owner}-{self.name}")
+
+    @property
+    def state_dir(self) -> str:
+        return os.path.join(self.repo_dir, ".pipeline")
+
+
+@dataclass
+class Stage:
+    name: str
+    # command to run, relative paths are resolved against `cwd`
+    command: Callable[[RepoPaths, argparse.Namespace], List[str]]
+    # file whose line count is the result of the stage; 0 lines ends the repo
+    output: Callable[[RepoPaths], str]
+    concurrency: int
+    cwd: str = COLLECT_DIR
+
+
+def count_lines(path: str) -> int:
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb") as f:
+        return sum(1 for _ in f)
+
+
+def count_stage2_successes(results_path: str) -> int:
+    try:
+        with open(results_path) as f:
+            return sum(1 for item in json.load(f) if item.get("status") == "success")
+    except (OSError, json.JSONDecodeError):
+        return 0
+
+
+def build_stages(args: argparse.Namespace) -> List[Stage]:
+    stages = [
+        Stage(
+            "prs",
+            lambda p, a: [sys.executable, "print_pulls.py", p.repo, p.prs, "--workers", str(a.pr_workers)]
+            + (["--incremental"] if a.incremental else []) + (["--graphql"] if a.graphql else []),
+            lambda p: p.prs,
+            args.pr_concurrency,
+        ),
+        Stage(
+            "instances",
+            lambda p, a: [sys.executable, "build_dataset_async.py", p.prs, p.instances,
+                          "--language", a.language, "--max_concurrency", str(a.async_concurrency)]
+            + (["--graphql"] if a.graphql else []),
+            lambda p: p.instances,
+            args.instance_concurrency,
+        ),
+        Stage(
+            "versions",
+            lambda p, a: [sys.executable, "get_version.py", "--instance_path", p.instances,
+                          "--testbed", a.testbed, "--max-workers", str(a.version_workers)]
+            + (["--mirror_dir", a.mirror_dir] if a.mirror_dir else []),
+            lambda p: p.versions,
+            args.version_concurrency,
+        ),
+    ]
+    if args.stage2:
+        stages.append(Stage(
+            "stage2",
+            lambda p, a: [sys.executable, "app/main.py", "swe-bench",
+                          "--model", a.model,
+                          "--tasks-map", os.path.join(COLLECT_DIR, p.versions),
+                          "--num-processes", str(a.num_processes),
+                          "--model-temperature", str(a.model_temperature),
+                          "--conv-round-limit", str(a.conv_round_limit),
+                          "--output-dir", p.stage2_dir,
+                          "--setup-dir", a.testbed_dir,
+                          "--results-path", os.path.join(p.stage2_dir, "results")]
+            + (["--repo-mirror-dir", a.mirror_dir] if a.mirror_dir else []),
+            lambda p: os.path.join(PROJECT_ROOT, p.stage2_dir, "results", "results.json"),
+            args.stage2_concurrency,
+            cwd=PROJECT_ROOT,
+        ))
+    return stages
+
+
+class CompletionMarkers:
+    """`<repo_dir>/.pipeline/<stage>.done` files recording finished units."""
+
+    @staticmethod
+    def path(paths: RepoPaths, stage: str) -> str:
+        return os.path.join(paths.state_dir, f"{stage}.done")
+
+    def get(self, paths: RepoPaths, stage: str) -> Optional[Dict]:
+        try:
+            with open(self.path(paths, stage)) as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def put(self, paths: RepoPaths, stage: str, record: Dict) -> None:
+        os.makedirs(paths.state_dir, exist_ok=True)
+        path = self.path(paths, stage)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+
+    def clear(self, paths: RepoPaths, stages: List[str]) -> None:
+        for stage in stages:
+            try:
+                os.remove(self.path(paths, stage))
+            except FileNotFoundError:
+                pass
+
+
+def format_duration(secs: float) -> str:
+    secs = int(secs)
+    if secs < 60:
+        return f"{secs}s"
+    if secs < 3600:
+        return f"{secs // 60}m{secs % 60}s"
+    return f"{secs // 3600}h{(secs % 3600) // 60}m"
+
+
+class PipelineRunner:
+    def __init__(self, stages: List[Stage], args: argparse.Namespace, summary_file: str):
+        self.stages = stages
+        self.args = args
+        self.summary_file = summary_file
+        self.markers = CompletionMarkers()
+        self.slots = {stage.name: asyncio.Semaphore(stage.concurrency) for stage in stages}
+        self.running = {stage.name: 0 for stage in stages}
+        self.counts = {"success": 0, "failed": 0, "skipped": 0}
+        self.start_time = time.time()
+        self.done_repos = 0
+        self.total_repos = 0
+
+    def log(self, message: str) -> None:
+        elapsed = format_duration(time.time() - self.start_time)
+        busy = " ".join(f"{name}={n}" for name, n in self.running.items())
+        print(f"{time.strftime('%H:%M:%S')} [{busy} | {elapsed}] {message}", flush=True)
+
+    def child_env(self, stage: Stage) -> Dict[str, str]:
+        env = dict(os.environ)
+        if stage.cwd == PROJECT_ROOT:
+            env["PYTHONPATH"] = PROJECT_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+        elif os.getenv("VORTEX_PROXY_HOST"):
+            # as in pipeline.sh, collection goes anonymous through the rotating proxies
+            env["GITHUB_TOKEN"] = ""
+        return env
+
+    async def run_unit(self, stage: Stage, paths: RepoPaths) -> Dict:
+        """Run one (repo, stage) unit; the returned record has status success/skipped/failed."""
+        os.makedirs(paths.state_dir, exist_ok=True)
+        log_path = os.path.join(paths.state_dir, f"{stage.name}.log")
+        command = stage.command(paths, self.args)
+        start = time.time()
+        with open(log_path, "ab") as log_file:
+            log_file.write(f"\n$ {' '.join(command)}\n".encode())
+            log_file.flush()
+            proc = await asyncio.create_subprocess_exec(
+                *command, cwd=stage.cwd, env=self.child_env(stage),
+                stdout=log_file, stderr=asyncio.subprocess.STDOUT,
+            )
+            try:
+                exit_code = await asyncio.wait_for(proc.wait(), timeout=self.args.step_timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                return {"status": "failed", "error": f"timeout {self.args.step_timeout}s",
+                        "elapsed_seconds": int(time.time() - start)}
+        elapsed = int(time.time() - start)
+        if exit_code != 0:
+            return {"status": "failed", "error": f"{command[1]} failed", "exit_code": exit_code,
+                    "elapsed_seconds": elapsed, "log": log_path}
+
+        output = stage.output(paths)
+        if stage.name == "stage2":
+            if not os.path.exists(output):
+                return {"status": "failed", "error": "no results file", "elapsed_seconds": elapsed}
+            count = count_stage2_successes(output)
+        else:
+            count = count_lines(output)
+        status = "success" if count else "skipped"
+        return {"status": status, "count": count, "elapsed_seconds": elapsed, "finished_at": time.time()}
+
+    async def run_repo(self, repo: str) -> None:
+        paths = RepoPaths(repo, self.args.language)
+        summary = {"repo": repo}
+        status = "success"
+        for step, stage in enumerate(self.stages, start=1):
+            record = self.markers.get(paths, stage.name)
+            if record is None:
+                async with self.slots[stage.name]:
+                    self.running[stage.name] += 1
+                    self.log(f"start {stage.name:<9} {repo}")
+                    try:
+                        record = await self.run_unit(stage, paths)
+                    finally:
+                        self.running[stage.name] -= 1
+                if record["status"] != "failed":
+                    self.markers.put(paths, stage.name, record)
+                self.log(f"{record['status']:<7} {stage.name:<9} {repo} "
+                         f"count={record.get('count', '-')} ({format_duration(record['elapsed_seconds'])})")
+            summary[f"{stage.name}_count"] = record.get("count")
+            if record["status"] != "success":
+                status = record["status"]
+                summary.update(step=step, reason=f"no_{stage.name}" if status == "skipped" else record.get("error"))
+                if "exit_code" in record:
+                    summary["exit_code"] = record["exit_code"]
+                break
+        self.finish_repo(summary, status)
+
+    def finish_repo(self, summary: Dict, status: str) -> None:
+        self.counts[status] += 1
+        self.done_repos += 1
+        summary["status"] = status
+        with open(self.summary_file, "a") as f:
+            f.write(json.dumps(summary) + "\n")
+        self.log(f"[{self.done_repos}/{self.total_repos}] {summary['repo']} -> {status}  "
+                 f"success={self.counts['success']} failed={self.counts['failed']} skipped={self.counts['skipped']}")
+
+    async def run(self, repos: List[str]) -> None:
+        self.total_repos = len(repos)
+        # one coroutine per repo; the per-stage semaphores bound the work, and
+        # their FIFO order keeps repos flowing through in list order
+        await asyncio.gather(*(self.run_repo(repo) for repo in repos))
+
+
+def filter_repos(repos: List[Dict]) -> List[str]:
+    kept, skipped = [], []
+    for r in repos:
+        name_lower = r["name"].lower()
+        if r["name"] not in WHITELIST and any(p.search(name_lower) for p in SKIP_NAME_PATTERNS):
+            skipped.append(r["name"])
+        else:
+            kept.append(r["name"])
+    if skipped:
+        print(f"[filter] Skipped {len(skipped)} non-code repos: {skipped[:5]}...")
+    return kept
+
+
+def load_repos(args: argparse.Namespace) -> List[str]:
+    if args.repos:
+        return [r.strip() for r in args.repos.split(",") if r.strip()]
+    output_path = os.path.join(DATA_ROOT, "popular_repos")
+    repos_file = os.path.join(output_path, f"{args.language.lower()}_top_{args.top_n}_repos.json")
+    if not args.skip_fetch_repos and not os.path.exists(repos_file):
+        print(f"Fetching top {args.top_n} {args.language} repos ...")
+        # get_top_repos.py searches with GITHUB_TOKEN, for the higher search quota
+        subprocess.run(
+            [sys.executable, "get_top_repos.py", "--language", args.language,
+             "--output_path", output_path, "--top_n", str(args.top_n)],
+            cwd=COLLECT_DIR, check=True,
+        )
+    if not os.path.exists(repos_file):
+        raise SystemExit(f"Repos file not found: {repos_file}. Run without --skip-fetch-repos first, or pass --repos")
+    with open(repos_file) as f:
+        return filter_repos(json.load(f))
+
+
+def main(args: argparse.Namespace) -> None:
+    if args.mirror_dir:
+        args.mirror_dir = os.path.abspath(args.mirror_dir)
+    os.chdir(COLLECT_DIR)
+    if args.stage2 and not args.model:
+        raise SystemExit("--stage2 needs --model")
+    repos = load_repos(args)
+    end_at = len(repos) if args.end_at == -1 else min(args.end_at, len(repos))
+    repos = repos[args.start_from:end_at]
+
+    stages = build_stages(args)
+    if args.redo:
+        # a redone stage invalidates everything downstream of it
+        names = [s.name for s in stages]
+        if args.redo not in names:
+            raise SystemExit(f"--redo must be one of {names}")
+        markers = CompletionMarkers()
+        for repo in repos:
+            markers.clear(RepoPaths(repo, args.language), names[names.index(args.redo):])
+
+    summary_file = os.path.join(DATA_ROOT, f"{args.language.lower()}_pipeline_summary.jsonl")
+    os.makedirs(DATA_ROOT, exist_ok=True)
+    runner = PipelineRunner(stages, args, summary_file)
+    print("=" * 40)
+    print(f"  Language: {args.language}  Repos: {len(repos)}")
+    print("  Stages:   " + ", ".join(f"{s.name} (x{s.concurrency})" for s in stages))
+    print("=" * 40)
+    asyncio.run(runner.run(repos))
+
+    print("=" * 40)
+    print(f"  Pipeline complete in {format_duration(time.time() - runner.start_time)}")
+    print(f"  Succeeded: {runner.counts['success']}  Failed: {runner.counts['failed']}  Skipped: {runner.counts['skipped']}")
+    print(f"  Summary log: {summary_file}")
+    print("=" * 40)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--language", type=str, default="Python", help="Programming language of the repos")
+    parser.add_argument("--top_n", type=int, default=100, help="Number of top repos to fetch")
+    parser.add_argument("--skip-fetch-repos", action="store_true", help="Use the existing repos JSON")
+    parser.add_argument("--repos", type=str, default="", help="Comma-separated repos, instead of the top-n list")
+    parser.add_argument("--start-from", type=int, default=0, help="Start from repo index (0-indexed)")
+    parser.add_argument("--end-at", type=int, default=-1, help="Stop at repo index (exclusive, -1 = all)")
+    parser.add_argument("--step-timeout", type=int, default=3600, help="Timeout of one (repo, stage) unit in seconds")
+    parser.add_argument("--redo", type=str, default=None,
+                        help="Drop the completion markers of this stage and the later ones before running")
+    # per-stage concurrency: how many repos run the stage at the same time
+    parser.add_argument("--pr-concurrency", type=int, default=4, help="Repos in print_pulls.py at once")
+    parser.add_argument("--instance-concurrency", type=int, default=4, help="Repos in build_dataset_async.py at once")
+    parser.add_argument("--version-concurrency", type=int, default=2, help="Repos in get_version.py at once")
+    parser.add_argument("--stage2-concurrency", type=int, default=1, help="Repos in SWE-Builder at once")
+    # per-unit settings, passed on to the scripts
+    parser.add_argument("--pr-workers", type=int, default=32, help="--workers of print_pulls.py")
+    parser.add_argument("--async-concurrency", type=int, default=20, help="--max_concurrency of build_dataset_async.py")
+    parser.add_argument("--version-workers", type=int, default=20, help="--max-workers of get_version.py")
+    parser.add_argument("--testbed", type=str, default="github", help="--testbed of get_version.py")
+    parser.add_argument("--mirror-dir", type=str, default=None,
+                        help="Mirror store of repo clones shared by get_version.py and SWE-Builder")
+    parser.add_argument("--incremental", action="store_true", help="Pass --incremental to print_pulls.py")
+    parser.add_argument("--graphql", action="store_true", help="Pass --graphql to print_pulls.py and build_dataset_async.py")
+    # stage 2 (SWE-Builder), as in scripts/stage2_batch.sh
+    parser.add_argument("--stage2", action="store_true", help="Run SWE-Builder on each versioned repo")
+    parser.add_argument("--model", type=str, default=None, help="LLM model for SWE-Builder")
+    parser.add_argument("--num-processes", type=int, default=10, help="--num-processes of SWE-Builder")
+    parser.add_argument("--model-temperature", type=float, default=0.2, help="--model-temperature of SWE-Builder")
+    parser.add_argument("--conv-round-limit", type=int, default=10, help="--conv-round-limit of SWE-Builder")
+    parser.add_argument("--testbed-dir", type=str, default="testbed", help="--setup-dir of SWE-Builder")
+    main(parser.parse_args())
@@ -14,6 +14,7 @@ from typing import Optional
 
 from tqdm import tqdm
 from fastcore.xtras import obj2dict
+from graphql_fetcher import GraphQLBatchFetcher, GraphQLError
 from utils import Repo
 
 logging.basicConfig(
@@ -70,8 +71,39 @@ def _process_single_pr(repo_name: str, token: str, pull: dict, language: str = "
     return pull
 
 
+def _log_pulls_with_graphql(repo_name: str, token: str, to_process: list, output: str,
+                            workers: int, chunk_size: int = 500):
+    """
+    Populate resolved_issues for batches of PRs with GraphQL instead of one
+    REST commits call per PR. A chunk whose GraphQL requests fail falls back
+    to the per-PR REST path.
+    """
+    owner, name = repo_name.split("/")
+    fetcher = GraphQLBatchFetcher(token)
+    pbar = tqdm(total=len(to_process), desc="Processing PRs (GraphQL)")
+    with open(output, 'a') as f:
+        for start in range(0, len(to_process), chunk_size):
+            chunk = to_process[start:start + chunk_size]
+            try:
+                resolved = fetcher.fetch_resolved_issues(owner, name, chunk)
+            except GraphQLError as e:
+                logger.warning(f"GraphQL failed for PRs {start}-{start + len(chunk)}: {e}, using REST")
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    chunk = list(executor.map(lambda p: _process_single_pr(repo_name, token, p), chunk))
+                resolved = {p['number']: p['resolved_issues'] for p in chunk}
+            for pull in chunk:
+                pull["resolved_issues"] = resolved.get(pull['number'], [])
+                json.dump(pull, f)
+                f.write('\n')
+            f.flush()
+            pbar.update(len(chunk))
+    pbar.close()
+    logger.info(f"GraphQL: {fetcher.stats['requests']} requests, {fetcher.stats['cost']} points")
+
+
 def log_all_pulls(repo: Repo, output: str, mode: str, pr_data_list=None,
-                  workers: int = 16, repo_name: str = "", token: str = ""):
+                  workers: int = 16, repo_name: str = "", token: str = "",
+                  incremental: bool = False, graphql: bool = False):
     """
     Iterate over all pull requests in a repository and log them to a file.
 
@@ -83,6 +115,8 @@ def log_all_pulls(repo: Repo, output: str, mode: str, pr_data_list=None,
         workers: number of concurrent workers for PR processing
         repo_name: "owner/repo" string for spawning per-thread Repo instances
         token: GitHub token
+        incremental: sync the PR list incrementally instead of refetching every page
+        graphql: fetch commit messages for resolved_issues in GraphQL batches
     """
     output_dir = os.path.dirname(output)
     if output_dir:
@@ -97,7 +131,8 @@ def log_all_pulls(repo: Repo, output: str, mode: str, pr_data_list=None,
 
     # --- omnigirl mode with concurrency ---
     cache_dir = os.path.dirname(output) or "."
-    pulls = repo.get_all_pulls_with_official_github_api(max_workers=workers, cache_dir=cache_dir)
+    pulls = repo.get_all_pulls_with_official_github_api(max_workers=workers, cache_dir=cache_dir,
+                                                        incremental=incremental)
     print(f'total prs number: {len(pulls)}')
 
     # Filter already processed PRs
@@ -111,6 +146,10 @@ def log_all_pulls(repo: Repo, output: str, mode: str, pr_data_list=None,
         logger.info("All PRs already processed")
         return
 
+    if graphql:
+        _log_pulls_with_graphql(repo_name, token, to_process, output, workers)
+        return
+
     # Process PRs concurrently
     pbar = tqdm(total=len(to_process), desc="Processing PRs")
     with open(output, 'a') as f:
@@ -138,7 +177,8 @@ def log_all_pulls(repo: Repo, output: str, mode: str, pr_data_list=None,
 
 
 def main(repo_name: str, output: str, token: Optional[str] = None,
-         mode: Optional[str] = 'swebench', workers: int = 16):
+         mode: Optional[str] = 'swebench', workers: int = 16, incremental: bool = False,
+         graphql: bool = False):
     """
     Logic for logging all pull requests in a repository.
     """
@@ -167,7 +207,8 @@ def main(repo_name: str, output: str, token: Optional[str] = None,
                     continue
 
     log_all_pulls(repo_obj, output, mode, pr_data_list,
-                  workers=workers, repo_name=repo_name, token=token)
+                  workers=workers, repo_name=repo_name, token=token,
+                  incremental=incremental, graphql=graphql)
 
 
 if __name__ == "__main__":
@@ -178,5 +219,10 @@ if __name__ == "__main__":
     parser.add_argument("--mode", type=str, default='omnigirl', help="Collecting mode")
     parser.add_argument("--workers", "-w", type=int, default=16,
                         help="Number of concurrent workers (default: 16)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only fetch PRs updated since the last run, merged into a per-repo store "
+                             "next to the output file")
+    parser.add_argument("--graphql", action="store_true",
+                        help="Fetch commit messages in batched GraphQL requests (needs a token)")
     args = parser.parse_args()
     main(**vars(args))
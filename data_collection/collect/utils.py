@@ -5,12 +5,14 @@ import os
 import random
 import re
 import requests
+import sqlite3
 import string
 import time
 
 from bs4 import BeautifulSoup
 from ghapi.core import GhApi
 from fastcore.net import HTTP404NotFoundError, HTTP403ForbiddenError
+from fastcore.xtras import dict2obj
 from http.client import IncompleteRead, RemoteDisconnected
 from typing import Optional
 from tqdm import tqdm
@@ -20,13 +22,17 @@ logging.basicConfig(
 import csv
 from io import StringIO
 from datetime import datetime
+from email.utils import parsedate_to_datetime
 logger = logging.getLogger(__name__)
 
-from pygments.lexers import get_lexer_for_filename
-from pygments.util import ClassNotFound
 from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
 from urllib3.util.retry import Retry
 
+from diff_split import split_patch
+from github_client import get_github_client, is_secondary_rate_limit
+from http_cache import get_http_cache
+
 PR_KEYWORDS = {
     "close",
     "closes",
@@ -39,14 +45,6 @@ PR_KEYWORDS = {
     "resolved",
 }
 
-def get_language_with_pygments(filename):
-    try:
-        lexer = get_lexer_for_filename(filename)
-        return lexer.name.lower()
-    except ClassNotFound:
-        return "Unknown"
-
-
 class ProxyRotator:
     """
     Manages proxy rotation based on request count.
@@ -144,6 +142,75 @@ class ProxyRotator:
         return proxies
 
 
+def _cached_response(entry) -> requests.Response:
+    """Wrap an http_cache entry as a 200 requests.Response."""
+    response = requests.Response()
+    response.status_code = 200
+    response._content = entry.body
+    response.headers = CaseInsensitiveDict(entry.headers)
+    response.url = entry.url
+    response.encoding = "utf-8"
+    return response
+
+
+class PullStore:
+    """
+    Local store of the closed PRs of one repo, keyed by PR number, for incremental sync.
+
+    Besides the PRs it keeps the `updated_at` high-water mark of the last sync and
+    the ETag of each fetched listing URL, so unchanged pages can be revalidated
+    with If-None-Match (a 304 does not count against the rate limit).
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pulls (number INTEGER PRIMARY KEY, updated_at TEXT, data TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS etags (url TEXT PRIMARY KEY, etag TEXT)")
+
+    def close(self):
+        self.conn.close()
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def get_etag(self, url: str) -> Optional[str]:
+        row = self.conn.execute("SELECT etag FROM etags WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else None
+
+    def set_etag(self, url: str, etag: str):
+        self.conn.execute("INSERT OR REPLACE INTO etags (url, etag) VALUES (?, ?)", (url, etag))
+
+    def upsert(self, pulls: list):
+        """Insert or replace PRs by number; returns the number of PRs written."""
+        rows = [(p['number'], p.get('updated_at'), json.dumps(p)) for p in pulls]
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO pulls (number, updated_at, data) VALUES (?, ?, ?)", rows
+            )
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def max_updated_at(self) -> Optional[str]:
+        return self.conn.execute("SELECT MAX(updated_at) FROM pulls").fetchone()[0]
+
+    def all_pulls(self) -> list:
+        """All stored PRs, newest first like the GitHub listing."""
+        return [json.loads(row[0]) for row in self.conn.execute("SELECT data FROM pulls ORDER BY number DESC")]
+
+
 class Repo:
     def __init__(self, owner: str, name: str, token: Optional[str] = None,language: Optional[str] = 'python'):
         """
@@ -167,16 +234,34 @@ class Repo:
             self.proxy_rotator.update_env_proxies()
 
         self.api = GhApi(token=token)
-        self.repo = self.call_api(self.api.repos.get, owner=owner, repo=name)
+        if get_http_cache() is not None:
+            # go through github_api so the metadata is recorded for offline replays
+            response = self.github_api(f"https://api.github.com/repos/{owner}/{name}", token)
+            self.repo = dict2obj(response.json()) if response is not None and response.status_code == 200 else None
+        else:
+            self.repo = self.call_api(self.api.repos.get, owner=owner, repo=name)
         if self.repo is None:
             raise RuntimeError(
                 f"Failed to access repository {self.repo_full_name} after multiple retries. "
                 f"Check network connectivity, proxy settings, and API rate limits."
             )
-    def github_api(self,url, token, max_retries=5):
-        """HTTP request wrapper with proxy rotation and retry logic."""
+    def github_api(self,url, token, max_retries=5, headers=None):
+        """
+        HTTP request wrapper with proxy rotation and retry logic. Tokens and
+        concurrency are scheduled by the shared GitHubClient, which waits out
+        rate limits for all threads at once. A 304 answer to caller-supplied
+        validators in `headers` (e.g. If-None-Match) is returned as is.
+        """
         retries = 0
-        headers = {'Authorization': f'token {token}'} if token else {}
+        headers = dict(headers or {})
+        client = get_github_client(token, proxied=self.proxy_rotator.enabled)
+
+        cache = get_http_cache()
+        cached = cache.get(url) if cache is not None else None
+        if cache is not None and cache.usable(cached):
+            return _cached_response(cached)
+        if cached is not None:
+            headers.update(cached.validators())
 
         while retries < max_retries:
             # Rotate proxy before each request
@@ -186,8 +271,25 @@ class Repo:
                 proxies = self.proxy_rotator.update_env_proxies()
 
             try:
-                response = requests.get(url, headers=headers, proxies=proxies, timeout=30)
+                request_token = client.acquire()
+                request_headers = dict(headers)
+                if request_token:
+                    request_headers['Authorization'] = f'token {request_token}'
+                try:
+                    response = requests.get(url, headers=request_headers, proxies=proxies, timeout=30)
+                except Exception:
+                    client.release(request_token)
+                    raise
+                error_body = response.text if response.status_code in (403, 429) else ""
+                client.release(request_token, response.status_code, response.headers, error_body)
                 if response.status_code == 200:
+                    if cache is not None:
+                        cache.put(url, None, response.headers, response.content)
+                    return response
+                elif response.status_code == 304 and cached is not None:
+                    cache.revalidated(cached, response.headers)
+                    return _cached_response(cached)
+                elif response.status_code == 304:
                     return response
                 elif response.status_code == 403 and 'X-RateLimit-Remaining' in response.headers:
                     remaining = int(response.headers['X-RateLimit-Remaining'])
@@ -202,11 +304,11 @@ class Repo:
                             retries += 1
                             time.sleep(1)
                         else:
-                            reset_time = int(response.headers['X-RateLimit-Reset'])
-                            sleep_time = reset_time - int(time.time()) + 1
-                            print(f'Rate limit exceeded. Sleeping for {sleep_time} seconds.')
-                            time.sleep(sleep_time)
+                            # the client moves to another token, or waits for the reset
                             retries += 1
+                    elif is_secondary_rate_limit(response.status_code, response.headers, error_body):
+                        # the client pauses every request for Retry-After
+                        retries += 1
                     else:
                         print(f'url:{url} 403 Forbidden: {response.json()}')
                         return response
@@ -234,8 +336,7 @@ class Repo:
                         self.proxy_rotator.update_env_proxies()
                         time.sleep(2)
                     else:
-                        logger.info(f'429 Too Many Requests. Sleeping for {retry_after}s')
-                        time.sleep(retry_after)
+                        logger.info(f'429 Too Many Requests, backing off for {retry_after}s')
                     retries += 1
                 else:
                     print(f'Error: {response.status_code}, {response.text}')
@@ -557,7 +658,8 @@ class Repo:
         )
         return issues
 
-    def get_all_pulls_with_official_github_api(self, max_workers: int = 8, cache_dir: str = None) -> list:
+    def get_all_pulls_with_official_github_api(self, max_workers: int = 8, cache_dir: str = None,
+                                               incremental: bool = False) -> list:
         """
         Fetch all closed PRs with parallel pagination, page-level caching, and resume support.
 
@@ -569,9 +671,14 @@ class Repo:
         Args:
             max_workers: number of concurrent threads for parallel fetching
             cache_dir: directory for page-level cache files (enables resume). If None, no caching.
+            incremental: keep a per-repo PR store in cache_dir and only fetch PRs updated
+                since the last sync (see sync_pulls_incremental)
         """
+        if incremental and cache_dir:
+            return self.sync_pulls_incremental(cache_dir, max_workers=max_workers)
+
         base_url = f'https://api.github.com/repos/{self.owner}/{self.name}/pulls?state=closed&per_page=100'
-        headers = {'Authorization': f'token {self.token}'} if self.token else {}
+        client = get_github_client(self.token, proxied=self.proxy_rotator.enabled)
 
         # Setup page-level cache for resume support
         page_cache_dir = None
@@ -599,7 +706,15 @@ class Repo:
                 proxies = self.proxy_rotator.update_env_proxies()
 
             try:
-                resp = requests.get(f'{base_url}&page=1', headers=headers, proxies=proxies, timeout=30)
+                request_token = client.acquire()
+                headers = {'Authorization': f'token {request_token}'} if request_token else {}
+                try:
+                    resp = requests.get(f'{base_url}&page=1', headers=headers, proxies=proxies, timeout=30)
+                except Exception:
+                    client.release(request_token)
+                    raise
+                client.release(request_token, resp.status_code, resp.headers,
+                               resp.text if resp.status_code in (403, 429) else "")
             except Exception as e:
                 logger.warning(f"[{self.repo_full_name}] Failed to fetch page 1: {e}")
                 return self._get_all_pulls_sequential()
@@ -659,7 +774,15 @@ class Repo:
                 url = f'{base_url}&page={page_num}'
                 for attempt in range(3):
                     try:
-                        r = requests.get(url, headers=headers, proxies=page_proxies, timeout=30)
+                        request_token = client.acquire()
+                        page_headers = {'Authorization': f'token {request_token}'} if request_token else {}
+                        try:
+                            r = requests.get(url, headers=page_headers, proxies=page_proxies, timeout=30)
+                        except Exception:
+                            client.release(request_token)
+                            raise
+                        client.release(request_token, r.status_code, r.headers,
+                                       r.text if r.status_code in (403, 429) else "")
                         if r.status_code == 200:
                             data = r.json()
                             if page_cache_dir:
@@ -711,6 +834,82 @@ class Repo:
         logger.info(f"[{self.repo_full_name}] Fetched {len(results)} PRs total from {last_page} pages")
         return results
 
+    def sync_pulls_incremental(self, cache_dir: str, max_workers: int = 8) -> list:
+        """
+        Bring the local PR store of this repo up to date and return all stored closed PRs.
+
+        The first sync fetches every page in parallel. Later syncs list closed PRs
+        sorted by `updated` (newest first) and stop at the first PR older than the
+        high-water mark of the previous sync, then merge the changed PRs into the
+        store by PR number. Listing pages are requested with If-None-Match, so a
+        repo without changes costs a single 304 response.
+
+        Args:
+            cache_dir: directory of the store (`.prsync_<owner>_<name>.db`)
+            max_workers: number of concurrent threads for the first full sync
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        store = PullStore(os.path.join(cache_dir, f'.prsync_{self.owner}_{self.name}.db'))
+        try:
+            high_water_mark = store.get_meta('updated_at')
+            if high_water_mark is None:
+                sync_start = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+                pulls = self.get_all_pulls_with_official_github_api(max_workers=max_workers)
+                store.upsert(pulls)
+                # PRs updated while the pages were being fetched may have moved between
+                # pages; the next sync re-reads everything updated after the start.
+                latest = store.max_updated_at()
+                store.set_meta('updated_at', min(latest, sync_start) if latest else sync_start)
+                logger.info(f"[{self.repo_full_name}] Full sync: {len(pulls)} PRs stored")
+                return store.all_pulls()
+
+            base_url = (
+                f'https://api.github.com/repos/{self.owner}/{self.name}/pulls'
+                f'?state=closed&sort=updated&direction=desc&per_page=100'
+            )
+            url = base_url
+            changed = []
+            new_mark = None
+            num_requests = 0
+            num_not_modified = 0
+            while url:
+                etag = store.get_etag(url)
+                # github_api retries transient errors and waits out rate limits
+                resp = self.github_api(url, self.token, headers={'If-None-Match': etag} if etag else None)
+                num_requests += 1
+                if resp is not None and resp.status_code == 304:
+                    # the newest page is unchanged, so no PR was updated since it was stored
+                    num_not_modified += 1
+                    break
+                if resp is None or resp.status_code != 200:
+                    status = resp.status_code if resp is not None else "no response"
+                    raise RuntimeError(
+                        f"[{self.repo_full_name}] Incremental sync got HTTP {status} for {url}"
+                    )
+                if resp.headers.get('ETag'):
+                    store.set_etag(url, resp.headers['ETag'])
+                if new_mark is None and resp.headers.get('Date'):
+                    new_mark = parsedate_to_datetime(resp.headers['Date']).strftime('%Y-%m-%dT%H:%M:%SZ')
+                page = resp.json()
+                # >= keeps PRs updated in the same second as the mark; the store dedups them
+                fresh = [p for p in page if p.get('updated_at') and p['updated_at'] >= high_water_mark]
+                changed.extend(fresh)
+                if len(fresh) < len(page):
+                    break
+                url = resp.links.get('next', {}).get('url')
+
+            if changed:
+                store.upsert(changed)
+                latest = max(p['updated_at'] for p in changed)
+                store.set_meta('updated_at', min(latest, new_mark) if new_mark else latest)
+            logger.info(
+                f"[{self.repo_full_name}] Incremental sync since {high_water_mark}: "
+                f"{len(changed)} PRs changed, {num_requests} requests ({num_not_modified} not modified)"
+            )
+            return store.all_pulls()
+        finally:
+            store.close()
+
     def _get_all_pulls_sequential(self) -> list:
         """Fallback: sequential pagination (original implementation)."""
         kwargs = {
@@ -951,12 +1150,19 @@ def get_with_retries(
     timeout: int = 15,
     proxy_rotator: ProxyRotator = None,
 ) -> str:
+    cache = get_http_cache()
+    cached = cache.get(url) if cache is not None else None
+    if cache is not None and cache.usable(cached):
+        return cached.text
+
     if token and not check_token_validity(token):
         logger.warning("Invalid GitHub token, aborting request.")
         return ""
 
     session = requests.Session()
     headers = {"Authorization": f"token {token}"} if token else {}
+    if cached is not None:
+        headers.update(cached.validators())
 
     retries = Retry(
         total=max_retries,
@@ -977,7 +1183,12 @@ def get_with_retries(
 
     try:
         response = session.get(url, headers=headers, timeout=timeout, proxies=proxies)
+        if response.status_code == 304 and cached is not None:
+            cache.revalidated(cached, response.headers)
+            return cached.text
         response.raise_for_status()
+        if cache is not None:
+            cache.put(url, None, response.headers, response.content)
         return response.text
     except Exception as e:
         logger.warning(f"Failed to fetch {url}: {e}")
@@ -994,67 +1205,10 @@ def extract_patches(pull: dict, repo: Repo) -> tuple[str, str, bool]:
         patch_change_str (str): gold patch
         patch_test_str (str): test patch
     """
-    # Convert diff to patch format with "index" lines removed
-    # patch = requests.get(pull["diff_url"]).text
     patch = get_with_retries(pull["diff_url"], repo.token, proxy_rotator=repo.proxy_rotator)
     if patch =='':
         return "", "", False
-    if patch.endswith("\n"):
-        patch = patch[:-1]
-    # Create change patch and test patch
-    patch_change, patch_test = [], []
-
-    # Flag to determine if current diff block is a test or general change
-    # Values: 'test', 'diff', None
-    flag = None
-
-    for line in patch.split("\n"):
-        # Exclude commit specific metadata
-        if line.startswith("index "):
-            continue
-        # Determine if current diff block is a test or general change
-        if line.startswith("diff --git a/"):
-            words = set(re.split(r" |_|\/|\.", line.lower()))
-            flag = (
-                "test"
-                if ("test" in words or "tests" in words or "testing" in words)
-                else "diff"
-            )
-            if repo.language == 'python':
-                if flag != "test" and not line.strip().endswith(".py"):
-                    flag = None
-            elif repo.language == 'js':
-                language = get_language_with_pygments(line.strip())
-                is_js = (language=='javascript' or language == 'typescript')
-                if  ('webpack' in repo.name or 'jest' in repo.name)  and line.strip().endswith(".json"):
-                    is_js = True
-
-                if flag != "test" and not is_js:
-                    flag = None
-            elif repo.language == 'java':
-                file_name = line.split("/")[-1]
-                if file_name.endswith(".java"):
-                    file_name.replace(".java", "")
-                    if(file_name.startswith("Test") or file_name.startswith("Tests") or file_name.endswith("Test") or file_name.endswith("Tests")):
-                        flag = "test"
-
-                language = get_language_with_pygments(line.strip())
-                is_java = (language=='java')
-                if  ( 'netty' in repo.name)  and (line.strip().endswith(".c") or line.strip().endswith("pom.xml")):
-                    is_java = True
-
-                if flag != "test" and not is_java:
-                    flag = None
-
-                
-        # Append line to separate patch depending on flag status
-        if flag == "test":
-            patch_test.append(line)
-        elif flag == "diff":
-            patch_change.append(line)
-
-    patch_change_str = "\n".join(patch_change) + "\n" if len(patch_change) > 0 else ""
-    patch_test_str = "\n".join(patch_test) + "\n" if len(patch_test) > 0 else ""
+    patch_change_str, patch_test_str = split_patch(patch, repo.language, repo.name)
     return patch_change_str, patch_test_str, True
 
 
@@ -1,10 +1,10 @@
 import hashlib
 import logging
 import os
-import re
 import asyncio
 import aiohttp
 import time
+from concurrent.futures import ProcessPoolExecutor
 from typing import Optional, Tuple
 from datetime import datetime
 
@@ -13,8 +13,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-from pygments.lexers import get_lexer_for_filename
-from pygments.util import ClassNotFound
+
+from diff_split import split_patch
+from github_client import get_github_client
+from http_cache import get_http_cache
 
 PR_KEYWORDS = {
     "close",
@@ -29,12 +31,17 @@ PR_KEYWORDS = {
 }
 
 
-def get_language_with_pygments(filename):
-    try:
-        lexer = get_lexer_for_filename(filename)
-        return lexer.name.lower()
-    except ClassNotFound:
-        return "Unknown"
+# diffs below this size are split inline, sending them to a worker process costs more
+SPLIT_IN_PROCESS_BYTES = 256 * 1024
+_split_pool = None
+
+
+def get_split_pool() -> ProcessPoolExecutor:
+    """The process pool that splits large diffs, created on first use."""
+    global _split_pool
+    if _split_pool is None:
+        _split_pool = ProcessPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+    return _split_pool
 
 
 class ProxyRotator:
@@ -144,7 +151,8 @@ class Repo:
         timeout: int = 30
     ) -> str:
         """
-        Async HTTP request with retry logic and proxy rotation.
+        Async HTTP request with retry logic and proxy rotation. Tokens and
+        concurrency are scheduled by the shared GitHubClient.
 
         Args:
             url (str): URL to fetch
@@ -155,8 +163,14 @@ class Repo:
             str: response text, empty string on failure
         """
         headers = {}
-        if self.token:
-            headers['Authorization'] = f'token {self.token}'
+        client = get_github_client(self.token, proxied=self.proxy_rotator.enabled)
+
+        cache = get_http_cache()
+        cached = cache.get(url) if cache is not None else None
+        if cache is not None and cache.usable(cached):
+            return cached.text
+        if cached is not None:
+            headers.update(cached.validators())
 
         retries = 0
         while retries < max_retries:
@@ -168,15 +182,30 @@ class Repo:
                 if proxies:
                     proxy = proxies.get('http')
 
+            request_token = await client.acquire_async()
+            request_headers = dict(headers)
+            if request_token:
+                request_headers['Authorization'] = f'token {request_token}'
+            released = False
             try:
                 async with self.session.get(
                     url,
-                    headers=headers,
+                    headers=request_headers,
                     proxy=proxy,
                     timeout=aiohttp.ClientTimeout(total=timeout)
                 ) as response:
+                    error_body = await response.text() if response.status in (403, 429) else ""
+                    client.release(request_token, response.status, response.headers, error_body)
+                    released = True
                     if response.status == 200:
+                        if cache is not None:
+                            body = await response.read()
+                            cache.put(url, None, response.headers, body)
+                            return body.decode(response.get_encoding(), errors="replace")
                         return await response.text()
+                    elif response.status == 304 and cached is not None:
+                        cache.revalidated(cached, response.headers)
+                        return cached.text
                     elif response.status == 403:
                         # Rate limit handling
                         remaining = response.headers.get('X-RateLimit-Remaining', '0')
@@ -187,11 +216,8 @@ class Repo:
                                 self.proxy_rotator.request_count = 0
                                 self.proxy_rotator.current_session_id = None
                                 await asyncio.sleep(1)
-                            else:
-                                reset_time = int(response.headers.get('X-RateLimit-Reset', time.time() + 60))
-                                sleep_time = max(reset_time - int(time.time()) + 1, 0)
-                                logger.warning(f'Rate limit exceeded. Sleeping for {sleep_time} seconds.')
-                                await asyncio.sleep(sleep_time)
+                        # otherwise the client moves to another token or waits for the reset;
+                        # on a secondary rate limit it pauses every request
                         retries += 1
                     elif response.status in [502, 503]:
                         wait_time = min(3 * (retries + 1), 15)
@@ -214,8 +240,7 @@ class Repo:
                             self.proxy_rotator.current_session_id = None
                             await asyncio.sleep(2)
                         else:
-                            logger.info(f'429 Too Many Requests. Sleeping for {retry_after}s')
-                            await asyncio.sleep(retry_after)
+                            logger.info(f'429 Too Many Requests, backing off for {retry_after}s')
                         retries += 1
                     elif response.status == 404:
                         logger.info(f"[{self.repo_name}] Resource not found: {url}")
@@ -237,6 +262,9 @@ class Repo:
                     self.proxy_rotator.current_session_id = None
                 await asyncio.sleep(wait_time)
                 retries += 1
+            finally:
+                if not released:
+                    client.release(request_token)
 
         logger.error(f"[{self.repo_name}] Failed to fetch {url} after {max_retries} retries")
         return ""
@@ -270,59 +298,14 @@ async def extract_patches(pull: dict, repo: Repo) -> Tuple[str, str, bool]:
     if patch == '':
         return "", "", False
 
-    if patch.endswith("\n"):
-        patch = patch[:-1]
-
-    # Create change patch and test patch
-    patch_change, patch_test = [], []
-    flag = None
-
-    for line in patch.split("\n"):
-        # Exclude commit specific metadata
-        if line.startswith("index "):
-            continue
-
-        # Determine if current diff block is a test or general change
-        if line.startswith("diff --git a/"):
-            words = set(re.split(r" |_|\/|\.", line.lower()))
-            flag = (
-                "test"
-                if ("test" in words or "tests" in words or "testing" in words)
-                else "diff"
-            )
-            if repo.language == 'python':
-                if flag != "test" and not line.strip().endswith(".py"):
-                    flag = None
-            elif repo.language == 'js':
-                language = get_language_with_pygments(line.strip())
-                is_js = (language == 'javascript' or language == 'typescript')
-                if ('webpack' in repo.name or 'jest' in repo.name) and line.strip().endswith(".json"):
-                    is_js = True
-                if flag != "test" and not is_js:
-                    flag = None
-            elif repo.language == 'java':
-                file_name = line.split("/")[-1]
-                if file_name.endswith(".java"):
-                    file_name = file_name.replace(".java", "")
-                    if (file_name.startswith("Test") or file_name.startswith("Tests") or
-                            file_name.endswith("Test") or file_name.endswith("Tests")):
-                        flag = "test"
-
-                language = get_language_with_pygments(line.strip())
-                is_java = (language == 'java')
-                if ('netty' in repo.name) and (line.strip().endswith(".c") or line.strip().endswith("pom.xml")):
-                    is_java = True
-                if flag != "test" and not is_java:
-                    flag = None
-
-        # Append line to separate patch depending on flag status
-        if flag == "test":
-            patch_test.append(line)
-        elif flag == "diff":
-            patch_change.append(line)
-
-    patch_change_str = "\n".join(patch_change) + "\n" if len(patch_change) > 0 else ""
-    patch_test_str = "\n".join(patch_test) + "\n" if len(patch_test) > 0 else ""
+    if len(patch) < SPLIT_IN_PROCESS_BYTES:
+        patch_change_str, patch_test_str = split_patch(patch, repo.language, repo.name)
+    else:
+        # large (vendored) diffs are split off the event loop
+        loop = asyncio.get_running_loop()
+        patch_change_str, patch_test_str = await loop.run_in_executor(
+            get_split_pool(), split_patch, patch, repo.language, repo.name
+        )
     return patch_change_str, patch_test_str, True
 
 
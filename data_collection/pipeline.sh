@@ -13,6 +13,9 @@
 #   bash pipeline.sh --language Java --top_n 100 --skip-fetch-repos
 #   bash pipeline.sh --language Python --top_n 100 --start-from 10 --end-at 20
 #
+# To run the steps of many repos at the same time, with completion markers so that
+# re-runs skip finished steps, use collect/pipeline.py instead.
+#
 set -euo pipefail
 
 # ============================================================
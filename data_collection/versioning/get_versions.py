@@ -8,6 +8,7 @@ from constants import (
     MAP_REPO_TO_VERSION_PATTERNS,
 )
 from utils import get_instances, split_instances,get_version_by_git,clone_repo_and_checkout
+from git_versions import TagIndex, clone_shared, ensure_repo_cache, read_files
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -63,7 +64,7 @@ def _find_version_in_text(text: str, instance: dict) -> str:
             return str(matches.group(1)).replace(" ", "")
 
 
-def get_version(instance, is_build=False, path_repo=None):
+def get_version(instance, is_build=False, path_repo=None, version_files=None):
     """
     Function for looking up the version of a task instance.
 
@@ -72,12 +73,14 @@ def get_version(instance, is_build=False, path_repo=None):
     looking for the version according to a predefined list of paths.
 
     Otherwise, the version is looked up by searching GitHub at the instance's
-    base commit for the version according to a predefined list of paths.
+    base commit for the version according to a predefined list of paths, or in
+    `version_files` if those files were already read from a local clone.
 
     Args:
         instance (dict): Instance to find version for
         is_build (bool): Whether to build the repo and look for the version
         path_repo (str): Path to repo to build
+        version_files (dict): Map of version path to file text at the base commit
     Returns:
         str: Version text, if found
     """
@@ -96,6 +99,10 @@ def get_version(instance, is_build=False, path_repo=None):
                 logger.info(f"Found version file at {path_to_version}")
                 with open(path_to_version) as f:
                     init_text = f.read()
+        elif version_files is not None:
+            init_text = version_files.get(path_to_version)
+            if init_text is None:
+                continue
         else:
             url = os.path.join(
                 SWE_BENCH_URL_RAW,
@@ -149,6 +156,28 @@ def map_version_to_task_instances(task_instances: list) -> dict:
     return return_map
 
 
+def versions_from_tag_index(data_tasks: list, git_dir: str) -> list:
+    """
+    Set the version of instances from the nearest release tag of their base
+    commit in the repo's TagIndex.
+
+    Returns:
+        list: Instances the index could not version, for the slower lookups
+    """
+    index = TagIndex(git_dir)
+    versions = index.versions([instance["base_commit"] for instance in data_tasks])
+    index.save()
+    remaining = []
+    for instance in data_tasks:
+        version = versions.get(instance["base_commit"])
+        if version:
+            instance["version"] = version
+            logger.info(f'For instance {instance["instance_id"]}, version is {version} (tag index)')
+        else:
+            remaining.append(instance)
+    return remaining
+
+
 def get_versions_from_build(data: dict):
     """
     Logic for looking up versions by building the repo at the instance's base
@@ -238,7 +267,39 @@ def get_versions_from_web(data: dict):
         json.dump(data_tasks, fp=f)
 
 
-def merge_results(instances_path: str, repo_prefix: str, output_dir: str = None) -> int:
+def get_versions_from_git(data: dict):
+    """
+    Logic for looking up versions in the version files of a local clone, read
+    for all instances at once with `git cat-file --batch` instead of one GitHub
+    request per file.
+
+    Args:
+        data (dict): Dictionary with the task instances of one repo, the path
+            of its clone and the save path
+    """
+    data_tasks, git_dir, save_path = data["data_tasks"], data["git_dir"], data["save_path"]
+    version_not_found = data["not_found_list"]
+    if not data_tasks:
+        return
+    paths_to_version = MAP_REPO_TO_VERSION_PATHS[data_tasks[0]["repo"]]
+    files = read_files(
+        git_dir,
+        [(instance["base_commit"], path) for instance in data_tasks for path in paths_to_version],
+    )
+    for instance in data_tasks:
+        version_files = {path: files.get((instance["base_commit"], path)) for path in paths_to_version}
+        version = get_version(instance, version_files=version_files)
+        if version is not None:
+            instance["version"] = version
+            logger.info(f'For instance {instance["instance_id"]}, version is {version}')
+        elif version_not_found is not None:
+            logger.info(f'[{instance["instance_id"]}]: version not found')
+            version_not_found.append(instance)
+    with open(save_path, "w") as f:
+        json.dump(data_tasks, fp=f)
+
+
+def merge_results(instances_path: str, repo_prefix: str, output_dir: str = None, tag_index: str = None) -> int:
     """
     Helper function for merging JSON/JSONL result files generated from multiple threads.
 
@@ -246,6 +307,7 @@ def merge_results(instances_path: str, repo_prefix: str, output_dir: str = None)
         instances_path (str): Path to original task instances without versions
         repo_prefix (str): Prefix of result files (repo name)
         output_dir (str): Path to save merged results to
+        tag_index (str): Clone whose TagIndex versions the instances left without one
     Returns:
         int: Number of instances in merged results
     """
@@ -256,7 +318,7 @@ def merge_results(instances_path: str, repo_prefix: str, output_dir: str = None)
 
     # 2. merge
     merged = []
-    dropped = 0
+    unversioned = []
     for path in glob.glob(f"{repo_prefix}_versions_*.json"):
         with open(path, encoding="utf-8") as f:
             data = json.load(f)
@@ -264,8 +326,13 @@ def merge_results(instances_path: str, repo_prefix: str, output_dir: str = None)
             if inst.get("version"):
                 merged.append(inst)
             else:
-                dropped += 1
+                unversioned.append(inst)
         os.remove(path)
+    if tag_index and unversioned:
+        remaining = versions_from_tag_index(unversioned, tag_index)
+        merged.extend(inst for inst in unversioned if inst.get("version"))
+        unversioned = remaining
+    dropped = len(unversioned)
 
     # 3. construct output path
     base = os.path.splitext(os.path.basename(instances_path))[0]
@@ -308,8 +375,39 @@ def main(args):
         logger.info("No patterns defined to extract version")
         return
 
+    git_dir = ensure_repo_cache(data_tasks[0]["repo"], args.git_cache) if args.git_cache else None
+    tag_index = git_dir if args.tag_index else None
+    remaining_tasks = data_tasks
+    if tag_index and any([x == args.retrieval_method for x in ["github", "mix"]]):
+        # Take versions from the nearest release tag first, search version files for the rest
+        remaining_tasks = versions_from_tag_index(data_tasks, tag_index)
+        with open(f"{repo_prefix}_versions_index.json", "w") as f:
+            json.dump([x for x in data_tasks if x.get("version")], fp=f)
+        data_task_lists = split_instances(remaining_tasks, args.num_workers) if remaining_tasks else []
+        logger.info(f"Versioned {len(data_tasks) - len(remaining_tasks)} instances from the tag index")
+
+    # With a local clone, read the version files of all instances from git in one pass
+    if args.git_cache and any([x == args.retrieval_method for x in ["github", "mix"]]):
+        not_found = [] if args.retrieval_method == "mix" else None
+        get_versions_from_git(
+            {
+                "data_tasks": remaining_tasks,
+                "git_dir": git_dir,
+                "save_path": f"{repo_prefix}_versions_0.json"
+                if args.retrieval_method == "github"
+                else f"{repo_prefix}_versions_0_web.json",
+                "not_found_list": not_found,
+            }
+        )
+        if args.retrieval_method == "github":
+            merge_results(args.instances_path, repo_prefix, args.output_dir, tag_index)
+            return
+        total_web = len(data_tasks) - len(not_found)
+        logger.info(f"Retrieved {total_web} versions from git")
+        data_task_lists = split_instances(not_found, args.num_workers)
+
     # If retrieval method includes GitHub, then search GitHub for versions via parallel call
-    if any([x == args.retrieval_method for x in ["github", "mix"]]):
+    elif any([x == args.retrieval_method for x in ["github", "mix"]]):
         manager = Manager()
         shared_result_list = manager.list()
         pool = Pool(processes=args.num_workers)
@@ -334,7 +432,7 @@ def main(args):
         if args.retrieval_method == "github":
             # If retrieval method is just GitHub, then merge results and return
             merge_results(
-                args.instances_path, repo_prefix, args.output_dir
+                args.instances_path, repo_prefix, args.output_dir, tag_index
             )
             return
         elif args.retrieval_method == "mix":
@@ -353,6 +451,7 @@ def main(args):
     conda_exec = os.path.join(args.path_conda, "bin/conda")
 
     cwd = os.getcwd()
+    git_dir = os.path.abspath(git_dir) if git_dir else None
     os.chdir(args.testbed)
     for x in range(0, args.num_workers):
         # Clone git repo per thread
@@ -361,10 +460,14 @@ def main(args):
             logger.info(
                 f"Creating clone of {data_tasks[0]['repo']} at {testbed_repo_name}"
             )
-            cmd_clone = (
-                f"git clone git@github.com:swe-bench/{repo_prefix} {testbed_repo_name}"
-            )
-            subprocess.run(cmd_clone, shell=True, check=True, stdout=subprocess.DEVNULL)
+            if git_dir:
+                # borrows the objects of the --git_cache mirror instead of cloning again
+                clone_shared(git_dir, testbed_repo_name)
+            else:
+                cmd_clone = (
+                    f"git clone git@github.com:swe-bench/{repo_prefix} {testbed_repo_name}"
+                )
+                subprocess.run(cmd_clone, shell=True, check=True, stdout=subprocess.DEVNULL)
         else:
             logger.info(
                 f"Repo for {data_tasks[0]['repo']} exists: {testbed_repo_name}; skipping..."
@@ -441,5 +544,9 @@ if __name__ == "__main__":
     parser.add_argument("--num_workers", type=int, default=1, help="Number of threads to use")
     parser.add_argument("--output_dir", type=str, default=None, help="Path to save results")
     parser.add_argument("--testbed", type=str, default=None, help="Path to testbed repo")
+    parser.add_argument("--git_cache", type=str, default=None, help="Mirror store of repo clones: read version files from the mirror instead of GitHub, and make the build testbed clones from it")
+    parser.add_argument("--tag_index", action="store_true", help="Version instances from the nearest release tag in the --git_cache clone first, and search version files only for the rest")
     args = parser.parse_args()
+    if args.tag_index and not args.git_cache:
+        parser.error("--tag_index needs --git_cache")
     main(args)
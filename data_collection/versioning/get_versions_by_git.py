@@ -1,43 +1,12 @@
 #!/usr/bin/env python3
 import os
-import shutil
-import subprocess
-import re
 import json
 import argparse
-from contextlib import contextmanager
 from typing import List, Dict
 from concurrent.futures import ProcessPoolExecutor, as_completed
 import glob
-@contextmanager
-def cd(newdir):
-    prevdir = os.getcwd()
-    os.chdir(os.path.expanduser(newdir))
-    try:
-        yield
-    finally:
-        os.chdir(prevdir)
-
-
-def run_command(cmd: List[str], **kwargs) -> subprocess.CompletedProcess:
-    try:
-        return subprocess.run(cmd, check=True, **kwargs)
-    except subprocess.CalledProcessError as e:
-        print(f"Error running command: {cmd}, {e}")
-        raise
-
 
-def get_version_by_git(cloned_dir: str) -> str:
-    if not os.path.isdir(cloned_dir):
-        raise NotADirectoryError(f"Invalid directory: {cloned_dir}")
-    with cd(cloned_dir):
-        result = run_command(["git", "describe", "--tags"], capture_output=True, text=True)
-        version = result.stdout.strip()
-        print(f"✔️ Current version: {version}")
-        match = re.search(r"(\d+\.\d+)(?:\.\d+)?", version)
-        if match:
-            return match.group(1)
-        raise RuntimeError(f"Unrecognized version: {version}")
+from git_versions import ensure_repo_cache, resolve_versions
 
 
 def get_instances(instance_path: str) -> List[Dict]:
@@ -49,56 +18,51 @@ def get_instances(instance_path: str) -> List[Dict]:
 
 
 def prepare_repo_cache(tasks: List[Dict], cache_dir: str) -> Dict[str, str]:
-    os.makedirs(cache_dir, exist_ok=True)
     repo_cache = {}
     for task in tasks:
         repo = task["repo"]
         if repo in repo_cache:
             continue
-        repo_url = f"https://github.com/{repo}.git"
-        local_path = os.path.join(cache_dir, repo.replace("/", "__"))
         try:
-            run_command(["git", "clone", repo_url, local_path], capture_output=True)
-            repo_cache[repo] = local_path
+            repo_cache[repo] = ensure_repo_cache(repo, cache_dir)
             print(f"✅ Cached repo: {repo}")
         except Exception as e:
             print(f"❌ Failed to clone {repo}: {e}")
     return repo_cache
 
 
-def process_repo_task(task: Dict, testbed: str, repo_cache: Dict[str, str]) -> Dict | None:
-    instance_id = task["instance_id"]
-    repo = task["repo"]
-    base_commit = task["base_commit"]
-    repo_dir = os.path.join(testbed, instance_id)
-    os.makedirs(repo_dir, exist_ok=True)
-    try:
-        cached_repo = repo_cache.get(repo)
-        if not cached_repo or not os.path.exists(cached_repo):
-            raise RuntimeError(f"Missing cached repo for {repo}")
-        shutil.copytree(cached_repo, repo_dir, dirs_exist_ok=True)
-        with cd(repo_dir):
-            run_command(["git", "checkout", base_commit], capture_output=True)
-        version = get_version_by_git(repo_dir)
+def process_repo_tasks(tasks: List[Dict], git_dir: str) -> List[Dict]:
+    """Version all tasks of one repo with a bulk `git describe` against its cached clone."""
+    results = []
+    versions = resolve_versions(tasks, git_dir)
+    for task in tasks:
+        version = versions.get(task["instance_id"])
+        if version is None:
+            print(f"❌ Failed: {task['instance_id']} | no version tag reachable from {task['base_commit']}")
+            continue
         result = task.copy()
         result["version"] = version
-        return result
-    except Exception as e:
-        print(f"❌ Failed: {instance_id} | {e}")
-        return None
-    finally:
-        shutil.rmtree(repo_dir, ignore_errors=True)
+        results.append(result)
+    return results
 
 
 def process_repos(tasks: List[Dict], testbed: str, repo_cache: Dict[str, str], max_workers: int = 4) -> List[Dict]:
-    os.makedirs(testbed, exist_ok=True)
+    tasks_by_repo = {}
+    for t in tasks:
+        tasks_by_repo.setdefault(t["repo"], []).append(t)
     results = []
     with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(process_repo_task, t, testbed, repo_cache) for t in tasks]
+        futures = {}
+        for repo, repo_tasks in tasks_by_repo.items():
+            if repo not in repo_cache:
+                print(f"❌ Missing cached repo for {repo}, skipping {len(repo_tasks)} tasks")
+                continue
+            futures[executor.submit(process_repo_tasks, repo_tasks, repo_cache[repo])] = repo
         for future in as_completed(futures):
-            res = future.result()
-            if res:
-                results.append(res)
+            try:
+                results.extend(future.result())
+            except Exception as e:
+                print(f"❌ Failed: {futures[future]} | {e}")
     return results
 
 
@@ -136,7 +100,7 @@ def main():
     parser.add_argument("--instance_path", "-i", type=str, required=True,
                         help="Path to input task file (.json or .jsonl)")
     parser.add_argument("--testbed", "-t", type=str, default="testbed",
-                        help="Temp working directory for cloning repos")
+                        help="Directory holding the repo cache (<testbed>/_cache)")
     parser.add_argument("--max_workers", "-w", type=int, default=10,
                         help="Number of parallel workers")
     parser.add_argument("--output_dir", "-d", type=str, default=None,
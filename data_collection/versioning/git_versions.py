@@ -0,0 +1,348 @@
+"""
+Checkout-free version lookups against a cached clone of each repository.
+
+Instead of copying the cached repo and checking out every base commit, all the
+base commits of a repo are described with one `git describe --tags` call per
+chunk of commits, and version files are read with a single `git cat-file --batch`
+process. Neither needs a working tree, so the cache can be a bare clone.
+
+The cache directory is a mirror store shared by all stages: each repo is cloned
+once with `git clone --mirror` to `<cache_dir>/<owner>__<name>.git` and refreshed
+with `git fetch`. Working trees (testbed clones, SWE-Builder repo caches) are made
+with `git clone --shared`, so they borrow the mirror's objects instead of
+downloading them again. Processes coordinate through `<mirror>.lock`: creating and
+fetching a mirror take it exclusively, making a clone of it takes it shared.
+Mirrors are never garbage collected, since the clones refer to their objects.
+"""
+
+import fcntl
+import json
+import os
+import re
+import shutil
+import subprocess
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# same major.minor extraction as get_version_by_git
+VERSION_PATTERN = re.compile(r"(\d+\.\d+)(?:\.\d+)?")
+# commits per `git describe` invocation, bounded by the command-line length
+DESCRIBE_CHUNK = 256
+# a mirror fetched less than this many seconds ago is not fetched again
+MIRROR_MAX_AGE = 600
+
+
+def git(git_dir: str, *args: str, **kwargs) -> subprocess.CompletedProcess:
+    return subprocess.run(["git", "-C", git_dir, *args], check=True, capture_output=True, **kwargs)
+
+
+def mirror_path(cache_dir: str, repo: str) -> str:
+    return os.path.join(cache_dir, repo.replace("/", "__") + ".git")
+
+
+@contextmanager
+def mirror_lock(git_dir: str, shared: bool = False):
+    """Hold `<git_dir>.lock`, shared for readers and exclusive for clones and fetches."""
+    with open(f"{git_dir.rstrip('/')}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def is_mirror(git_dir: str) -> bool:
+    result = subprocess.run(["git", "-C", git_dir, "config", "--get", "remote.origin.mirror"],
+                            capture_output=True, text=True)
+    return result.stdout.strip() == "true"
+
+
+def ensure_repo_cache(repo: str, cache_dir: str) -> str:
+    """
+    Return the mirror of `repo` in cache_dir, cloning it if needed. Clones from
+    earlier runs at `cache_dir/owner__name` are reused as they are.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    legacy_path = os.path.join(cache_dir, repo.replace("/", "__"))
+    if os.path.isdir(legacy_path):
+        return legacy_path
+    path = mirror_path(cache_dir, repo)
+    if os.path.isdir(path):
+        return path
+    with mirror_lock(path):
+        # another process may have cloned it while this one waited for the lock
+        if not os.path.isdir(path):
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            subprocess.run(
+                ["git", "clone", "--mirror", "--quiet", f"https://github.com/{repo}.git", tmp_path],
+                check=True, capture_output=True,
+            )
+            git(tmp_path, "config", "gc.auto", "0")
+            git(tmp_path, "config", "maintenance.auto", "false")
+            # marks the time of the last fetch
+            open(os.path.join(tmp_path, "FETCH_HEAD"), "w").close()
+            os.rename(tmp_path, path)
+    return path
+
+
+def clone_shared(git_dir: str, dest: str) -> None:
+    """Make a working clone of a cached repo at dest that borrows its objects."""
+    with mirror_lock(git_dir, shared=True):
+        subprocess.run(["git", "clone", "--shared", "--quiet", os.path.abspath(git_dir), dest],
+                       check=True, capture_output=True)
+
+
+def missing_objects(git_dir: str, revs: Iterable[str]) -> set:
+    """Revisions that do not name an object in the repository."""
+    revs = list(dict.fromkeys(revs))
+    if not revs:
+        return set()
+    out = git(git_dir, "cat-file", "--batch-check", input="\n".join(revs) + "\n", text=True).stdout
+    return {rev for rev, line in zip(revs, out.splitlines()) if line.endswith(" missing")}
+
+
+def update_repo_cache(git_dir: str) -> None:
+    """Fetch new branches and tags, for base commits newer than the cache."""
+    if not is_mirror(git_dir):
+        git(git_dir, "fetch", "--quiet", "--tags", "origin", "+refs/heads/*:refs/remotes/origin/*")
+        return
+    with mirror_lock(git_dir):
+        fetch_head = os.path.join(git_dir, "FETCH_HEAD")
+        # workers that miss the same commits fetch once between them
+        if os.path.exists(fetch_head) and time.time() - os.path.getmtime(fetch_head) < MIRROR_MAX_AGE:
+            return
+        git(git_dir, "fetch", "--quiet", "--prune", "origin")
+
+
+def describe_commits(git_dir: str, commits: Iterable[str], fetch_missing: bool = True) -> Dict[str, Optional[str]]:
+    """
+    Equivalent of `git describe --tags` at each commit, for many commits at once.
+
+    Returns:
+        commit -> describe output, or None when the commit is unknown or no tag
+        is reachable from it
+    """
+    commits = list(dict.fromkeys(commits))
+    missing = missing_objects(git_dir, commits)
+    if missing and fetch_missing:
+        try:
+            update_repo_cache(git_dir)
+        except subprocess.CalledProcessError as e:
+            print(f"⚠️ Failed to update {git_dir}: {e.stderr.decode(errors='replace').strip()}")
+        missing = missing_objects(git_dir, missing)
+
+    result = {commit: None for commit in commits}
+    present = [c for c in commits if c not in missing]
+    for start in range(0, len(present), DESCRIBE_CHUNK):
+        chunk = present[start:start + DESCRIBE_CHUNK]
+        # --always keeps one output line per commit; an abbreviated hash means no tag
+        out = git(git_dir, "describe", "--tags", "--always", *chunk, text=True).stdout.splitlines()
+        for commit, line in zip(chunk, out):
+            line = line.strip()
+            if line and not commit.startswith(line):
+                result[commit] = line
+    return result
+
+
+def version_from_describe(describe: Optional[str]) -> Optional[str]:
+    """major.minor from a describe string such as v3.6.7-21-gabc1234."""
+    if not describe:
+        return None
+    match = VERSION_PATTERN.search(describe)
+    return match.group(1) if match else None
+
+
+def read_files(git_dir: str, specs: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Optional[str]]:
+    """
+    Read many files at given commits through one `git cat-file --batch` process.
+
+    Args:
+        specs: (commit, path) pairs
+    Returns:
+        (commit, path) -> file text, or None if the file does not exist there
+    """
+    specs = list(dict.fromkeys(specs))
+    if not specs:
+        return {}
+    requests = "".join(f"{commit}:{path}\n" for commit, path in specs).encode()
+    out = git(git_dir, "cat-file", "--batch", input=requests).stdout
+
+    files = {}
+    pos = 0
+    for spec in specs:
+        end = out.index(b"\n", pos)
+        header = out[pos:end].decode(errors="replace")
+        pos = end + 1
+        parts = header.split()
+        if len(parts) != 3 or parts[1] not in ("blob", "tree", "commit", "tag"):
+            # "<rev> missing" / "<rev> ambiguous"
+            files[spec] = None
+            continue
+        size = int(parts[2])
+        content = out[pos:pos + size]
+        pos += size + 1
+        files[spec] = content.decode("utf-8", errors="replace") if parts[1] == "blob" else None
+    return files
+
+
+def resolve_versions(tasks: List[Dict], git_dir: str) -> Dict[str, Optional[str]]:
+    """
+    Versions of all tasks of one repo from the nearest tag of their base commit,
+    looked up in the repo's TagIndex, with `git describe --tags` for commits the
+    index does not know.
+
+    Returns:
+        instance_id -> major.minor, or None if it cannot be determined
+    """
+    index = TagIndex(git_dir)
+    commits = [t["base_commit"] for t in tasks]
+    versions = index.versions(commits)
+    misses = [c for c in commits if c not in versions]
+    if misses:
+        described = describe_commits(git_dir, misses)
+        versions.update({c: version_from_describe(d) for c, d in described.items()})
+    index.save()
+    return {t["instance_id"]: versions.get(t["base_commit"]) for t in tasks}
+
+
+def _version_key(tag: str) -> tuple:
+    return tuple(int(n) for n in re.findall(r"\d+", tag))
+
+
+class TagIndex:
+    """
+    Per-repo index from commits to the nearest reachable release tag.
+
+    The index maps each tag whose name holds a version to its commit, and each
+    tagged commit to its generation: 1 + the largest generation of its parents.
+    The nearest tag of a commit is its own tag, or else the nearest tag of its
+    parents with the highest generation. This is memoized for every commit
+    walked, so instances of one repo share the walk, and on linear history it
+    matches `git describe --tags` (tags without a version in their name are
+    ignored instead of being described as unrecognized). The tags and the answers for looked-up
+    commits are saved next to the repo cache, so a later run answers them
+    without reading the commit graph.
+    """
+
+    def __init__(self, git_dir: str, path: Optional[str] = None):
+        self.git_dir = git_dir
+        self.path = path or git_dir.rstrip("/") + ".tagindex.json"
+        self.tags = {}
+        self.generation = {}
+        self.nearest = {}
+        self.parents = None
+        self._queried = set()
+        self.dirty = False
+        self._load()
+
+    def _read_tags(self) -> Dict[str, str]:
+        out = git(self.git_dir, "for-each-ref", "refs/tags",
+                  "--format=%(refname:strip=2) %(objectname) %(*objectname)", text=True).stdout
+        tags = {}
+        for line in out.splitlines():
+            parts = line.split()
+            if len(parts) < 2 or not VERSION_PATTERN.search(parts[0]):
+                continue
+            # annotated tags are peeled to the tagged commit
+            tags[parts[0]] = parts[2] if len(parts) > 2 else parts[1]
+        return tags
+
+    def _load(self) -> None:
+        tags = self._read_tags()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    saved = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                saved = {}
+            # a new or moved tag can change the answer for old commits
+            if saved.get("tags") == tags:
+                self.generation = saved.get("generation", {})
+                self.nearest = saved.get("nearest", {})
+                self._queried.update(self.nearest)
+        self.tags = tags
+        self.dirty = not self.nearest
+        self.tags_at = {}
+        for tag, commit in tags.items():
+            best = self.tags_at.get(commit)
+            if best is None or _version_key(tag) > _version_key(best):
+                self.tags_at[commit] = tag
+
+    def _load_graph(self) -> None:
+        """Read the commit graph, parents before children, and number the generations."""
+        out = git(self.git_dir, "rev-list", "--all", "--topo-order", "--reverse", "--parents", text=True).stdout
+        self.parents = {}
+        generation = {}
+        for line in out.splitlines():
+            commit, *parents = line.split()
+            self.parents[commit] = parents
+            generation[commit] = 1 + max((generation.get(p, 0) for p in parents), default=0)
+        self.generation = {commit: generation[commit] for commit in self.tags_at if commit in generation}
+        self.dirty = True
+
+    def _better(self, a: Optional[str], b: Optional[str]) -> Optional[str]:
+        if a is None or b is None:
+            return a or b
+        ga, gb = self.generation.get(self.tags[a], 0), self.generation.get(self.tags[b], 0)
+        if ga != gb:
+            return a if ga > gb else b
+        return a if _version_key(a) >= _version_key(b) else b
+
+    def lookup(self, commit: str) -> Tuple[bool, Optional[str]]:
+        """(whether the commit is in the repo, its nearest release tag or None)."""
+        if commit in self.nearest:
+            return True, self.nearest[commit]
+        if self.parents is None:
+            self._load_graph()
+        if commit not in self.parents:
+            return False, None
+        # iterative post-order walk down to tagged or already answered commits
+        memo = self.nearest
+        stack = [commit]
+        while stack:
+            current = stack[-1]
+            if current in memo:
+                stack.pop()
+                continue
+            if current in self.tags_at:
+                memo[current] = self.tags_at[current]
+                stack.pop()
+                continue
+            pending = [p for p in self.parents.get(current, []) if p not in memo]
+            if pending:
+                stack.extend(pending)
+                continue
+            best = None
+            for p in self.parents.get(current, []):
+                best = self._better(best, memo[p])
+            memo[current] = best
+            stack.pop()
+        self.dirty = True
+        return True, memo[commit]
+
+    def versions(self, commits: Iterable[str]) -> Dict[str, Optional[str]]:
+        """commit -> major.minor of its nearest release tag; unknown commits are left out."""
+        result = {}
+        for commit in dict.fromkeys(commits):
+            found, tag = self.lookup(commit)
+            if found:
+                result[commit] = version_from_describe(tag)
+        self._queried.update(result)
+        return result
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        state = {
+            "tags": self.tags,
+            "generation": self.generation,
+            # only commits that were asked for; the rest of the walk is cheap to redo
+            "nearest": {c: self.nearest[c] for c in self._queried if c in self.nearest},
+        }
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
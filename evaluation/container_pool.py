@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import docker
+from docker.models.containers import Container
+
+from docker_build import build_instance_image_one_stage
+from docker_utils import cleanup_container, remove_image
+from test_spec import TestSpec
+
+# Files written by the harness outside of /testbed
+HARNESS_FILES = ["/tmp/patch.diff", "/eval.sh"]
+# Marker created when a pooled container starts; /tmp entries newer than it are removed on reset
+POOL_MARKER = "/root/.container_pool_marker"
+
+
+@dataclass
+class PooledContainer:
+    container: Container
+    image_key: str
+    created_at: float
+    head: str
+    # untracked paths of /testbed present when the container started (e.g. *.egg-info)
+    preserved: list[str] = field(default_factory=list)
+    uses: int = 0
+
+
+class ContainerPool:
+    """
+    Per-image pool of started containers that are reset and reused between instances
+    instead of being created, stopped and removed for every run.
+
+    Reset protocol (run when a container is returned):
+        git reset --hard <HEAD at start> && git clean -fdx in /testbed, keeping the
+        untracked files the image already had, then removal of the harness files and of
+        /tmp entries created since the container started.
+
+    Containers are discarded instead of reused when the reset fails, when they are
+    older than `ttl` seconds, or when `size` idle containers of the image are already
+    pooled. Stopping and removing containers runs on a background thread pool.
+    """
+
+    def __init__(
+            self,
+            client: docker.DockerClient,
+            run_id: str,
+            size: int = 2,
+            ttl: int = 1800,
+            reaper_workers: int = 4,
+        ):
+        self.client = client
+        self.run_id = run_id
+        self.size = size
+        self.ttl = ttl
+        self.idle: dict[str, list[PooledContainer]] = {}
+        self.in_use: dict[str, PooledContainer] = {}
+        self.lock = threading.Lock()
+        self.reaper = ThreadPoolExecutor(max_workers=reaper_workers, thread_name_prefix="container-reaper")
+        self.closed = False
+        self.stats = {"created": 0, "reused": 0, "discarded": 0, "reset_failed": 0}
+
+    def acquire(
+            self,
+            test_spec: TestSpec,
+            logger,
+            build_dir: Path,
+            force_rebuild: bool = False,
+            nocache: bool = False,
+        ) -> Container:
+        """
+        Check out a started container of the instance image of `test_spec`,
+        building the image if needed.
+        """
+        image_key = test_spec.instance_image_key
+        while True:
+            with self.lock:
+                idle = self.idle.get(image_key) or []
+                entry = idle.pop() if idle else None
+                if force_rebuild and entry is not None:
+                    # a forced rebuild must not run on a container of the old image
+                    self.idle[image_key] = []
+                    stale = [entry] + idle
+                    entry = None
+                else:
+                    stale = []
+            for old in stale:
+                self._discard(old)
+            if entry is None:
+                break
+            if self._expired(entry):
+                self._discard(entry)
+                continue
+            entry.uses += 1
+            with self.lock:
+                self.stats["reused"] += 1
+                self.in_use[entry.container.id] = entry
+            logger.info(f"Reusing pooled container {entry.container.name} (use {entry.uses}).")
+            return entry.container
+
+        if force_rebuild and not test_spec.image_name:
+            remove_image(self.client, image_key, "quiet")
+        build_instance_image_one_stage(test_spec, self.client, logger, nocache, build_dir)
+        logger.info(f"Creating pooled container for {test_spec.instance_id}...")
+        container = self.client.containers.create(
+            image=image_key,
+            name=f"{test_spec.get_instance_container_name(self.run_id)}-pool-{uuid.uuid4().hex[:8]}",
+            user="root",
+            detach=True,
+            command="tail -f /dev/null",
+            platform=test_spec.platform,
+        )
+        try:
+            container.start()
+            entry = self._record_initial_state(container, image_key)
+        except Exception:
+            self.reaper.submit(cleanup_container, self.client, container, "quiet")
+            raise
+        entry.uses = 1
+        with self.lock:
+            self.stats["created"] += 1
+            self.in_use[container.id] = entry
+        logger.info(f"Pooled container for {test_spec.instance_id} started: {container.id}")
+        return container
+
+    def release(self, container: Container | None, logger, reusable: bool = True, wait: bool = False) -> None:
+        """
+        Return a container checked out with acquire. It is reset and pooled if
+        `reusable`, otherwise (e.g. after a timeout) it is removed in the background,
+        or before returning if `wait` is set.
+        """
+        if container is None:
+            return
+        with self.lock:
+            entry = self.in_use.pop(container.id, None)
+        if entry is None:
+            if wait:
+                cleanup_container(self.client, container, logger)
+            else:
+                self.reaper.submit(cleanup_container, self.client, container, "quiet")
+            return
+        if not reusable or self.closed or self._expired(entry):
+            self._discard(entry, logger if wait else None)
+            return
+        if not self._reset(entry, logger):
+            with self.lock:
+                self.stats["reset_failed"] += 1
+            self._discard(entry)
+            return
+        with self.lock:
+            idle = self.idle.setdefault(entry.image_key, [])
+            if len(idle) < self.size and not self.closed:
+                idle.append(entry)
+                return
+        self._discard(entry)
+
+    def evict_image(self, image_key: str, logger) -> None:
+        """
+        Remove all idle containers of an image before returning, e.g. before the
+        image is removed.
+        """
+        with self.lock:
+            entries = self.idle.pop(image_key, [])
+        for entry in entries:
+            self._discard(entry, logger)
+
+    def close(self) -> None:
+        """Remove all pooled containers and wait for pending removals."""
+        with self.lock:
+            self.closed = True
+            entries = [e for idle in self.idle.values() for e in idle]
+            entries.extend(self.in_use.values())
+            self.idle = {}
+            self.in_use = {}
+        for entry in entries:
+            self._discard(entry)
+        self.reaper.shutdown(wait=True)
+        print(f"Container pool: {self.stats}")
+
+    def _expired(self, entry: PooledContainer) -> bool:
+        return self.ttl > 0 and time.time() - entry.created_at > self.ttl
+
+    def _discard(self, entry: PooledContainer, logger=None) -> None:
+        """Remove a container in the background, or right away (logging to `logger`) if a logger is given."""
+        with self.lock:
+            self.stats["discarded"] += 1
+        if logger is not None:
+            cleanup_container(self.client, entry.container, logger)
+        else:
+            self.reaper.submit(cleanup_container, self.client, entry.container, "quiet")
+
+    def _record_initial_state(self, container: Container, image_key: str) -> PooledContainer:
+        val = container.exec_run(
+            ["/bin/bash", "-c", f"touch {POOL_MARKER} && git rev-parse HEAD && git ls-files --others --directory"],
+            workdir="/testbed",
+            user="root",
+        )
+        lines = val.output.decode("utf-8", errors="replace").splitlines()
+        if val.exit_code != 0 or not lines:
+            raise RuntimeError(f"Cannot record the state of /testbed in {container.name}")
+        return PooledContainer(
+            container=container,
+            image_key=image_key,
+            created_at=time.time(),
+            head=lines[0].strip(),
+            preserved=[line for line in lines[1:] if line],
+        )
+
+    def _reset(self, entry: PooledContainer, logger) -> bool:
+        container = entry.container
+        # -e patterns still apply with -x, so the untracked files of the image survive
+        excludes = [f"--exclude=/{path}" for path in entry.preserved]
+        steps = [
+            ["git", "reset", "-q", "--hard", entry.head],
+            ["git", "clean", "-fdxq", *excludes],
+            ["/bin/bash", "-c",
+             f"rm -rf {' '.join(HARNESS_FILES)}; "
+             f"find /tmp -mindepth 1 -newer {POOL_MARKER} -exec rm -rf {{}} + 2>/dev/null; true"],
+        ]
+        try:
+            for cmd in steps:
+                val = container.exec_run(cmd, workdir="/testbed", user="root")
+                if val.exit_code != 0:
+                    logger.info(
+                        f"Failed to reset pooled container {container.name} ({cmd[:3]}):\n"
+                        f"{val.output.decode('utf-8', errors='replace')}"
+                    )
+                    return False
+        except Exception as e:
+            logger.info(f"Failed to reset pooled container {container.name}: {e}\n{traceback.format_exc()}")
+            return False
+        return True
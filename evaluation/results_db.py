@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+
+# Instance states, in the order an instance goes through them
+QUEUED = "queued"
+BUILDING = "building"
+RUNNING = "running"
+GRADED = "graded"
+# Terminal states besides GRADED
+ERROR = "error"
+EMPTY_PATCH = "empty_patch"
+
+# States an instance is left in when the evaluation process dies mid-run
+INTERRUPTED_STATES = (BUILDING, RUNNING)
+
+
+class ResultsDB:
+    """
+    SQLite database of per-instance evaluation states and reports.
+
+    One row per (run_id, instance_id) records the current state, the grading
+    report and the time of each transition, so an interrupted run can resume
+    by skipping graded rows instead of walking the log directories, and the
+    final report is a query over the table.
+    """
+
+    def __init__(self, db_path: str, timeout: float = 30):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS instances (
+                run_id TEXT NOT NULL,
+                instance_id TEXT NOT NULL,
+                model_name_or_path TEXT,
+                version TEXT,
+                image_key TEXT,
+                state TEXT NOT NULL,
+                resolved INTEGER,
+                report TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                queued_at REAL,
+                started_at REAL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (run_id, instance_id)
+            )
+            """
+        )
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_instances_run_state ON instances(run_id, state)"
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self.lock:
+            return self.conn.execute(sql, params)
+
+    def get_state(self, run_id: str, instance_id: str) -> str | None:
+        row = self._execute(
+            "SELECT state FROM instances WHERE run_id = ? AND instance_id = ?",
+            (run_id, instance_id),
+        ).fetchone()
+        return row[0] if row else None
+
+    def requeue_interrupted(self, run_id: str, retry_errors: bool = False) -> int:
+        """
+        Move instances left in building/running by a dead process (and optionally
+        failed instances) back to queued. Returns the number of requeued instances.
+        """
+        states = INTERRUPTED_STATES + ((ERROR,) if retry_errors else ())
+        placeholders = ", ".join("?" for _ in states)
+        cur = self._execute(
+            f"UPDATE instances SET state = ?, updated_at = ? WHERE run_id = ? AND state IN ({placeholders})",
+            (QUEUED, time.time(), run_id, *states),
+        )
+        return cur.rowcount
+
+    def enqueue(self, run_id: str, pred: dict, version: str | None, image_key: str | None, state: str = QUEUED) -> None:
+        """Insert an instance in `state`, or move an existing non-graded row back to it."""
+        now = time.time()
+        self._execute(
+            """
+            INSERT INTO instances (run_id, instance_id, model_name_or_path, version, image_key, state, queued_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(run_id, instance_id) DO UPDATE SET
+                state = excluded.state, queued_at = excluded.queued_at, updated_at = excluded.updated_at
+            WHERE instances.state != ?
+            """,
+            (
+                run_id,
+                pred["instance_id"],
+                pred.get("model_name_or_path", "None"),
+                None if version is None else str(version),
+                image_key,
+                state,
+                now,
+                now,
+                GRADED,
+            ),
+        )
+
+    def set_state(self, run_id: str, instance_id: str, state: str, error: str | None = None) -> None:
+        now = time.time()
+        if state == BUILDING:
+            self._execute(
+                "UPDATE instances SET state = ?, attempts = attempts + 1, started_at = ?, updated_at = ? "
+                "WHERE run_id = ? AND instance_id = ?",
+                (state, now, now, run_id, instance_id),
+            )
+        else:
+            self._execute(
+                "UPDATE instances SET state = ?, error = ?, updated_at = ? WHERE run_id = ? AND instance_id = ?",
+                (state, error, now, run_id, instance_id),
+            )
+
+    def record_report(self, run_id: str, instance_id: str, report: dict) -> None:
+        resolved = bool(report.get(instance_id, {}).get("resolved"))
+        self._execute(
+            "UPDATE instances SET state = ?, resolved = ?, report = ?, error = NULL, updated_at = ? "
+            "WHERE run_id = ? AND instance_id = ?",
+            (GRADED, int(resolved), json.dumps(report), time.time(), run_id, instance_id),
+        )
+
+    def count_by_state(self, run_id: str) -> dict[str, int]:
+        rows = self._execute(
+            "SELECT state, COUNT(*) FROM instances WHERE run_id = ? GROUP BY state", (run_id,)
+        ).fetchall()
+        return dict(rows)
+
+    def rows(self, run_id: str) -> list[tuple]:
+        """(instance_id, version, model_name_or_path, image_key, state, resolved) of every instance in the run."""
+        return self._execute(
+            "SELECT instance_id, version, model_name_or_path, image_key, state, resolved "
+            "FROM instances WHERE run_id = ? ORDER BY instance_id",
+            (run_id,),
+        ).fetchall()
@@ -6,7 +6,8 @@ import resource
 import traceback
 import os
 from argparse import ArgumentParser
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from typing import Callable, Iterator
 from pathlib import Path
 from tqdm import tqdm
 from docker import DockerClient
@@ -35,6 +36,8 @@ from docker_build import (
 )
 # from grading import get_pred_report
 from test_spec import make_test_spec, TestSpec
+from container_pool import ContainerPool
+from results_db import BUILDING, EMPTY_PATCH, ERROR, GRADED, QUEUED, RUNNING, ResultsDB
 from utils import load_omnigirl_dataset, str2bool
 
 APPLY_PATCH_FAIL = ">>>>> Patch Apply Failed"
@@ -64,11 +67,311 @@ def run_instance_fail_to_pass(
         run_id: str,
         output_path: str,
         timeout: int|None = None,
+        container_pool: ContainerPool|None = None,
+        state_callback: Callable[[str], None]|None = None,
+    ):
+
+    run_instance_setup(test_spec,pred,False,force_rebuild,client,run_id,output_path,"not_apply_patch",timeout,container_pool,state_callback)
+    return run_instance_setup(test_spec,pred,rm_image,False,client,run_id,output_path,"apply_patch",timeout,container_pool,state_callback)
+
+# git state of /testbed is snapshotted into a tree object through a scratch index,
+# so the post-patch phase can start from exactly the state the pre-patch phase saw.
+SNAPSHOT_INDEX = "/tmp/fail2pass_snapshot.idx"
+SNAPSHOT_INDEX_BACKUP = "/tmp/fail2pass_index.bak"
+
+
+def snapshot_testbed(container, logger) -> tuple[str, str] | None:
+    """
+    Record the working tree, index and HEAD of /testbed.
+
+    Returns:
+        (tree, head) to pass to restore_testbed, or None if /testbed cannot be snapshotted.
+    """
+    cmd = (
+        'INDEX="$(git rev-parse --git-path index)" && '
+        f'cp "$INDEX" {SNAPSHOT_INDEX_BACKUP} && cp "$INDEX" {SNAPSHOT_INDEX} && '
+        f"GIT_INDEX_FILE={SNAPSHOT_INDEX} git add -A && "
+        f"echo TREE=$(GIT_INDEX_FILE={SNAPSHOT_INDEX} git write-tree) && "
+        "echo HEAD=$(git rev-parse HEAD)"
+    )
+    val = container.exec_run(["/bin/bash", "-c", cmd], workdir="/testbed", user="root")
+    output = val.output.decode("utf-8", errors="replace")
+    tree = re.search(r"^TREE=([0-9a-f]{40,64})$", output, re.MULTILINE)
+    head = re.search(r"^HEAD=([0-9a-f]{40,64})$", output, re.MULTILINE)
+    if val.exit_code != 0 or not tree or not head:
+        logger.info(f"Failed to snapshot /testbed:\n{output}")
+        return None
+    logger.info(f"Snapshot of /testbed: tree {tree.group(1)}, HEAD {head.group(1)}")
+    return tree.group(1), head.group(1)
+
+
+def restore_testbed(container, snapshot: tuple[str, str], logger) -> bool:
+    """
+    Reset /testbed to a snapshot taken by snapshot_testbed: files in the snapshot
+    are checked out again, files created since are removed (ignored files are
+    kept, like `git clean -fd`), and HEAD and the index are restored.
+    """
+    tree, head = snapshot
+    cmd = (
+        f"GIT_INDEX_FILE={SNAPSHOT_INDEX} git read-tree {tree} && "
+        f"GIT_INDEX_FILE={SNAPSHOT_INDEX} git checkout-index -a -f && "
+        f"GIT_INDEX_FILE={SNAPSHOT_INDEX} git clean -fdq && "
+        f"git reset -q --soft {head} && "
+        f'cp {SNAPSHOT_INDEX_BACKUP} "$(git rev-parse --git-path index)" && '
+        "rm -f /tmp/patch.diff /eval.sh"
+    )
+    val = container.exec_run(["/bin/bash", "-c", cmd], workdir="/testbed", user="root")
+    if val.exit_code != 0:
+        logger.info(f"Failed to restore /testbed:\n{val.output.decode('utf-8', errors='replace')}")
+        return False
+    logger.info("Restored /testbed to the pre-patch snapshot.")
+    return True
+
+
+def apply_patch_in_container(container, instance_id: str, logger, git_apply_cmd: str = "git apply -p1 -v /tmp/patch.diff"):
+    """
+    Apply /tmp/patch.diff in /testbed, falling back to `patch --fuzz`.
+    Raises EvaluationError if neither applies.
+    """
+    val = container.exec_run(
+        git_apply_cmd,
+        workdir="/testbed",
+        user="root",
+    )
+    if val.exit_code != 0:
+        logger.info(f"Failed to apply patch to container, trying again...")
         
+        # try "patch --batch --fuzz=5 -p1 -i {patch_path}" to try again
+        val = container.exec_run(
+            "patch --batch --fuzz=5 -p1 -i /tmp/patch.diff",
+            workdir="/testbed",
+            user="root",
+        )
+        if val.exit_code != 0:
+            logger.info(f"{APPLY_PATCH_FAIL}:\n{val.output.decode('utf-8')}")
+            raise EvaluationError(
+                instance_id,
+                f"{APPLY_PATCH_FAIL}:\n{val.output.decode('utf-8')}",
+                logger,
+            )
+        else:
+            logger.info(f"{APPLY_PATCH_PASS}:\n{val.output.decode('utf-8')}")
+    else:
+        logger.info(f"{APPLY_PATCH_PASS}:\n{val.output.decode('utf-8')}")
+
+
+def run_eval_script_in_container(container, test_spec: TestSpec, log_dir: Path, test_output_name: str, logger, timeout: int|None) -> Path:
+    """Copy the eval script into the container, run it and write its output to log_dir/test_output_name."""
+    instance_id = test_spec.instance_id
+    eval_file = Path(log_dir / "eval.sh")
+    eval_file.write_text(test_spec.eval_script)
+    logger.info(
+        f"Eval script for {instance_id} written to {eval_file}, now applying to container..."
+    )
+    copy_to_container(container, eval_file, Path("/eval.sh"))
+
+    # Run eval script, write output to logs
+    result = exec_run_with_timeout(container, "/bin/bash /eval.sh", timeout=timeout)
+    test_output = result.decode("utf-8")
+    test_output_path = log_dir / test_output_name
+    with open(test_output_path, "w") as f:
+        f.write(test_output)
+    logger.info(f"Test output for {instance_id} written to {test_output_path}")
+    return test_output_path
+
+
+def run_fail2pass_pre_phase(
+        test_spec: TestSpec,
+        pred: dict,
+        force_rebuild: bool,
+        client: docker.DockerClient,
+        run_id: str,
+        output_path: str,
+        timeout: int|None = None,
+        container_pool: ContainerPool|None = None,
+        state_callback: Callable[[str], None]|None = None,
+    ) -> dict | tuple:
+    """
+    First half of the single-container fail2pass check: start one container,
+    snapshot /testbed and run the eval script without the gold patch.
+
+    Returns:
+        The state dict to pass to run_fail2pass_post_phase, or the (instance_id, report)
+        tuple of an instance that has already been graded. If the phase fails, the
+        container is removed and the state has no snapshot, so the post-phase runs
+        the patched tests in a fresh container.
+    """
+    instance_id = test_spec.instance_id
+    model_name_or_path = pred.get("model_name_or_path", "None").replace("/", "__")
+    log_dir = Path(output_path) / run_id / model_name_or_path / instance_id
+    log_dir.mkdir(parents=True, exist_ok=True)
+    report_path = log_dir / "report.json"
+    if report_path.exists():
+        return instance_id, json.loads(report_path.read_text())
+    logger = setup_logger(instance_id, log_dir / "run_instance_prev_apply.log")
+
+    container = None
+    try:
+        if state_callback is not None:
+            state_callback(BUILDING)
+        if container_pool is not None:
+            container = container_pool.acquire(test_spec, logger, log_dir, force_rebuild)
+        else:
+            container = build_setup_container(test_spec, client, run_id, logger, False, log_dir, force_rebuild, "fail2pass")
+            container.start()
+            logger.info(f"Container for {instance_id} started: {container.id}")
+        if state_callback is not None:
+            state_callback(RUNNING)
+
+        snapshot = snapshot_testbed(container, logger)
+        patch_file = Path(log_dir / "patch.diff")
+        patch_file.write_text(test_spec.patch or "")
+        copy_to_container(container, patch_file, Path("/tmp/patch.diff"))
+        run_eval_script_in_container(container, test_spec, log_dir, "test_output_prev_apply.txt", logger, timeout)
+        return {
+            "test_spec": test_spec,
+            "pred": pred,
+            "client": client,
+            "container": container,
+            "snapshot": snapshot,
+            "log_dir": log_dir,
+            "patch_file": patch_file,
+            "container_pool": container_pool,
+        }
+    except Exception as e:
+        error_msg = (f"Error in evaluating model for {instance_id}: {e}\n"
+                     f"{traceback.format_exc()}\n"
+                     f"Check ({logger.log_file}) for more information.")
+        logger.info(error_msg)
+        print(error_msg)
+        if container_pool is not None:
+            container_pool.release(container, logger, reusable=False)
+        else:
+            cleanup_container(client, container, logger)
+        return {
+            "test_spec": test_spec,
+            "pred": pred,
+            "client": client,
+            "container": None,
+            "snapshot": None,
+            "log_dir": log_dir,
+            "patch_file": None,
+            "container_pool": container_pool,
+        }
+    finally:
+        close_logger(logger)
+
+
+def run_fail2pass_post_phase(
+        state: dict,
+        rm_image: bool,
+        run_id: str,
+        output_path: str,
+        timeout: int|None = None,
     ):
+    """
+    Second half of the single-container fail2pass check: reset /testbed to the
+    snapshot, apply the gold patch, rerun the eval script and write report.json.
+    Falls back to a fresh container when /testbed could not be snapshotted or
+    the pre-phase failed.
+    """
+    test_spec, pred, client, container = state["test_spec"], state["pred"], state["client"], state["container"]
+    container_pool = state["container_pool"]
+    instance_id = test_spec.instance_id
+    log_dir = state["log_dir"]
+    if state["snapshot"] is None:
+        if container_pool is not None:
+            container_pool.release(container, None, reusable=False)
+        else:
+            cleanup_container(client, container, "quiet")
+        return run_instance_setup(test_spec, pred, rm_image, False, client, run_id, output_path, "apply_patch", timeout, container_pool)
+
+    report_path = log_dir / "report.json"
+    logger = setup_logger(instance_id, log_dir / "run_instance_after_apply.log")
+    reusable = False
+    try:
+        if not restore_testbed(container, state["snapshot"], logger):
+            raise EvaluationError(instance_id, "Failed to reset /testbed after the pre-patch run", logger)
+        copy_to_container(container, state["patch_file"], Path("/tmp/patch.diff"))
+        apply_patch_in_container(container, instance_id, logger)
+        test_output_path = run_eval_script_in_container(container, test_spec, log_dir, "test_output_after_apply.txt", logger, timeout)
+
+        logger.info(f"Grading answer for {instance_id}...")
+        report = get_pred_report(
+            test_spec=test_spec,
+            prediction=pred,
+            test_output_path=str(test_output_path)
+        )
+        logger.info(
+            f"report: {report}\n"
+            f"Result for {instance_id}: resolved: {report[instance_id]['resolved']}"
+        )
+        with open(report_path, "w") as f:
+            f.write(json.dumps(report, indent=4))
+        reusable = True
+        return instance_id, report
+    except EvaluationError as e:
+        reusable = True
+        error_msg = (f"EvaluationError {instance_id}: {e}\n"
+                     f"{traceback.format_exc()}\n"
+                     f"Check ({logger.log_file}) for more information.")
+        logger.info(error_msg)
+        print(error_msg)
+    except Exception as e:
+        error_msg = (f"Error in evaluating model for {instance_id}: {e}\n"
+                     f"{traceback.format_exc()}\n"
+                     f"Check ({logger.log_file}) for more information.")
+        logger.info(error_msg)
+        print(error_msg)
+    finally:
+        release_instance_container(client, container, test_spec, rm_image, logger, container_pool, reusable)
+        close_logger(logger)
+
+
+def release_instance_container(
+        client: docker.DockerClient,
+        container,
+        test_spec: TestSpec,
+        rm_image: bool,
+        logger,
+        container_pool: ContainerPool|None = None,
+        reusable: bool = False,
+    ):
+    """
+    Remove the container of an instance, or return it to the container pool,
+    and remove the instance image if rm_image is set.
+    """
+    if container_pool is not None:
+        if rm_image:
+            # the image goes away, so its containers are removed now rather than reset and pooled
+            container_pool.release(container, logger, reusable=False, wait=True)
+            container_pool.evict_image(test_spec.instance_image_key, logger)
+        else:
+            container_pool.release(container, logger, reusable)
+    else:
+        cleanup_container(client, container, logger)
+    if rm_image:
+        remove_image(client, test_spec.instance_image_key, logger)
+
+
+def run_instance_fail_to_pass_single_container(
+        test_spec: TestSpec,
+        pred: dict,
+        rm_image: bool,
+        force_rebuild: bool,
+        client: docker.DockerClient,
+        run_id: str,
+        output_path: str,
+        timeout: int|None = None,
+        container_pool: ContainerPool|None = None,
+        state_callback: Callable[[str], None]|None = None,
+    ):
+    """Same outputs as run_instance_fail_to_pass, using one container for both runs."""
+    state = run_fail2pass_pre_phase(test_spec, pred, force_rebuild, client, run_id, output_path, timeout, container_pool, state_callback)
+    if isinstance(state, dict):
+        return run_fail2pass_post_phase(state, rm_image, run_id, output_path, timeout)
+    return state
 
-    run_instance_setup(test_spec,pred,False,force_rebuild,client,run_id,output_path,"not_apply_patch",timeout)
-    run_instance_setup(test_spec,pred,rm_image,False,client,run_id,output_path,"apply_patch",timeout)
 
 def get_pred_report(
     test_spec: TestSpec,
@@ -147,7 +450,8 @@ def run_instance_setup(
         output_path: str,
         mode: str,
         timeout: int|None = None,
-        
+        container_pool: ContainerPool|None = None,
+        state_callback: Callable[[str], None]|None = None,
     ):
     """
     Run a single instance with the given prediction.
@@ -160,6 +464,8 @@ def run_instance_setup(
         client (docker.DockerClient): Docker client
         run_id (str): Run ID
         timeout (int): Timeout for running tests
+        container_pool (ContainerPool): Pool to check the container out of, None to create a new one
+        state_callback (Callable): Called with "building" and "running" as the instance progresses
     """
     # Set up logging directory
 
@@ -193,12 +499,20 @@ def run_instance_setup(
 
     # Run the instance
     container = None
+    reusable = False
     try:
         # Build + start instance container (instance image should already be built)
-        container = build_setup_container(test_spec, client, run_id, logger, rm_image, log_dir, force_rebuild,mode)
-        container.start()
+        if state_callback is not None:
+            state_callback(BUILDING)
+        if container_pool is not None:
+            container = container_pool.acquire(test_spec, logger, log_dir, force_rebuild, rm_image)
+        else:
+            container = build_setup_container(test_spec, client, run_id, logger, rm_image, log_dir, force_rebuild,mode)
+            container.start()
      
-        logger.info(f"Container for {instance_id} started: {container.id}")
+            logger.info(f"Container for {instance_id} started: {container.id}")
+        if state_callback is not None:
+            state_callback(RUNNING)
         
         # Copy model prediction as patch file to container
         patch_file = Path(log_dir / "patch.diff")
@@ -209,48 +523,10 @@ def run_instance_setup(
         copy_to_container(container, patch_file, Path("/tmp/patch.diff"))
         if mode  != 'not_apply_patch':
             # Attempt to apply patch to container
-            val = container.exec_run(
-                "git apply -p1 -v /tmp/patch.diff",
-                workdir="/testbed",
-                user="root",
-            )
-            if val.exit_code != 0:
-                logger.info(f"Failed to apply patch to container, trying again...")
-                
-                # try "patch --batch --fuzz=5 -p1 -i {patch_path}" to try again
-                val = container.exec_run(
-                    "patch --batch --fuzz=5 -p1 -i /tmp/patch.diff",
-                    workdir="/testbed",
-                    user="root",
-                )
-                if val.exit_code != 0:
-                    logger.info(f"{APPLY_PATCH_FAIL}:\n{val.output.decode('utf-8')}")
-                    raise EvaluationError(
-                        instance_id,
-                        f"{APPLY_PATCH_FAIL}:\n{val.output.decode('utf-8')}",
-                        logger,
-                    )
-                else:
-                    logger.info(f"{APPLY_PATCH_PASS}:\n{val.output.decode('utf-8')}")
-            else:
-                logger.info(f"{APPLY_PATCH_PASS}:\n{val.output.decode('utf-8')}")
-
-
-        eval_file = Path(log_dir / "eval.sh")
-        eval_file.write_text(test_spec.eval_script)
-        logger.info(
-            f"Eval script for {instance_id} written to {eval_file}, now applying to container..."
-        )
-        copy_to_container(container, eval_file, Path("/eval.sh"))
+            apply_patch_in_container(container, instance_id, logger)
 
-        # Run eval script, write output to logs
-        result = exec_run_with_timeout(container, "/bin/bash /eval.sh", timeout=timeout)
-        test_output = result.decode("utf-8")
         test_output_name = "test_output_prev_apply.txt" if mode == "not_apply_patch" else "test_output_after_apply.txt"
-        test_output_path = log_dir / test_output_name
-        with open(test_output_path, "w") as f:
-            f.write(test_output)
-        logger.info(f"Test output for {instance_id} written to {test_output_path}")
+        test_output_path = run_eval_script_in_container(container, test_spec, log_dir, test_output_name, logger, timeout)
 
         if mode  != 'not_apply_patch':
             logger.info(f"Grading answer for {instance_id}...")
@@ -270,8 +546,10 @@ def run_instance_setup(
         else:
             report = None
             
+        reusable = True
         return instance_id, report
     except EvaluationError as e:
+        reusable = True
         error_msg = (f"EvaluationError {instance_id}: {e}\n"
                      f"{traceback.format_exc()}\n"
                      f"Check ({logger.log_file}) for more information.")
@@ -285,9 +563,7 @@ def run_instance_setup(
         print(error_msg)
     finally:
         # Remove instance container + image, close logger
-        cleanup_container(client, container, logger)
-        if rm_image:
-            remove_image(client, test_spec.instance_image_key, logger)
+        release_instance_container(client, container, test_spec, rm_image, logger, container_pool, reusable)
         close_logger(logger)
 
 def run_instance(
@@ -465,7 +741,9 @@ def run_instances(
         output_path: str,
         timeout: int,
         is_judge_fail2pass: bool,
-       
+        fail2pass_single_container: bool = False,
+        container_pool_size: int = 0,
+        container_pool_ttl: int = 1800,
     ):
     """
     Run all instances for the given predictions in parallel.
@@ -480,6 +758,9 @@ def run_instances(
         max_workers (int): Maximum number of workers
         run_id (str): Run ID
         timeout (int): Timeout for running tests
+        fail2pass_single_container (bool): Run both fail2pass phases in one container
+        container_pool_size (int): Idle containers kept per image for reuse, 0 to create one container per run
+        container_pool_ttl (int): Seconds after which a pooled container is no longer reused
     """
     client = docker.from_env()
     # test_specs = list(map(make_test_spec, instances, predictions))
@@ -496,9 +777,43 @@ def run_instances(
     if not force_rebuild and len(existing_images):
         print(f"Found {len(existing_images)} existing instance images. Will reuse them.")
 
+    container_pool = None
+    if container_pool_size > 0:
+        container_pool = ContainerPool(client, run_id, size=container_pool_size, ttl=container_pool_ttl)
+    try:
+        _run_instances(
+            test_specs, predictions, instances, rm_image, force_rebuild, client, max_workers,
+            run_id, output_path, timeout, is_judge_fail2pass, fail2pass_single_container, container_pool,
+        )
+    finally:
+        if container_pool is not None:
+            container_pool.close()
+    print("All instances run.")
+
+
+def _run_instances(
+        test_specs: list,
+        predictions: dict,
+        instances: list,
+        rm_image: bool,
+        force_rebuild: bool,
+        client: docker.DockerClient,
+        max_workers: int,
+        run_id: str,
+        output_path: str,
+        timeout: int,
+        is_judge_fail2pass: bool,
+        fail2pass_single_container: bool,
+        container_pool: ContainerPool|None,
+    ):
     # run instances in parallel
     print(f"Running {len(instances)} instances...")
-    if is_judge_fail2pass:
+    if is_judge_fail2pass and fail2pass_single_container:
+        run_fail2pass_single_container_instances(
+            test_specs, predictions, rm_image, force_rebuild, client, max_workers, run_id, output_path, timeout,
+            container_pool,
+        )
+    elif is_judge_fail2pass:
             
         with tqdm(total=len(instances), smoothing=0) as pbar:
             with ThreadPoolExecutor(max_workers=max_workers) as executor:
@@ -520,6 +835,7 @@ def run_instances(
                         run_id,
                         output_path,
                         timeout,
+                        container_pool,
                     ): None
                     for test_spec in test_specs
                 }
@@ -554,6 +870,7 @@ def run_instances(
                         output_path,
                         "apply_patch",
                         timeout,
+                        container_pool,
                     ): None
                     for test_spec in test_specs
                 }
@@ -566,7 +883,65 @@ def run_instances(
                     except Exception as e:
                         traceback.print_exc()
                         continue
-    print("All instances run.")
+
+
+def run_fail2pass_single_container_instances(
+        test_specs: list,
+        predictions: dict,
+        rm_image: bool,
+        force_rebuild: bool,
+        client: docker.DockerClient,
+        max_workers: int,
+        run_id: str,
+        output_path: str,
+        timeout: int,
+        container_pool: ContainerPool|None = None,
+    ):
+    """
+    Run the single-container fail2pass check for all instances. The post-patch
+    phase of an instance is submitted as soon as its pre-patch phase finishes,
+    and a new pre-patch phase only starts when a worker is free, so at most
+    max_workers containers are alive at any time.
+    """
+    specs = iter(test_specs)
+
+    def submit_next_pre(executor, pending):
+        test_spec = next(specs, None)
+        if test_spec is not None:
+            pending[executor.submit(
+                run_fail2pass_pre_phase,
+                test_spec,
+                predictions[test_spec.instance_id],
+                force_rebuild,
+                client,
+                run_id,
+                output_path,
+                timeout,
+                container_pool,
+            )] = "pre"
+
+    with tqdm(total=len(test_specs), smoothing=0) as pbar:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {}
+            for _ in range(max_workers):
+                submit_next_pre(executor, pending)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    phase = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception:
+                        traceback.print_exc()
+                        result = None
+                    if phase == "pre" and isinstance(result, dict):
+                        # the worker freed by the pre-phase goes to the post-phase of the same container
+                        pending[executor.submit(
+                            run_fail2pass_post_phase, result, rm_image, run_id, output_path, timeout
+                        )] = "post"
+                    else:
+                        pbar.update(1)
+                        submit_next_pre(executor, pending)
 
 
 def get_dataset_from_preds(
@@ -792,6 +1167,252 @@ def make_run_report(
     print(f"Report written to {report_file}")
 
 
+def iter_predictions(
+        predictions_path: str,
+        dataset_name: str,
+        split: str,
+        version_spec: str,
+        instance_ids: list,
+    ) -> Iterator[dict]:
+    """
+    Yield predictions one at a time. A .jsonl file is read line by line, so the
+    predictions of a sweep are never all held in memory.
+    """
+    if predictions_path == 'gold':
+        yield from get_gold_predictions(dataset_name, split, version_spec, instance_ids)
+    elif predictions_path.endswith(".json"):
+        with open(predictions_path, "r", encoding='utf-8') as f:
+            yield from json.load(f)
+    elif predictions_path.endswith(".jsonl"):
+        with open(predictions_path, "r", encoding='utf-8') as f:
+            for line_num, line in enumerate(f, 1):
+                line = line.strip()
+                if not line: continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Warning: Could not decode JSON on line {line_num} in {predictions_path}. Skipping line.")
+    else:
+        raise ValueError(f"Predictions path must be a directory, \"gold\", .json, or .jsonl, but got '{predictions_path}'")
+
+
+def evaluate_instance_with_db(
+        test_spec: TestSpec,
+        pred: dict,
+        results_db: ResultsDB,
+        rm_image: bool,
+        force_rebuild: bool,
+        client: docker.DockerClient,
+        run_id: str,
+        output_path: str,
+        timeout: int,
+        is_judge_fail2pass: bool,
+        fail2pass_single_container: bool,
+        container_pool: ContainerPool|None,
+    ):
+    """Evaluate one instance and record its state transitions and report in results_db."""
+    instance_id = test_spec.instance_id
+    state_callback = lambda state: results_db.set_state(run_id, instance_id, state)
+    try:
+        if is_judge_fail2pass and fail2pass_single_container:
+            result = run_instance_fail_to_pass_single_container(
+                test_spec, pred, rm_image, force_rebuild, client, run_id, output_path, timeout,
+                container_pool, state_callback,
+            )
+        elif is_judge_fail2pass:
+            result = run_instance_fail_to_pass(
+                test_spec, pred, rm_image, force_rebuild, client, run_id, output_path, timeout,
+                container_pool, state_callback,
+            )
+        else:
+            result = run_instance_setup(
+                test_spec, pred, rm_image, force_rebuild, client, run_id, output_path, "apply_patch", timeout,
+                container_pool, state_callback,
+            )
+    except Exception as e:
+        results_db.set_state(run_id, instance_id, ERROR, f"{e!r}")
+        raise
+    if result is not None and result[1] is not None:
+        results_db.record_report(run_id, instance_id, result[1])
+    else:
+        results_db.set_state(run_id, instance_id, ERROR, "no report, see the instance logs")
+
+
+def run_instances_with_db(
+        predictions: Iterator[dict],
+        dataset: list,
+        results_db: ResultsDB,
+        rm_image: bool,
+        force_rebuild: bool,
+        max_workers: int,
+        run_id: str,
+        output_path: str,
+        timeout: int,
+        is_judge_fail2pass: bool,
+        fail2pass_single_container: bool = False,
+        container_pool_size: int = 0,
+        container_pool_ttl: int = 1800,
+        retry_errors: bool = False,
+    ):
+    """
+    Stream predictions through the evaluation, recording every instance in results_db.
+
+    Instances already graded in results_db (and failed ones, unless retry_errors)
+    are skipped, and instances left building/running by a crashed run are queued
+    again, so a rerun with the same run ID resumes where the last one stopped.
+    At most 2 * max_workers instances are queued in memory at a time.
+
+    Args:
+        predictions (Iterator[dict]): Predictions, e.g. from iter_predictions
+        dataset (list): Instances the predictions may refer to, already filtered by version and ID
+        results_db (ResultsDB): Results database
+        retry_errors (bool): Evaluate instances that failed in an earlier run again
+    """
+    instances = {instance["instance_id"]: instance for instance in dataset}
+    requeued = results_db.requeue_interrupted(run_id, retry_errors)
+    if requeued:
+        print(f"Requeued {requeued} instances interrupted in a previous run.")
+    client = docker.from_env()
+    container_pool = None
+    if container_pool_size > 0:
+        container_pool = ContainerPool(client, run_id, size=container_pool_size, ttl=container_pool_ttl)
+
+    seen_ids = set()
+    num_skipped = 0
+    in_flight = set()
+    try:
+        with tqdm(smoothing=0) as pbar:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for pred in predictions:
+                    instance_id = pred["instance_id"]
+                    instance = instances.get(instance_id)
+                    if instance is None or instance_id in seen_ids:
+                        continue
+                    seen_ids.add(instance_id)
+                    state = results_db.get_state(run_id, instance_id)
+                    if state == GRADED or (state in (ERROR, EMPTY_PATCH) and not retry_errors):
+                        num_skipped += 1
+                        continue
+                    if pred.get("model_patch") in ["", None]:
+                        results_db.enqueue(run_id, pred, instance["version"], None, EMPTY_PATCH)
+                        continue
+                    try:
+                        test_spec = make_test_spec(instance, pred)
+                    except Exception as e:
+                        results_db.enqueue(run_id, pred, instance["version"], None, ERROR)
+                        results_db.set_state(run_id, instance_id, ERROR, f"{e!r}")
+                        continue
+                    results_db.enqueue(run_id, pred, instance["version"], test_spec.instance_image_key)
+
+                    if len(in_flight) >= 2 * max_workers:
+                        done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        pbar.update(len(done))
+                    in_flight.add(executor.submit(
+                        evaluate_instance_with_db,
+                        test_spec,
+                        pred,
+                        results_db,
+                        rm_image,
+                        force_rebuild,
+                        client,
+                        run_id,
+                        output_path,
+                        timeout,
+                        is_judge_fail2pass,
+                        fail2pass_single_container,
+                        container_pool,
+                    ))
+                for future in as_completed(in_flight):
+                    pbar.update(1)
+                    try:
+                        future.result()
+                    except Exception:
+                        traceback.print_exc()
+                        continue
+    finally:
+        if container_pool is not None:
+            container_pool.close()
+    if num_skipped:
+        print(f"{num_skipped} instances already evaluated in {results_db.db_path}, skipped.")
+    print("All instances run.")
+
+
+def make_run_report_from_db(
+        results_db: ResultsDB,
+        full_dataset: list,
+        client: docker.DockerClient,
+        run_id: str,
+        reports_dir: str,
+    ):
+    """
+    Same report as make_run_report, built from results_db instead of the report.json files.
+    """
+    rows = results_db.rows(run_id)
+    if not rows:
+        print(f"No instances of run {run_id} in {results_db.db_path}.")
+        return
+    versions = {instance["instance_id"]: instance["version"] for instance in full_dataset}
+    key = lambda instance_id, ver: instance_id + "_version-" + str(ver)
+
+    submitted = {row[0] for row in rows}
+    completed_ids = {key(row[0], row[1]) for row in rows if row[4] == GRADED}
+    resolved_ids = {key(row[0], row[1]) for row in rows if row[4] == GRADED and row[5]}
+    unresolved_ids = completed_ids - resolved_ids
+    empty_patch_ids = {key(row[0], row[1]) for row in rows if row[4] == EMPTY_PATCH}
+    error_ids = {key(row[0], row[1]) for row in rows if row[4] == ERROR}
+    unfinished_ids = {key(row[0], row[1]) for row in rows if row[4] in (QUEUED, BUILDING, RUNNING)}
+    incomplete_ids = {key(i, v) for i, v in versions.items() if i not in submitted}
+
+    images = set(list_images(client))
+    unremoved_images = {row[3] for row in rows if row[3] in images}
+    unstopped_containers = {
+        container.name for container in client.containers.list(all=True)
+        if run_id in container.name
+    }
+
+    print(f"Instance states: {results_db.count_by_state(run_id)}")
+    print(f"Total instances: {len(full_dataset)}")
+    print(f"Instances submitted: {len(submitted)}")
+    print(f"Instances completed: {len(completed_ids)}")
+    print(f"Instances incomplete: {len(incomplete_ids)}")
+    print(f"Instances resolved: {len(resolved_ids)}")
+    print(f"Instances unresolved: {len(unresolved_ids)}")
+    print(f"Instances with empty patches: {len(empty_patch_ids)}")
+    print(f"Instances with errors: {len(error_ids)}")
+    print(f"Instances queued or interrupted: {len(unfinished_ids)}")
+    print(f"Unstopped containers: {len(unstopped_containers)}")
+    print(f"Unremoved images: {len(unremoved_images)}")
+
+    report = {
+        "total_instances": len(full_dataset),
+        "submitted_instances": len(submitted),
+        "completed_instances": len(completed_ids),
+        "resolved_instances": len(resolved_ids),
+        "unresolved_instances": len(unresolved_ids),
+        "empty_patch_instances": len(empty_patch_ids),
+        "error_instances": len(error_ids),
+        "unfinished_instances": len(unfinished_ids),
+        "unstopped_instances": len(unstopped_containers),
+        "completed_ids": list(sorted(completed_ids)),
+        "incomplete_ids": list(sorted(incomplete_ids)),
+        "empty_patch_ids": list(sorted(empty_patch_ids)),
+        "submitted_ids": list(sorted(submitted)),
+        "resolved_ids": list(sorted(resolved_ids)),
+        "unresolved_ids": list(sorted(unresolved_ids)),
+        "error_ids": list(sorted(error_ids)),
+        "unfinished_ids": list(sorted(unfinished_ids)),
+        "unstopped_containers": list(sorted(unstopped_containers)),
+        "unremoved_images": list(sorted(unremoved_images)),
+    }
+    report_file = Path(rows[0][2].replace("/", "__") + f".{run_id}" + ".json")
+    reports_dir = Path(reports_dir)
+    reports_dir.mkdir(parents=True, exist_ok=True)
+    report_file = reports_dir / report_file
+    with open(report_file, "w") as f:
+        print(json.dumps(report, indent=4), file=f)
+    print(f"Report written to {report_file}")
+
+
 def get_gold_predictions(dataset_name: str, split: str,version_spec: str,instance_ids):
     """
     Get gold predictions for the given dataset and split.
@@ -852,6 +1473,9 @@ def main(
         max_workers: int,
         force_rebuild: bool,
         is_judge_fail2pass: bool,
+        fail2pass_single_container: bool,
+        container_pool_size: int,
+        container_pool_ttl: int,
         cache_level: str,
         clean: bool,
         rm_image: bool,
@@ -861,7 +1485,8 @@ def main(
         timeout: int,
         version_spec: str,
         reports_dir: str,
-        
+        results_db: str|None = None,
+        retry_errors: bool = False,
     ):
     """
     Run evaluation harness for the given dataset and predictions.
@@ -871,6 +1496,41 @@ def main(
     resource.setrlimit(resource.RLIMIT_NOFILE, (open_file_limit, open_file_limit))
     client = docker.from_env()
 
+    if results_db:
+        full_dataset = load_omnigirl_dataset(dataset_name, split)
+        dataset = [
+            i for i in full_dataset
+            if (version_spec == 'all' or i['version'] == version_spec)
+            and (not instance_ids or i["instance_id"] in instance_ids)
+        ]
+        existing_images = list_images(client)
+        db = ResultsDB(results_db)
+        try:
+            run_instances_with_db(
+                iter_predictions(predictions_path, dataset_name, split, version_spec, instance_ids),
+                dataset,
+                db,
+                rm_image,
+                force_rebuild,
+                max_workers,
+                run_id,
+                output_path,
+                timeout,
+                is_judge_fail2pass,
+                fail2pass_single_container,
+                container_pool_size,
+                container_pool_ttl,
+                retry_errors,
+            )
+            if rm_image:
+                clean_images(client, existing_images, cache_level, clean)
+            else:
+                print("Skipping image cleanup because rm_image is False.")
+            make_run_report_from_db(db, full_dataset, client, run_id, reports_dir)
+        finally:
+            db.close()
+        return
+
 
 
     if predictions_path == 'gold':
@@ -929,6 +1589,9 @@ def main(
             output_path,
             timeout,
             is_judge_fail2pass,
+            fail2pass_single_container,
+            container_pool_size,
+            container_pool_ttl,
         )
 
     # clean images + make final report
@@ -960,6 +1623,25 @@ if __name__ == "__main__":
         default=False,
         help="Force rebuild of all images"
     )
+    parser.add_argument(
+        "--fail2pass_single_container",
+        type=str2bool,
+        default=False,
+        help="With --is_judge_fail2pass, run the tests before and after the patch in one container, "
+             "resetting /testbed to a git snapshot in between",
+    )
+    parser.add_argument(
+        "--container_pool_size",
+        type=int,
+        default=0,
+        help="Number of idle containers kept per instance image and reset for reuse (0 disables the pool)",
+    )
+    parser.add_argument(
+        "--container_pool_ttl",
+        type=int,
+        default=1800,
+        help="Seconds after which a pooled container is removed instead of reused (0 for no limit)",
+    )
 
     parser.add_argument(
         "--cache_level",
@@ -987,6 +1669,18 @@ if __name__ == "__main__":
     parser.add_argument(
         "--reports_dir", type=str, default="reports", help="directory for saving reports"
         )
+    parser.add_argument(
+        "--results_db",
+        type=str,
+        default=None,
+        help="SQLite results database; streams predictions, records per-instance states and resumes from it",
+    )
+    parser.add_argument(
+        "--retry_errors",
+        type=str2bool,
+        default=False,
+        help="With --results_db, evaluate instances that failed in an earlier run again",
+    )
     
     args = parser.parse_args()
 
@@ -103,6 +103,11 @@ class Agent:
         self._task_tracker_initialized = False
         self._task_tracker_virtual_path = "session/TASKS.md"
         self._thought_log = []
+        # token counts of self.history[:len(self._message_tokens)], one per message
+        self._message_tokens = []
+        self._reply_priming_tokens = None
+        # also recount the whole history each step and log the time saved
+        self.profile_token_accounting = os.environ.get("AGENTHUB_PROFILE_TOKENS", "") in ("1", "true")
 
     def _has_command_tool(self, name: str) -> bool:
         for cmd_file in self.command_files or []:
@@ -306,6 +311,7 @@ class Agent:
         self._task_tracker_initialized = False
         self._task_tracker_virtual_path = "session/TASKS.md"
         self._thought_log = []
+        self._message_tokens = []
 
     def _count_tokens(self, messages: List[Dict[str, str]]) -> int:
         """
@@ -316,9 +322,57 @@ class Agent:
         self.logger.info(f"Total tokens in conversation: {token_count}")
         return token_count
 
+    def _extend_last_message(self, text: str) -> None:
+        """Append text to the content of the last history message."""
+        self.history[-1]["content"] += text
+        del self._message_tokens[len(self.history) - 1:]  # recounted on the next query
+
+    def _history_tokens(self) -> int:
+        """
+        Token count of self.history, as litellm.token_counter would return it, counting
+        only the messages added (or changed through _extend_last_message) since the
+        last call.
+        """
+        start_time = time.time()
+        if self._reply_priming_tokens is None:
+            # token_counter adds the reply priming once per call: the part of a
+            # one-message count that a second message does not repeat
+            probe = {"role": "user", "content": "x"}
+            self._reply_priming_tokens = 2 * litellm.token_counter(
+                model=self.llm_name, messages=[probe]
+            ) - litellm.token_counter(model=self.llm_name, messages=[probe, probe])
+        num_new = len(self.history) - len(self._message_tokens)
+        for message in self.history[len(self._message_tokens):]:
+            self._message_tokens.append(
+                litellm.token_counter(model=self.llm_name, messages=[message])
+                - self._reply_priming_tokens
+            )
+        token_count = sum(self._message_tokens) + self._reply_priming_tokens
+        count_time = time.time() - start_time
+        if self.profile_token_accounting:
+            full_start_time = time.time()
+            full_count = litellm.token_counter(model=self.llm_name, messages=self.history)
+            full_time = time.time() - full_start_time
+            self.logger.info(
+                f"Token accounting: {num_new} new messages in {count_time * 1000:.1f} ms, "
+                f"full recount {full_time * 1000:.1f} ms (saved {(full_time - count_time) * 1000:.1f} ms), "
+                f"tokens {token_count} vs {full_count}"
+            )
+        self.logger.info(f"Total tokens in conversation: {token_count}")
+        return token_count
+
     def model_query(
-        self, messages: List[Dict[str, str]], temperature: float = 0,) -> Dict[str, Any]:
-        """Query the LLM with the messages and measure execution time."""
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0,
+        total_tokens: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        Query the LLM with the messages and measure execution time.
+
+        `messages` may be modified (the list, not its messages); `total_tokens` is
+        their token count if the caller already knows it.
+        """
         response = None
         retries = 0
         tools = None
@@ -345,10 +399,11 @@ class Agent:
                 # add prompt caching for anthropic
                 tools[-1]["function"]["cache_control"] = {"type": "ephemeral"}
                 breakpoints_remaining = 3  # remaining 1 for system/tool (above)
-                for message in reversed(messages):
-                    if message["role"] in ("user", "tool"):
+                for idx in range(len(messages) - 1, -1, -1):
+                    if messages[idx]["role"] in ("user", "tool"):
                         if breakpoints_remaining > 0:
-                            message["cache_control"] = {"type": "ephemeral"}
+                            # copy, so the marker does not leak into the history
+                            messages[idx] = {**messages[idx], "cache_control": {"type": "ephemeral"}}
                             breakpoints_remaining -= 1
                         else:
                             break
@@ -362,8 +417,9 @@ class Agent:
         if using_local:
             litellm.api_key = None
 
-        messages_ = copy.deepcopy(messages)
-        total_tokens = self._count_tokens(messages_)
+        messages_ = messages
+        if total_tokens is None:
+            total_tokens = self._count_tokens(messages_)
         if total_tokens > MAX_CONTEXT_TOKENS:
             logger.warning(f"Total tokens: {total_tokens} > {MAX_CONTEXT_TOKENS}")
             raise ValueError(f"Total tokens: {total_tokens} > {MAX_CONTEXT_TOKENS}")
@@ -657,6 +713,7 @@ class Agent:
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ]
+        self._message_tokens = []
 
         # initialize the parameters
         obs = None
@@ -675,15 +732,16 @@ class Agent:
                 stepcount_message = f"Steps Remaining: {steps_remaining}"
             else:
                 stepcount_message = "You have reached the maximum number of steps. Please submit your answer NOW."
-            self.history[-1][
-                "content"
-            ] += f"\n{stepcount_message}"  # postpend stepcount message
+            self._extend_last_message(f"\n{stepcount_message}")  # postpend stepcount message
             self.logger.info(stepcount_message)
 
             # Query the LLM
-            messages = copy.deepcopy(self.history)
+            messages = list(self.history)
             try:
-                response, llm_exec_time = self.model_query(messages, temperature)
+                history_tokens = self._history_tokens()
+                response, llm_exec_time = self.model_query(
+                    messages, temperature, total_tokens=history_tokens
+                )
             except Exception as e:
                 self.logger.error(f"Error querying LLM: {e}")
                 self.logger.error(f"Error querying LLM: {traceback.format_exc()}")
@@ -707,7 +765,7 @@ class Agent:
                 completion_tokens = -1
                 prompt_tokens = -1
                 total_tokens = -1
-                total_tokens =  self._count_tokens(messages)
+                total_tokens = history_tokens
                 self.logger.warning(
                     "No token usage information available in the response."
                 )
@@ -81,6 +81,9 @@ class RepoEnv(gym.Env):
         self.backend = backend
         self.step_timeout = step_timeout
         self.reward_timeout = reward_timeout
+        # a fresh env has not run any step since its runtime was created
+        self.fresh = True
+        self.added_command_files = None
         self.logger.info(
             f"Initialized Env: {self.runtime.repo_name} with image: {self.runtime.docker_image}"
         )
@@ -89,6 +92,13 @@ class RepoEnv(gym.Env):
         """
         Resets the environment and returns an initial observation.
         """
+        if self.fresh:
+            # the runtime is untouched since it was set up, e.g. by an env pool
+            self.logger.info("RepoEnv is fresh, skipping reset")
+            self.observation = "Environment reset"
+            self.state = None
+            self.done = False
+            return self.observation
         self.logger.info(f"Resetting RepoEnv ...")
         # close the runtime
         self.runtime.close()
@@ -113,6 +123,8 @@ class RepoEnv(gym.Env):
                 tool_repo_path=self.tool_repo_path,
                 scaffold=self.scaffold,
             )
+        self.fresh = True
+        self.added_command_files = None
         return self.observation  # self.get_observation()
 
     def add_commands(self, cmd_files: list[str]):
@@ -123,6 +135,9 @@ class RepoEnv(gym.Env):
         Args:
             cmd_files: List of paths to command files.
         """
+        if self.fresh and self.added_command_files == list(cmd_files):
+            # already copied to this runtime
+            return
         cmds = []
         for cmd_file in cmd_files:
             # Parse commands from file
@@ -165,6 +180,7 @@ class RepoEnv(gym.Env):
 
         # Store the parsed commands for reference
         self.commands = cmds
+        self.added_command_files = list(cmd_files)
         self.logger.info(f"Added {len(cmds)} commands to the environment.")
 
     def _is_shebang_script(self, cmd_file: str) -> bool:
@@ -241,6 +257,7 @@ class RepoEnv(gym.Env):
         """
         if not timeout:
             timeout = self.step_timeout
+        self.fresh = False
         bash_output, error_code, total_time = self.run_action(action, timeout=timeout)
         self.observation = Observation(bash_output, error_code, action, docker_image = self.args.ds['docker_image'])
         reward = self.calculate_reward(self.observation)
@@ -0,0 +1,107 @@
+import math
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from inference.agenthub.utils.log import get_logger
+
+
+class EnvPool:
+    """
+    Prepares environments ahead of the agent that uses them.
+
+    Producer threads take dataset entries from `tasks` and build their environments
+    with `make_env` (container started, setup_env run, commands added), while the
+    consumer iterates over the ready ones. The number of environments ready or being
+    built is kept at ceil(mean setup time / mean agent run time), between 1 and
+    `max_depth`: when setup is slower than an agent run, more are built at once.
+
+    Iterating yields (ds, env, error); env is None and error set if setup failed.
+    """
+
+    def __init__(
+        self,
+        tasks,  # queue of dataset entries, fully filled before the pool starts
+        make_env: Callable[[Dict[str, Any]], Any],
+        max_depth: int = 2,
+        logger=None,
+    ):
+        self.tasks = tasks
+        self.make_env = make_env
+        self.max_depth = max(1, max_depth)
+        self.logger = logger if logger is not None else get_logger("EnvPool")
+        self.ready = queue.Queue()
+        self.cond = threading.Condition()
+        self.outstanding = 0  # environments ready or being built
+        self.producers_left = self.max_depth
+        self.closed = False
+        self.setup_times = []
+        self.run_times = []
+        self.producers = [
+            threading.Thread(target=self._produce, daemon=True)
+            for _ in range(self.max_depth)
+        ]
+        for producer in self.producers:
+            producer.start()
+
+    def target_depth(self) -> int:
+        if not self.setup_times or not self.run_times:
+            return 1
+        setup_time = sum(self.setup_times) / len(self.setup_times)
+        run_time = sum(self.run_times) / len(self.run_times)
+        return min(self.max_depth, max(1, math.ceil(setup_time / max(run_time, 1e-3))))
+
+    def record_run(self, seconds: float) -> None:
+        """Report how long the agent took with one environment."""
+        with self.cond:
+            self.run_times.append(seconds)
+            self.cond.notify_all()
+
+    def _produce(self) -> None:
+        while True:
+            with self.cond:
+                while not self.closed and self.outstanding >= self.target_depth():
+                    self.cond.wait()
+                try:
+                    if self.closed:
+                        raise queue.Empty
+                    ds = self.tasks.get_nowait()
+                except queue.Empty:
+                    self.producers_left -= 1
+                    if self.producers_left == 0:
+                        self.ready.put(None)
+                    self.cond.notify_all()
+                    return
+                self.outstanding += 1
+            start_time = time.time()
+            try:
+                env, error = self.make_env(ds), None
+            except Exception as e:
+                self.logger.error(f"Environment setup failed for {ds.get('docker_image')}: {repr(e)}")
+                env, error = None, e
+            with self.cond:
+                self.setup_times.append(time.time() - start_time)
+            self.ready.put((ds, env, error))
+
+    def __iter__(self) -> Iterator[Tuple[Dict[str, Any], Optional[Any], Optional[Exception]]]:
+        while True:
+            item = self.ready.get()
+            if item is None:
+                return
+            with self.cond:
+                self.outstanding -= 1
+                self.cond.notify_all()
+            yield item
+
+    def close(self) -> None:
+        """Stop preparing environments and close the ones not handed out."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        for producer in self.producers:
+            producer.join()
+        while not self.ready.empty():
+            item = self.ready.get_nowait()
+            if item is not None and item[1] is not None:
+                item[1].close()
@@ -9,11 +9,15 @@ from typing import Any, Dict, List, Optional
 from datetime import datetime
 import json
 import concurrent.futures
+import multiprocessing
+import os
+import queue
 import threading
 import docker
 
 from inference.agenthub.runtime.docker import DockerRuntime
 from inference.agenthub.environment.env import EnvArgs, RepoEnv
+from inference.agenthub.environment.pool import EnvPool
 from inference.agenthub.agent.agent import AgentArgs, Agent
 
 from inference.docker_bash_utils.docker_list_tags import fetch_docker_tags
@@ -349,6 +353,85 @@ def run_agent_with_restarts(
     trajectory = min(trajectories, key=lambda x: x.num_steps)
     return trajectory, history
 
+def get_instance_logger(ds, exp_name: str):
+    instance_meta = resolve_instance_metadata(ds)
+    instance_dir = Path("run_logs") / exp_name / instance_meta["instance_id"]
+    instance_dir.mkdir(parents=True, exist_ok=True)
+    return setup_logging(
+        name=ds["docker_image"].replace("/", "_"),
+        log_file=str(instance_dir / "agent.log"),
+        console=True,
+        level=INFO,
+    )
+
+
+def load_agent_args(scaffold: str, use_fn_calling: bool, llm_name: str) -> AgentArgs:
+    if use_fn_calling:
+        assert scaffold != "sweagent", "SWEagent scaffold does not support fn calling"
+        assert scaffold not in ["mini_swe_agent", "live_swe_agent"], "mini_swe_agent/live_swe_agent scaffolds are non-fn-calling only"
+        agent_args = AgentArgs.from_yaml(
+            Path(f"./inference/agenthub/config/{scaffold}/edit_fn_calling.yaml")
+        )
+    else:
+        agent_args = AgentArgs.from_yaml(
+            Path(f"./inference/agenthub/config/{scaffold}/edit_non_fn_calling.yaml")
+        )
+    agent_args.llm_name = llm_name
+    return agent_args
+
+
+def make_env(ds, logger, backend: str, scaffold: str, root_mode: bool) -> RepoEnv:
+    # Initialize environment arguments
+    env_args = EnvArgs(ds=ds, root_mode=root_mode)
+
+    # Initialize the RepoEnv
+    if scaffold in ["mini_swe_agent", "live_swe_agent"]:
+        return RepoEnv(env_args, logger=logger, backend=backend, scaffold=scaffold, step_timeout=60)
+    return RepoEnv(env_args, logger=logger, backend=backend, scaffold=scaffold)
+
+
+def grade_trajectory(
+    env: RepoEnv,
+    trajectory: Trajectory,
+    history,
+    ds,
+    exp_name: str,
+    max_reward_calc_time: int,
+    logger,
+) -> str:
+    """
+    Runs the tests of a finished rollout, closes its environment and returns the
+    trajectory json with the reward filled in.
+    """
+    # also get the gt outputs
+    reward_calc_time = time.time()
+    try:
+        reward, test_output = env.runtime._calculate_reward(get_test_output=True, timeout=max_reward_calc_time)
+    finally:
+        reward_calc_time = time.time() - reward_calc_time
+        # Close the environment and runtime
+        env.close()
+
+    # update the trajectory object
+    trajectory.reward = reward
+    trajectory.test_output = test_output
+    trajectory.ds = ds
+    trajectory.exp_name = exp_name
+    trajectory.reward_calc_time = reward_calc_time # time taken to calculate reward
+    trajectory.history = history
+    
+    logger.warning(f"time taken to calculate reward in seconds: {reward_calc_time:.2f}")
+
+    instance_meta = resolve_instance_metadata(ds)
+    instance_dir = Path("run_logs") / exp_name / instance_meta["instance_id"]
+    write_instance_artifacts(instance_dir, trajectory, instance_meta, logger)
+
+    logger.info(f"editagent completed for Docker image: {ds['docker_image']}")
+    # close env and docker runtime
+    logger.info(f"Closing environment for Docker image: {ds['docker_image']}")
+    return trajectory.model_dump_json()
+
+
 def runagent(
     ds,
     exp_name: Optional[str] = None,
@@ -364,6 +447,8 @@ def runagent(
     scaffold: str = "r2egym",
     max_tokens: int = 65536,
     root_mode: bool = True,
+    env: Optional[RepoEnv] = None,
+    grading_pool: Optional[concurrent.futures.Executor] = None,
 ) -> Optional[str]:
     """
     Runs the editagent agent on a specified Docker image.
@@ -373,6 +458,9 @@ def runagent(
         traj_dir: Directory to save trajectories.
         jsonl_file: Path to the JSONL file to save results. If not provided, generated using traj_dir and exp_name.
         exp_name: Experiment name. Used if jsonl_file is not provided. If not provided, a unique name is generated.
+        env: An environment already set up for `ds` (e.g. by an EnvPool); created here if not provided.
+        grading_pool: If provided, the reward is computed there and a future of the
+            trajectory json is returned as soon as the agent is done.
     """
     assert scaffold in ["r2egym", "sweagent", "openhands", "mini_swe_agent", "live_swe_agent"], (
         f"Scaffold is {scaffold}, must be one of [r2egym, sweagent, openhands, mini_swe_agent, live_swe_agent]"
@@ -381,40 +469,15 @@ def runagent(
     if exp_name is None:
         exp_name = datetime.now().strftime("%Y%m%d_%H%M%S")
 
-    instance_meta = resolve_instance_metadata(ds)
-    instance_dir = Path("run_logs") / exp_name / instance_meta["instance_id"]
-    instance_dir.mkdir(parents=True, exist_ok=True)
-
-    logger = setup_logging(
-        name=ds["docker_image"].replace("/", "_"),
-        log_file=str(instance_dir / "agent.log"),
-        console=True,
-        level=INFO,
-    )
+    logger = get_instance_logger(ds, exp_name)
     logger.info(f"Starting editagent on Docker image: {ds['docker_image']}")
     logger.info(f"Using LLM: {llm_name}")
     logger.info(f"Max Steps: {max_steps}")
 
-    # Initialize environment arguments
-    env_args = EnvArgs(ds=ds, root_mode=root_mode)
-
-    # Initialize the RepoEnv
-    if scaffold in ["mini_swe_agent", "live_swe_agent"]:
-        env = RepoEnv(env_args, logger=logger, backend=backend, scaffold=scaffold, step_timeout=60)
-    else:
-        env = RepoEnv(env_args, logger=logger, backend=backend, scaffold=scaffold)
+    if env is None:
+        env = make_env(ds, logger, backend=backend, scaffold=scaffold, root_mode=root_mode)
     # set agent args
-    if use_fn_calling:
-        assert scaffold != "sweagent", "SWEagent scaffold does not support fn calling"
-        assert scaffold not in ["mini_swe_agent", "live_swe_agent"], "mini_swe_agent/live_swe_agent scaffolds are non-fn-calling only"
-        agent_args = AgentArgs.from_yaml(
-            Path(f"./inference/agenthub/config/{scaffold}/edit_fn_calling.yaml")
-        )
-    else:
-        agent_args = AgentArgs.from_yaml(
-            Path(f"./inference/agenthub/config/{scaffold}/edit_non_fn_calling.yaml")
-        )
-    agent_args.llm_name = llm_name
+    agent_args = load_agent_args(scaffold, use_fn_calling, llm_name)
 
     # Initialize the agent
     agent = Agent(name="EditAgent", args=agent_args, logger=logger)
@@ -437,31 +500,95 @@ def runagent(
         logger.error(
             f"Error during agent run for Docker image {ds['docker_image']}: {e}"
         )
+        env.close()
         return None
 
-    # also get the gt outputs
-    reward_calc_time = time.time()
-    reward, test_output = env.runtime._calculate_reward(get_test_output=True, timeout=max_reward_calc_time)
-    reward_calc_time = time.time() - reward_calc_time
-    # Close the environment and runtime
-    env.close()
+    grade_args = (env, trajectory, history, ds, exp_name, max_reward_calc_time, logger)
+    if grading_pool is not None:
+        return grading_pool.submit(grade_trajectory, *grade_args)
+    return grade_trajectory(*grade_args)
 
-    # update the trajectory object
-    trajectory.reward = reward
-    trajectory.test_output = test_output
-    trajectory.ds = ds
-    trajectory.exp_name = exp_name
-    trajectory.reward_calc_time = reward_calc_time # time taken to calculate reward
-    trajectory.history = history
-    
-    logger.warning(f"time taken to calculate reward in seconds: {reward_calc_time:.2f}")
 
-    write_instance_artifacts(instance_dir, trajectory, instance_meta, logger)
+def runagent_worker(
+    task_queue,
+    result_queue,
+    env_pool_depth: int = 1,
+    grading_workers: int = 0,
+    **runagent_kwargs,
+) -> int:
+    """
+    Runs the editagent agent on dataset entries from `task_queue`, one at a time, while
+    an EnvPool prepares the environments of the next entries in the background.
 
-    logger.info(f"editagent completed for Docker image: {ds['docker_image']}")
-    # close env and docker runtime
-    logger.info(f"Closing environment for Docker image: {ds['docker_image']}")
-    return trajectory.model_dump_json()
+    With grading_workers > 0, finished rollouts are graded by a thread pool of that
+    size and the agent moves on to the next entry right away. At most
+    2 * grading_workers rollouts wait for or run their tests at a time, which bounds
+    the containers kept alive.
+
+    Puts (docker_image, trajectory json or None) on `result_queue` per entry, once it
+    is graded, and returns the number of entries handled.
+    """
+    exp_name = runagent_kwargs["exp_name"]
+    command_files = load_agent_args(
+        runagent_kwargs["scaffold"], runagent_kwargs["use_fn_calling"], runagent_kwargs["llm_name"]
+    ).command_files
+
+    def prepare_env(ds) -> RepoEnv:
+        env = make_env(
+            ds,
+            get_instance_logger(ds, exp_name),
+            backend=runagent_kwargs["backend"],
+            scaffold=runagent_kwargs["scaffold"],
+            root_mode=runagent_kwargs["root_mode"],
+        )
+        env.add_commands(command_files)
+        return env
+
+    grading_pool = None
+    grading_slots = None
+    if grading_workers > 0:
+        grading_pool = concurrent.futures.ThreadPoolExecutor(max_workers=grading_workers)
+        grading_slots = threading.BoundedSemaphore(2 * grading_workers)
+
+    def put_graded(future, docker_image):
+        grading_slots.release()
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error(f"Grading failed for Docker image {docker_image}: {e}")
+            result = None
+        result_queue.put((docker_image, result))
+
+    pool = EnvPool(task_queue, prepare_env, max_depth=env_pool_depth, logger=logger)
+    num_done = 0
+    try:
+        for ds_entry, env, error in pool:
+            docker_image = ds_entry["docker_image"]
+            result = None
+            if env is not None:
+                start_time = time.time()
+                if grading_slots is not None:
+                    grading_slots.acquire()
+                try:
+                    result = runagent(ds=ds_entry, env=env, grading_pool=grading_pool, **runagent_kwargs)
+                except Exception as e:
+                    logger.error(f"Exception for Docker image {docker_image}: {e}")
+                pool.record_run(time.time() - start_time)
+                if isinstance(result, concurrent.futures.Future):
+                    result.add_done_callback(
+                        lambda future, docker_image=docker_image: put_graded(future, docker_image)
+                    )
+                    num_done += 1
+                    continue
+                if grading_slots is not None:
+                    grading_slots.release()
+            result_queue.put((docker_image, result))
+            num_done += 1
+    finally:
+        pool.close()
+        if grading_pool is not None:
+            grading_pool.shutdown(wait=True)
+    return num_done
 
 
 def runagent_multiple(
@@ -487,6 +614,8 @@ def runagent_multiple(
     prepull_images: bool = False,
     max_tokens: int = 65536,
     root_mode: bool = True,
+    env_pool_depth: int = 0,
+    grading_workers: int = 0,
 ):
     """
     Runs the editagent agent on the first k Docker images.
@@ -499,6 +628,11 @@ def runagent_multiple(
         max_steps: Maximum steps for the agent run.
         max_workers: Maximum number of threads to use.
         prepull_images: Whether to prepull Docker images in parallel before starting execution.
+        env_pool_depth: If > 0, each worker prepares up to this many environments ahead of
+            its agent (see EnvPool), so container setup overlaps with the LLM calls.
+        grading_workers: If > 0, each worker runs the tests of finished rollouts in a
+            thread pool of this size and starts its next instance meanwhile. Implies
+            the worker mode of env_pool_depth, with a depth of at least 1.
     """
     # Allow mini_swe_agent/live_swe_agent as scaffolds
     assert scaffold in ["r2egym", "sweagent", "openhands", "mini_swe_agent", "live_swe_agent"], (
@@ -582,45 +716,87 @@ def runagent_multiple(
         prepull_docker_images(ds_selected, max_workers=max_workers)
         logger.info("Docker image prepull completed.")
 
-    # with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all tasks to the executor using keyword arguments
-        future_to_image = {
-            executor.submit(
-                runagent,
-                ds=ds_entry,
-                exp_name=exp_name,
-                max_steps=max_steps,
-                num_restarts=num_restarts,
-                max_steps_absolute=max_steps_absolute,
-                llm_name=llm_name,
-                temperature=temperature,
-                use_fn_calling=use_fn_calling,
-                backend=backend,
-                max_reward_calc_time=max_reward_calc_time,
-                max_iterations=max_iterations,
-                scaffold=scaffold,
-                max_tokens=max_tokens,
-                root_mode=root_mode,
-            ): ds_entry[
-                "docker_image"
-            ]  # <-- store the docker_image from ds_entry here
-            for ds_entry in ds_selected
-        }
+    runagent_kwargs = dict(
+        exp_name=exp_name,
+        max_steps=max_steps,
+        num_restarts=num_restarts,
+        max_steps_absolute=max_steps_absolute,
+        llm_name=llm_name,
+        temperature=temperature,
+        use_fn_calling=use_fn_calling,
+        backend=backend,
+        max_reward_calc_time=max_reward_calc_time,
+        max_iterations=max_iterations,
+        scaffold=scaffold,
+        max_tokens=max_tokens,
+        root_mode=root_mode,
+    )
+    if (env_pool_depth > 0 or grading_workers > 0) and ds_selected:
+        num_workers = min(max_workers or os.cpu_count() or 1, len(ds_selected))
+        with multiprocessing.Manager() as manager:
+            task_queue = manager.Queue()
+            result_queue = manager.Queue()
+            for ds_entry in ds_selected:
+                task_queue.put(ds_entry)
+            with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+                futures = [
+                    executor.submit(
+                        runagent_worker,
+                        task_queue,
+                        result_queue,
+                        env_pool_depth=max(env_pool_depth, 1),
+                        grading_workers=grading_workers,
+                        **runagent_kwargs,
+                    )
+                    for _ in range(num_workers)
+                ]
+                with open(jsonl_file, "a") as f:
+                    while True:
+                        try:
+                            docker_image, result = result_queue.get(timeout=5)
+                        except queue.Empty:
+                            if all(future.done() for future in futures) and result_queue.empty():
+                                break
+                            continue
+                        if result is not None:
+                            with file_lock:
+                                f.write(result + "\n")
+                                f.flush()
+                        else:
+                            logger.error(f"No trajectory for Docker image {docker_image}")
+                for future in futures:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.error(f"Exception in agent worker: {e}")
+    else:
+        # with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # Submit all tasks to the executor using keyword arguments
+            future_to_image = {
+                executor.submit(
+                    runagent,
+                    ds=ds_entry,
+                    **runagent_kwargs,
+                ): ds_entry[
+                    "docker_image"
+                ]  # <-- store the docker_image from ds_entry here
+                for ds_entry in ds_selected
+            }
 
-        with open(jsonl_file, "a") as f:
-            for future in concurrent.futures.as_completed(future_to_image):
-                docker_image = future_to_image[
-                    future
-                ]  # <-- retrieve that stored docker_image
-                try:
-                    result = future.result()
-                    if result is not None:
-                        with file_lock:
-                            f.write(result + "\n")
-                except Exception as e:
-                    # Use docker_image from above when logging
-                    logger.error(f"Exception for Docker image {docker_image}: {e}")
+            with open(jsonl_file, "a") as f:
+                for future in concurrent.futures.as_completed(future_to_image):
+                    docker_image = future_to_image[
+                        future
+                    ]  # <-- retrieve that stored docker_image
+                    try:
+                        result = future.result()
+                        if result is not None:
+                            with file_lock:
+                                f.write(result + "\n")
+                    except Exception as e:
+                        # Use docker_image from above when logging
+                        logger.error(f"Exception for Docker image {docker_image}: {e}")
 
     # Produce auxiliary history-only files for finetuning/rejection sampling.
     postprocess_trajectories_history_only(exp_name, traj_dir_path, logger)
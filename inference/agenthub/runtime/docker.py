@@ -26,6 +26,8 @@ import tarfile
 import io
 import os
 from inference.agenthub.utils.log import get_logger
+from inference.agenthub.runtime.shell_session import ShellSession, ShellSessionError
+from inference.agenthub.runtime.tool_bundle import build_tool_bundle
 import re
 from inference.agenthub.utils.utils import match_dockerimage_to_repo
 from inference.agenthub import SUPPORTED_REPOS, SKIP_FILES, SKIP_FILES_NEW, CMD_TIMEOUT
@@ -95,6 +97,7 @@ class DockerRuntime(ExecutionEnvironment):
         root_mode: bool = True,
         tool_repo_path: str | None = None,
         scaffold: str | None = None,
+        shell_session: bool | None = None,  # run commands in one persistent shell (docker backend only)
         **docker_kwargs,
     ):
         # check if ds is provided (required for all dockers moving forward)
@@ -144,6 +147,10 @@ class DockerRuntime(ExecutionEnvironment):
             self.commit = ParsedCommit(**json.loads(self.commit_json))
         self.scaffold = scaffold
         self.docker_kwargs = docker_kwargs
+        if shell_session is None:
+            shell_session = os.getenv("AGENTHUB_SHELL_SESSION", "").lower() in ("1", "true", "yes")
+        self.use_shell_session = shell_session and backend == "docker"
+        self.shell_session = None
         if logger is None:
             if self.backend == "docker":
                 logger_name = "DockerRuntime"
@@ -458,6 +465,7 @@ class DockerRuntime(ExecutionEnvironment):
                 raise e  # Re-raise unexpected errors
 
     def stop_container(self):
+        self._close_shell_session()
         try:
             if self.container:
                 if self.backend == "docker":
@@ -489,7 +497,7 @@ class DockerRuntime(ExecutionEnvironment):
                 "printf 'testbed/\n.venv/\nvenv/\n__pycache__/\npytest_cache/\n*.egg-info\n' >> .git/info/exclude || true"
             )
             if not self.root_mode:
-                self.run("pip install -e /opt/tools")
+                self._install_tool_bundle()
             else:
                 eval_script_content = self.eval_script_content
                 
@@ -501,11 +509,7 @@ class DockerRuntime(ExecutionEnvironment):
                 # Copy the file to container and clean up
                 self.copy_to_container(temp_file_path, f"{self.alt_path}/run_tests.sh")
                 os.unlink(temp_file_path)  # Clean up the temporary file
-                repo_path = "https://github.com/gnohgnailoug/swe_tool.git"
-                self.run("pip install chardet")
-                self.run(f"git clone {repo_path} /opt/tools")
-                dest_path = shlex.quote("/opt/tools")
-                self.run(f"pip install -e {dest_path}")
+                self._install_tool_bundle()
                 # if self.tool_repo_path:
                 #     self._prepare_tool_repo()
 
@@ -634,6 +638,32 @@ class DockerRuntime(ExecutionEnvironment):
         except Exception as e:
             self.logger.error(f"Error setting up environment: {repr(e)}")
 
+    def _install_tool_bundle(self):
+        """
+        Install the local agent tools from a prebuilt archive: a marker check and at
+        most one put_archive, with no network access and no pip.
+        """
+        try:
+            bundle = build_tool_bundle()
+        except Exception as e:
+            # e.g. chardet missing on the host: fall back to the tool repo
+            self.logger.warning(f"Tool bundle unavailable, cloning the tool repo: {repr(e)}")
+            self.run("pip install chardet")
+            self.run("git clone https://github.com/gnohgnailoug/swe_tool.git /opt/tools")
+            self.run(f"pip install -e {shlex.quote('/opt/tools')}")
+            return
+        _, error_code = self.run(f"test -f {shlex.quote(bundle.marker)}")
+        if error_code == "0":
+            return
+        if self.backend == "docker":
+            self.container.put_archive("/", bundle.data)
+        else:
+            with tempfile.NamedTemporaryFile(suffix=".tar") as temp_file:
+                temp_file.write(bundle.data)
+                temp_file.flush()
+                self.copy_to_container(temp_file.name, "/tmp/agenthub_tools.tar")
+            self.run("tar -xf /tmp/agenthub_tools.tar -C / && rm -f /tmp/agenthub_tools.tar", workdir="/")
+
     def _prepare_tool_repo(self):
         tool_repo = self.tool_repo_path
         if not tool_repo:
@@ -744,6 +774,58 @@ class DockerRuntime(ExecutionEnvironment):
             self.logger.error(f"Unexpected error during Kubernetes exec: {repr(e)}")
             return f"Error: {repr(e)}", "-1"
 
+    def _exec_environment(self) -> dict | None:
+        environment = None
+        if not self.swefactory:
+            environment = {"PATH": DOCKER_PATH}
+        if self.scaffold in ["mini_swe_agent", "live_swe_agent"]:
+            quiet_env = {
+                "PAGER": "cat",
+                "MANPAGER": "cat",
+                "LESS": "-R",
+                "PIP_PROGRESS_BAR": "off",
+                "TQDM_DISABLE": "1",
+            }
+            environment = {**quiet_env, **(environment or {})}
+        return environment
+
+    def _get_shell_session(self) -> ShellSession | None:
+        """Return the persistent shell of the container, starting it if needed."""
+        if self.shell_session is None or self.shell_session.closed:
+            try:
+                self.shell_session = ShellSession(
+                    self.container, environment=self._exec_environment(), logger=self.logger
+                )
+            except Exception as e:
+                self.logger.warning(f"Shell session unavailable, using exec_run: {repr(e)}")
+                self.shell_session = None
+                self.use_shell_session = False
+        return self.shell_session
+
+    def _close_shell_session(self):
+        if getattr(self, "shell_session", None) is not None:
+            self.shell_session.close()
+            self.shell_session = None
+
+    def _run_shell_session(
+        self, session: ShellSession, real_cmd: str, timeout: int, workdir: str
+    ) -> tuple[str, str]:
+        output, error_code = session.run(real_cmd, workdir, timeout)
+
+        if error_code is None or error_code == 124:
+            self.logger.error(f"Internal Timeout: {timeout}s")
+            return f"The command took too long to execute (>{timeout}s)", "-1"
+
+        if error_code != 0:
+            self.logger.error(
+                f"Error: Exit code {error_code} \nError Message: {output}"
+            )
+            return output, f"Error: Exit code {error_code}"
+
+        # Remove ANSI escape codes and \r characters
+        output = re.sub(r"\x1b\[[0-9;]*m|\r", "", output)
+        return output, str(error_code)
+
     def run(
         self,
         code: str,
@@ -768,6 +850,18 @@ class DockerRuntime(ExecutionEnvironment):
         if self.backend == "kubernetes":
             return self._run_kubernetes(exec_code, timeout, args, workdir=exec_workdir)
 
+        if self.use_shell_session:
+            session = self._get_shell_session()
+            if session is not None:
+                try:
+                    return self._run_shell_session(session, real_cmd, timeout, exec_workdir)
+                except ShellSessionError as e:
+                    # the command may have run already, so it is not retried; the
+                    # next call starts a fresh shell
+                    self.logger.error(f"Shell session lost: {repr(e)}")
+                    self._close_shell_session()
+                    return f"Error: {repr(e)}", "-1"
+
         if self.scaffold in ["mini_swe_agent", "live_swe_agent"]:
             if use_timeout_wrapper:
                 exec_cmd = ["timeout", "-k", "5s", f"{timeout}s", "bash", "-lc", real_cmd]
@@ -778,17 +872,9 @@ class DockerRuntime(ExecutionEnvironment):
             exec_cmd = ["/bin/bash", "-lc", command]
         try:
             env_kwargs = {}
-            if not self.swefactory:
-                env_kwargs["environment"] = {"PATH": DOCKER_PATH}
-            if self.scaffold in ["mini_swe_agent", "live_swe_agent"]:
-                quiet_env = {
-                    "PAGER": "cat",
-                    "MANPAGER": "cat",
-                    "LESS": "-R",
-                    "PIP_PROGRESS_BAR": "off",
-                    "TQDM_DISABLE": "1",
-                }
-                env_kwargs["environment"] = {**quiet_env, **env_kwargs.get("environment", {})}
+            environment = self._exec_environment()
+            if environment is not None:
+                env_kwargs["environment"] = environment
             with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
                 # Notice we do NOT set tty=True here
                 future = executor.submit(
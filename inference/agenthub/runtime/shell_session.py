@@ -0,0 +1,178 @@
+import select
+import shlex
+import struct
+import threading
+import time
+import uuid
+
+# kills the process group of every job of the session shell; with `set -m` each
+# foreground job is its own group, led by a direct child of the shell
+KILL_JOBS_SCRIPT = (
+    'for d in /proc/[0-9]*; do '
+    's=$(cat "$d/stat" 2>/dev/null) || continue; '
+    's=${{s##*") "}}; set -- $s; '
+    '[ "$2" = {shell_pid} ] && [ "$3" = "${{d#/proc/}}" ] && kill -KILL -"$3"; '
+    'done'
+)
+# seconds to wait for the shell after its job was killed
+KILL_GRACE = 5
+# seconds for the shell to start, including the login profile
+START_TIMEOUT = 60
+
+
+class ShellSessionError(RuntimeError):
+    pass
+
+
+class ShellSessionExited(ShellSessionError):
+    pass
+
+
+class ShellSession:
+    """
+    One long-lived bash process in a docker container, driven over the hijacked
+    socket of a single exec.
+
+    Each command is sent to the shell's stdin and followed by a sentinel line that
+    carries its exit code, so a step costs one write and the reads of its output:
+    no exec create/start round trip, no login shell startup and no thread. The
+    shell keeps its state between commands: exported variables, functions and
+    activated virtualenvs. The shell runs with job control (`set -m`), so every
+    command is a process group of its own, and a timeout kills that group while
+    the shell survives.
+    """
+
+    def __init__(self, container, environment: dict | None = None, logger=None):
+        self.container = container
+        self.api = container.client.api
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.token = uuid.uuid4().hex
+        self.buffer = b""  # demultiplexed output not consumed yet
+        self.pending = b""  # raw bytes of an incomplete frame
+        # `read` keeps the shell (and its login profile) silent until exec_start has
+        # returned, so no output is lost in the HTTP response buffer
+        self.exec_id = self.api.exec_create(
+            container.id,
+            ["/bin/sh", "-c", "read -r _ && exec /bin/bash --login -s"],
+            stdin=True,
+            stdout=True,
+            stderr=True,
+            tty=False,
+            environment=environment,
+        )["Id"]
+        self.socket = self.api.exec_start(self.exec_id, socket=True)
+        self.raw = getattr(self.socket, "_sock", self.socket)
+        self.closed = False
+        self._send(f"start\nset -m\nexec 2>&1\nprintf '%s %s\\n' {self.token}_ready $$\n")
+        self._read_until(f"{self.token}_ready ".encode(), time.time() + START_TIMEOUT)
+        self.shell_pid = self._read_until(b"\n", time.time() + START_TIMEOUT).decode().strip()
+
+    def _send(self, text: str) -> None:
+        try:
+            self.raw.sendall(text.encode())
+        except OSError as e:
+            self.close()
+            raise ShellSessionError(f"shell session is gone: {e!r}")
+
+    def _fill(self, deadline: float) -> bool:
+        """Read more output into the buffer; False if the deadline passed first."""
+        wait = deadline - time.time()
+        if wait <= 0 or not select.select([self.raw], [], [], wait)[0]:
+            return False
+        data = self.raw.recv(65536)
+        if not data:
+            self.close()
+            raise ShellSessionExited("shell session exited")
+        self.pending += data
+        # stdout/stderr frames: 1 byte stream, 3 bytes padding, 4 bytes big-endian size
+        while len(self.pending) >= 8:
+            size = struct.unpack(">I", self.pending[4:8])[0]
+            if len(self.pending) < 8 + size:
+                break
+            self.buffer += self.pending[8:8 + size]
+            self.pending = self.pending[8 + size:]
+        return True
+
+    def _read_until(self, marker: bytes, deadline: float) -> bytes | None:
+        """Consume and return the output before `marker`, or None at the deadline."""
+        start = 0
+        while True:
+            index = self.buffer.find(marker, start)
+            if index >= 0:
+                out = self.buffer[:index]
+                self.buffer = self.buffer[index + len(marker):]
+                return out
+            start = max(0, len(self.buffer) - len(marker))
+            if not self._fill(deadline):
+                return None
+
+    def _kill_jobs(self) -> None:
+        script = KILL_JOBS_SCRIPT.format(shell_pid=self.shell_pid)
+        self.container.exec_run(["/bin/sh", "-c", script])
+
+    def _exit_code(self, deadline: float) -> int | None:
+        """Exit code of the exited shell; docker may report it only once the exec is reaped."""
+        while True:
+            info = self.api.exec_inspect(self.exec_id)
+            if not info.get("Running") and info.get("ExitCode") is not None:
+                return info["ExitCode"]
+            if time.time() >= deadline:
+                return None
+            time.sleep(0.1)
+
+    def run(self, command: str, workdir: str, timeout: float) -> tuple[str, int | None]:
+        """
+        Run `command` in `workdir`, with stdin from /dev/null and stderr merged into
+        stdout.
+
+        Returns:
+            (output, exit code), with exit code None if the command timed out
+        """
+        with self.lock:
+            if self.closed:
+                raise ShellSessionError("shell session is closed")
+            marker = f"\n{self.token}_done "
+            self.buffer = b""
+            self._send(
+                f"cd {shlex.quote(workdir)} && eval {shlex.quote(command)} < /dev/null\n"
+                f"printf '\\n%s %s\\n' {self.token}_done \"$?\"\n"
+            )
+            try:
+                output = self._read_until(marker.encode(), time.time() + timeout)
+                timed_out = output is None
+                if timed_out:
+                    # kill the running job, and the later ones of a command list
+                    deadline = time.time() + KILL_GRACE
+                    while output is None and time.time() < deadline:
+                        self._kill_jobs()
+                        output = self._read_until(marker.encode(), time.time() + 0.5)
+                    if output is None:
+                        # the shell itself is stuck: drop it, the caller starts a new one
+                        text = self.buffer.decode("utf-8", errors="replace")
+                        self.close()
+                        return text, None
+                exit_code = self._read_until(b"\n", time.time() + KILL_GRACE)
+            except ShellSessionExited:
+                # the command ended the shell, e.g. with `exit`
+                exit_code = self._exit_code(time.time() + KILL_GRACE)
+                if exit_code is None:
+                    # None would read as a timeout to the caller
+                    raise ShellSessionError("shell session exited without an exit code")
+                return self.buffer.decode("utf-8", errors="replace"), exit_code
+            if exit_code is None:
+                self.close()
+                raise ShellSessionError("shell session stopped responding")
+            text = output.decode("utf-8", errors="replace")
+            if timed_out:
+                return text, None
+            return text, int(exit_code)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.socket.close()
+        except OSError:
+            pass
@@ -0,0 +1,98 @@
+import hashlib
+import importlib.util
+import io
+import tarfile
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+# the command scripts of the agents
+TOOLS_DIR = Path(__file__).resolve().parent.parent / "tools"
+# where the bundle is unpacked in the container; the commands go to /usr/local/bin
+BUNDLE_DIR = "/opt/agenthub_tools"
+BIN_DIR = "/usr/local/bin"
+# pure python packages the tools import, shipped in the bundle instead of pip installed
+VENDORED_PACKAGES = ["chardet"]
+
+# runs a tool with whichever python the image puts first on PATH
+WRAPPER_SCRIPT = """#!/bin/sh
+PY=$(command -v python || command -v python3)
+PYTHONPATH={lib}${{PYTHONPATH:+:$PYTHONPATH}} exec "$PY" {script} "$@"
+"""
+
+
+@dataclass(frozen=True)
+class ToolBundle:
+    data: bytes  # tar archive, to be extracted at /
+    digest: str
+
+    @property
+    def marker(self) -> str:
+        """File that exists in a container once this exact bundle is installed."""
+        return f"{BUNDLE_DIR}/.bundle-{self.digest}"
+
+
+def _add_file(tar: tarfile.TarFile, name: str, data: bytes, mode: int = 0o444) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = mode
+    # fixed metadata, so the archive (and its digest) only depends on the contents
+    info.mtime = 0
+    info.uname = info.gname = "root"
+    tar.addfile(info, io.BytesIO(data))
+
+
+def _package_files(name: str) -> list[tuple[str, Path]]:
+    spec = importlib.util.find_spec(name)
+    if spec is None or not spec.submodule_search_locations:
+        return []
+    root = Path(list(spec.submodule_search_locations)[0])
+    return [
+        (f"{name}/{path.relative_to(root).as_posix()}", path)
+        for path in sorted(root.rglob("*.py"))
+    ]
+
+
+@lru_cache(maxsize=None)
+def build_tool_bundle(tools_dir: Path = TOOLS_DIR) -> ToolBundle:
+    """
+    Pack the local tool scripts into a read-only tar archive, built once per process.
+
+    The archive holds the scripts under BUNDLE_DIR/tools, the vendored packages under
+    BUNDLE_DIR/lib, one wrapper per top-level script in BIN_DIR (named after the
+    script without .py, as the agents call them) and a marker file named after the
+    digest of all of that.
+    """
+    files = [
+        (f"tools/{path.relative_to(tools_dir).as_posix()}", path)
+        for path in sorted(tools_dir.rglob("*.py"))
+        if "__pycache__" not in path.parts
+    ]
+    for package in VENDORED_PACKAGES:
+        package_files = _package_files(package)
+        if not package_files:
+            raise FileNotFoundError(f"Package {package} is needed by the tool bundle but not installed")
+        files.extend((f"lib/{name}", path) for name, path in package_files)
+
+    contents = [(name, path.read_bytes()) for name, path in files]
+    commands = [
+        path.stem for path in sorted(tools_dir.glob("*.py")) if path.name != "__init__.py"
+    ]
+    digest = hashlib.sha256()
+    for name, data in contents:
+        digest.update(name.encode() + b"\0" + hashlib.sha256(data).digest())
+    digest.update("\0".join(commands).encode())
+    bundle_digest = digest.hexdigest()[:16]
+
+    prefix = BUNDLE_DIR.lstrip("/")
+    tar_stream = io.BytesIO()
+    with tarfile.open(fileobj=tar_stream, mode="w") as tar:
+        for name, data in contents:
+            _add_file(tar, f"{prefix}/{name}", data)
+        for command in commands:
+            wrapper = WRAPPER_SCRIPT.format(
+                lib=f"{BUNDLE_DIR}/lib", script=f"{BUNDLE_DIR}/tools/{command}.py"
+            )
+            _add_file(tar, f"{BIN_DIR.lstrip('/')}/{command}", wrapper.encode(), mode=0o755)
+        _add_file(tar, f"{prefix}/.bundle-{bundle_digest}", b"")
+    return ToolBundle(data=tar_stream.getvalue(), digest=bundle_digest)